@@ -0,0 +1,125 @@
+"""
+This python file contains the per-area covid series used for the
+incremental updates. Only the new or revised rows returned by an
+update are merged into a copy of the series held so far, and the
+derived 7-day sum is adjusted by the difference instead of being
+recomputed. The copy is then published, so a snapshot of the state
+store never sees the series it holds change.
+"""
+
+from datetime import date, timedelta
+from typing import Optional
+
+# The metric summed over the 7-day window, and the number of
+# latest rows skipped as `yesterday's` count is incomplete.
+SUMMED_METRIC = 'newCasesBySpecimenDate'
+WINDOW_DAYS = 7
+SKIPPED_DAYS = 1
+
+
+class AreaSeries:
+    """
+    This class holds the daily rows of one area, oldest first, and
+    the sum of SUMMED_METRIC over the 7-day window: the 7 calendar days
+    before the latest one reporting it, as rolling_metrics counts them.
+    A series published in the state store is never merged into, the
+    updates go through merged() which returns a new series.
+    """
+
+    def __init__(self) -> None:
+        self._rows: list[dict] = []
+        # The position of every date in _rows
+        self._index: dict[str, int] = {}
+        self.seven_day_sum = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    @property
+    def latest_date(self) -> Optional[str]:
+        """The latest (ISO) date held, None while the series is empty."""
+        return self._rows[-1]['date'] if self._rows else None
+
+    def copy(self) -> 'AreaSeries':
+        """Returns a copy of the series, sharing the (unchanged) rows."""
+        series = AreaSeries()
+        series._rows = list(self._rows)
+        series._index = dict(self._index)
+        series.seven_day_sum = self.seven_day_sum
+        return series
+
+    def merged(self, rows: list[dict]) -> tuple['AreaSeries', list[str]]:
+        """
+        This method returns the series with the given rows merged into
+        a copy of it, and the dates that changed. When none changed, the
+        series itself is returned.
+        """
+        series = self.copy()
+        changed = series.merge(rows)
+        return (series if changed else self), changed
+
+    def merge(self, rows: list[dict]) -> list[str]:
+        """
+        This method merges the given rows into the series, keeping
+        only the ones that are new or differ from the held row, and
+        returns the dates that changed. It is only used on a series
+        which is not published yet.
+        """
+        window_before = self._window_rows()
+        changed = []
+        backfilled = False
+        # Oldest first, so new days are appended in order.
+        for row in sorted(rows, key=lambda row: row['date']):
+            position = self._index.get(row['date'])
+            if position is None:
+                if self._rows and row['date'] < self._rows[-1]['date']:
+                    backfilled = True
+                self._index[row['date']] = len(self._rows)
+                self._rows.append(row)
+            elif self._rows[position] != row:
+                # A revised row replaces the held one.
+                self._rows[position] = row
+            else:
+                continue
+            changed.append(row['date'])
+        if backfilled:
+            # Rows older than the latest one arrived, restore the order.
+            self._rows.sort(key=lambda row: row['date'])
+            self._index = {row['date']: i for i, row in enumerate(self._rows)}
+        if changed:
+            self._update_window_sum(window_before)
+        return changed
+
+    def payload(self) -> dict:
+        """Returns the series in the (latest first) format of the API."""
+        return {'data': self._rows[::-1], 'length': len(self._rows)}
+
+    def _window_rows(self) -> dict[str, dict]:
+        """Returns the rows of the 7-day window, keyed by date."""
+        # The latest day reporting the metric, only the few latest rows
+        # are looked at as the newest days are the ones not reported yet.
+        latest = next((row['date'] for row in reversed(self._rows)
+                       if row.get(SUMMED_METRIC) is not None), None)
+        if latest is None:
+            return {}
+        last_day = date.fromisoformat(latest) - timedelta(days=SKIPPED_DAYS)
+        window = {}
+        for day in range(WINDOW_DAYS):
+            iso_date = (last_day - timedelta(days=day)).isoformat()
+            position = self._index.get(iso_date)
+            if position is not None:
+                window[iso_date] = self._rows[position]
+        return window
+
+    def _update_window_sum(self, window_before: dict[str, dict]) -> None:
+        """
+        Adjusts the 7-day sum by the rows which left or entered
+        the window, or were revised within it.
+        """
+        window_after = self._window_rows()
+        for date, row in window_before.items():
+            if window_after.get(date) is not row:
+                self.seven_day_sum -= row.get(SUMMED_METRIC) or 0
+        for date, row in window_after.items():
+            if window_before.get(date) is not row:
+                self.seven_day_sum += row.get(SUMMED_METRIC) or 0
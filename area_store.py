@@ -0,0 +1,242 @@
+"""
+This python file contains the local store of the covid data of every
+area, filled from the daily CSV dumps (one per areaType, plain or
+gzipped). The files are streamed in batches of rows, so the memory
+used does not grow with their size, and the rows are upserted into a
+SQLite file keyed by (areaCode, date). A file whose content hash is
+unchanged since it was last ingested is skipped.
+"""
+
+import os
+import csv
+import gzip
+import time
+import hashlib
+import sqlite3
+import logging
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+
+STORE_FILE = "dashboard_areas.sqlite3"
+
+# The columns of the CSV dumps (and of the API), the metrics
+# missing from a dump are stored as NULL.
+KEY_COLUMNS = ('areaCode', 'date')
+TEXT_COLUMNS = ('areaName', 'areaType')
+METRIC_COLUMNS = ('cumDailyNsoDeathsByDeathDate', 'hospitalCases', 'newCasesBySpecimenDate')
+COLUMNS = KEY_COLUMNS + TEXT_COLUMNS + METRIC_COLUMNS
+
+# The rows upserted per statement, this bounds the memory used.
+BATCH_ROWS = 10000
+# The area codes looked up per statement (SQLite bounds the parameters).
+CODES_PER_QUERY = 500
+HASH_CHUNK_BYTES = 1024 * 1024
+
+_UPSERT = ('INSERT INTO area_rows (%s) VALUES (%s) ON CONFLICT (areaCode, date) DO UPDATE SET %s'
+           % (', '.join(COLUMNS), ', '.join('?' * len(COLUMNS)),
+              ', '.join('%s = excluded.%s' % (column, column)
+                        for column in TEXT_COLUMNS + METRIC_COLUMNS)))
+
+
+def file_hash(path: str) -> str:
+    """Returns the SHA-256 of the file's content, read in chunks."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_BYTES), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _metric(value: str) -> Optional[int]:
+    """Returns the metric of a CSV cell, None when it is empty."""
+    return int(value) if value else None
+
+
+def read_rows(path: str) -> Iterator[tuple]:
+    """
+    This function streams the rows of a CSV dump (gzipped when the name
+    ends in .gz) as tuples in the order of COLUMNS. The cells missing
+    from a short (truncated) row are read as empty, and the rows left
+    without their key (areaCode and date) are skipped.
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8', newline='') as file:
+        reader = csv.reader(file)
+        header = next(reader, None)
+        if header is None:
+            return
+        positions = {name: index for index, name in enumerate(header)}
+        missing = [name for name in KEY_COLUMNS if name not in positions]
+        if missing:
+            raise ValueError('%s has no %s column' % (path, ', '.join(missing)))
+        keys = [positions[name] for name in KEY_COLUMNS]
+        text = [positions.get(name) for name in KEY_COLUMNS + TEXT_COLUMNS]
+        metrics = [positions.get(name) for name in METRIC_COLUMNS]
+        padding = [''] * len(header)
+        skipped = 0
+        for row in reader:
+            if not row:
+                continue
+            if len(row) < len(header):
+                row = row + padding[len(row):]
+            if not all(row[index] for index in keys):
+                skipped += 1
+                continue
+            yield (tuple(row[index] if index is not None else None for index in text) +
+                   tuple(_metric(row[index]) if index is not None else None
+                         for index in metrics))
+        if skipped:
+            logging.warning('Skipped %d rows without an areaCode or date in %s', skipped, path)
+
+
+class AreaStore:
+    """
+    This class holds the SQLite store of the area rows, indexed by
+    (areaCode, date), by area type and date, and by area name.
+    """
+
+    def __init__(self, path: str = STORE_FILE) -> None:
+        self.path = path
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute(
+                    'CREATE TABLE IF NOT EXISTS area_rows (areaCode TEXT NOT NULL, '
+                    'date TEXT NOT NULL, areaName TEXT, areaType TEXT, '
+                    'cumDailyNsoDeathsByDeathDate INTEGER, hospitalCases INTEGER, '
+                    'newCasesBySpecimenDate INTEGER, PRIMARY KEY (areaCode, date)) WITHOUT ROWID')
+                connection.execute('CREATE INDEX IF NOT EXISTS area_rows_type_date '
+                                   'ON area_rows (areaType, date)')
+                connection.execute('CREATE INDEX IF NOT EXISTS area_rows_name '
+                                   'ON area_rows (areaName, areaType, date)')
+                connection.execute('CREATE TABLE IF NOT EXISTS ingested_files (path TEXT '
+                                   'PRIMARY KEY, sha256 TEXT NOT NULL, rows INTEGER NOT NULL, '
+                                   'ingested REAL NOT NULL)')
+        finally:
+            connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute('PRAGMA journal_mode=WAL')
+        # With WAL, a crash may lose the last transaction but never corrupts
+        # the file, and the dumps can be ingested again.
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def ingest_file(self, path: str, areas: Optional[set] = None) -> Optional[int]:
+        """
+        This method upserts the rows of the CSV dump, in one transaction,
+        and returns their number, or None when the file is unchanged since
+        it was last ingested. The (areaType, areaCode) of the areas the
+        rows belong to are added to `areas`, once they are committed.
+        """
+        content_hash = file_hash(path)
+        key = os.path.abspath(path)
+        connection = self._connect()
+        try:
+            row = connection.execute('SELECT sha256 FROM ingested_files WHERE path = ?',
+                                     (key,)).fetchone()
+            if row is not None and row[0] == content_hash:
+                return None
+            rows = 0
+            file_areas = set()
+            with connection:
+                stream = read_rows(path)
+                while True:
+                    batch = list(islice(stream, BATCH_ROWS))
+                    if not batch:
+                        break
+                    connection.executemany(_UPSERT, batch)
+                    # The rows are (areaCode, date, areaName, areaType, ...)
+                    file_areas.update((row[3], row[0]) for row in batch)
+                    rows += len(batch)
+                connection.execute('INSERT OR REPLACE INTO ingested_files VALUES (?, ?, ?, ?)',
+                                   (key, content_hash, rows, time.time()))
+            if areas is not None:
+                areas.update(file_areas)
+            return rows
+        finally:
+            connection.close()
+
+    def ingest_directory(self, directory: str, areas: Optional[set] = None) -> dict:
+        """
+        This method ingests every CSV dump (*.csv and *.csv.gz) of the
+        directory, and returns the number of files ingested, skipped and
+        failed, and of rows upserted. A failed file is logged and skipped.
+        The areas of the ingested rows are added to `areas` (see ingest_file).
+        """
+        summary = {'ingested': 0, 'skipped': 0, 'failed': 0, 'rows': 0}
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith(('.csv', '.csv.gz')):
+                continue
+            try:
+                rows = self.ingest_file(os.path.join(directory, name), areas)
+            except (OSError, ValueError, csv.Error, sqlite3.Error):
+                logging.exception('Could not ingest the CSV dump %s', name)
+                summary['failed'] += 1
+                continue
+            if rows is None:
+                summary['skipped'] += 1
+            else:
+                summary['ingested'] += 1
+                summary['rows'] += rows
+        return summary
+
+    def series(self, location: str, location_type: str) -> Optional[dict]:
+        """
+        Returns the rows of the area, latest first, in the format of the
+        API payloads, or None when the area is not in the store.
+        """
+        connection = self._connect()
+        try:
+            connection.row_factory = sqlite3.Row
+            rows = connection.execute(
+                'SELECT %s FROM area_rows WHERE areaName = ? AND areaType = ? '
+                'ORDER BY date DESC' % ', '.join(COLUMNS), (location, location_type)).fetchall()
+        finally:
+            connection.close()
+        if not rows:
+            return None
+        return {'data': [dict(row) for row in rows], 'length': len(rows)}
+
+    def row_batches(self, location_type: str,
+                    codes: Optional[Iterable[str]] = None) -> Iterator[list[dict]]:
+        """
+        This method streams the rows of every area of the given type (or
+        only of the given area codes), in batches of BATCH_ROWS rows in the
+        format of the API payloads, such as to feed them to the rollups
+        after an ingest.
+        """
+        select = 'SELECT %s FROM area_rows WHERE areaType = ?' % ', '.join(COLUMNS)
+        if codes is None:
+            queries = [(select, (location_type,))]
+        else:
+            # The codes are looked up a block at a time, within the
+            # bound parameters allowed per statement.
+            codes = sorted(codes)
+            queries = [(select + ' AND areaCode IN (%s)' % ', '.join('?' * len(block)),
+                        (location_type, *block))
+                       for block in (codes[start:start + CODES_PER_QUERY]
+                                     for start in range(0, len(codes), CODES_PER_QUERY))]
+        connection = self._connect()
+        try:
+            connection.row_factory = sqlite3.Row
+            for query, params in queries:
+                cursor = connection.execute(query, params)
+                while True:
+                    batch = cursor.fetchmany(BATCH_ROWS)
+                    if not batch:
+                        break
+                    yield [dict(row) for row in batch]
+        finally:
+            connection.close()
+
+    def areas(self, location_type: str) -> list:
+        """Returns the names of the areas of the given type, sorted."""
+        connection = self._connect()
+        try:
+            return [name for name, in connection.execute(
+                'SELECT DISTINCT areaName FROM area_rows WHERE areaType = ? ORDER BY areaName',
+                (location_type,))]
+        finally:
+            connection.close()
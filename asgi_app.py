@@ -0,0 +1,109 @@
+"""
+This file contains the asynchronous (ASGI) serving mode of the
+dashboard. The dashboard page is served from its snapshot on the event
+loop, the other routes run the Flask application on a thread pool, and
+the data is refreshed with non-blocking upstream requests, so one
+process holds many concurrent clients while refreshes are in flight.
+Serve it with uvicorn:
+
+    uvicorn asgi_app:app
+    python asgi_app.py [--host 127.0.0.1] [--port 5000]
+"""
+
+import os
+import asyncio
+import argparse
+import uvicorn
+from uvicorn.middleware.wsgi import WSGIMiddleware
+from async_upstream import close_clients, refresh_periodically
+
+# The start up refresh is made on the event loop instead of the
+# scheduler worker (set before the dashboard is imported).
+os.environ.setdefault('DASHBOARD_SERVING', 'asgi')
+import main
+
+# The Flask application is created (reading the config) and the data
+# warmed up in the background as the ASGI application is imported.
+main.create_app()
+# The Flask routes (updates, deleted news, JSON APIs) run on the
+# threads of uvicorn's WSGI middleware.
+flask_app = WSGIMiddleware(main.app, workers=main.config_data.get('asgi_threads', 16))
+
+
+def etag_matches(if_none_match: bytes, etag: str) -> bool:
+    """Returns whether the If-None-Match header holds the (strong or weak) ETag."""
+    for tag in if_none_match.decode('latin-1').split(','):
+        tag = tag.strip()
+        if tag == '*' or tag.removeprefix('W/').strip('"') == etag:
+            return True
+    return False
+
+
+async def send_snapshot(scope: dict, send, snapshot) -> None:
+    """Sends the dashboard snapshot, or a 304 when the client already holds it."""
+    headers = [(b'etag', ('"%s"' % snapshot.etag).encode('latin-1')),
+               (b'cache-control', b'no-cache')]
+    if_none_match = dict(scope['headers']).get(b'if-none-match')
+    if if_none_match and etag_matches(if_none_match, snapshot.etag):
+        await send({'type': 'http.response.start', 'status': 304, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b''})
+        return
+    await send({'type': 'http.response.start', 'status': 200,
+                'headers': [(b'content-type', b'text/html; charset=utf-8')] + headers})
+    await send({'type': 'http.response.body', 'body': snapshot.html.encode('utf-8')})
+
+
+async def lifespan(receive, send) -> None:
+    """
+    Starts the refresh of the data (once, then every `refresh_interval`
+    seconds when set in the config) and stops it at shut down.
+    """
+    refresh = None
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            # The cached data is restored first, so it never replaces fresher data.
+            await asyncio.to_thread(main.warmed_up.wait, main.WARM_UP_TIMEOUT)
+            if main.config_data.get('refresh_on_start', True):
+                refresh = asyncio.create_task(refresh_periodically(
+                    main.config_data.get('refresh_interval'), main.REFRESH_CLAIM_SECONDS))
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            if refresh is not None:
+                refresh.cancel()
+            await close_clients()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope: dict, receive, send) -> None:
+    """
+    The ASGI application. A plain load of the dashboard whose snapshot is
+    current is answered on the event loop, every other request by Flask.
+    """
+    if scope['type'] == 'lifespan':
+        await lifespan(receive, send)
+        return
+    if scope['type'] != 'http':
+        return
+    if scope['method'] in ('GET', 'HEAD') and scope['path'] == '/index' \
+            and not scope['query_string']:
+        snapshot = main.dashboard_snapshots.peek(main.data_version())
+        if snapshot is not None:
+            await send_snapshot(scope, send, snapshot)
+            return
+    await flask_app(scope, receive, send)
+
+
+def run(host: str, port: int) -> None:
+    """Serves the application with uvicorn."""
+    uvicorn.run(app, host=host, port=port)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serves the dashboard asynchronously.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5000)
+    arguments = parser.parse_args()
+    main.app.debug = False
+    run(arguments.host, arguments.port)
@@ -0,0 +1,288 @@
+"""
+This python file contains the asyncio counterparts of news_API_request
+and covid_API_request, used by the asynchronous (ASGI) serving mode.
+The upstream requests are sent with a pooled httpx.AsyncClient, so the
+event loop keeps serving the dashboard while they are in flight, and
+they are retried on the same transient failures as the blocking ones.
+The fetched data is published through the same functions as the
+blocking requests (on a worker thread, as they write to the disk).
+"""
+
+import time
+import asyncio
+import logging
+from datetime import date, timedelta
+from typing import Awaitable, Callable, Hashable, Optional
+from urllib.parse import urlsplit
+import httpx
+from config_loader import load_config
+from covid_news_handling import DEFAULT_COVID_TERMS, NEWS_API_URL, publish_news
+from covid_data_handler import COVID_API_URL, COVID_API_STRUCTURE, DEFAULT_LOCATION
+from covid_data_handler import DEFAULT_LOCATION_TYPE, MAX_INCREMENTAL_DAYS, REVISION_DAYS
+from covid_data_handler import days_since, merge_area_series, publish_covid_data
+from covid_data_handler import CovidPages, covid_rate_limiter
+from fetch_pool import async_retry_with_backoff
+from metrics import tracked_fetch
+import global_vars
+
+
+class AsyncNewsClient:
+    """
+    This class retrieves the news from the NewsAPI like NewsClient does,
+    caching the responses per query string for `cache_ttl` seconds and
+    then revalidating them, but without blocking the event loop.
+    """
+
+    def __init__(self, api_key: str, http: httpx.AsyncClient, base_url: str = NEWS_API_URL,
+                 cache_ttl: float = 300) -> None:
+        self.api_key = api_key
+        self.http = http
+        self.base_url = base_url
+        self.cache_ttl = cache_ttl
+        # The cache entries are keyed by the query string, they are only
+        # used from the event loop so no lock is needed.
+        self._cache: dict[str, dict] = {}
+        self.cache_hits = 0
+        self.revalidated = 0
+
+    async def get(self, covid_terms: str) -> dict:
+        """
+        This method returns the news matching the search terms,
+        from the cache while it is fresh, otherwise from the API.
+        """
+        query = covid_terms.replace(' ', ' OR ')
+        cached = self._cache.get(query)
+        if cached and time.monotonic() - cached['fetched'] < self.cache_ttl:
+            self.cache_hits += 1
+            return cached['payload']
+
+        headers = {}
+        if cached and cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+        with tracked_fetch('news'):
+            response = await self.http.get(self.base_url, headers=headers,
+                                           params={'q': query, 'apiKey': self.api_key})
+            if response.status_code == 304 and cached:
+                self.revalidated += 1
+                payload = cached['payload']
+                # A 304 need not send the validators again, the cached
+                # ones are kept unless it does.
+                etag = response.headers.get('etag', cached['etag'])
+                last_modified = response.headers.get('last-modified', cached['last_modified'])
+            else:
+                response.raise_for_status()
+                payload = response.json()
+                etag = response.headers.get('etag')
+                last_modified = response.headers.get('last-modified')
+        self._cache[query] = {'payload': payload, 'fetched': time.monotonic(),
+                              'etag': etag, 'last_modified': last_modified}
+        return payload
+
+
+class AsyncCovidClient:
+    """
+    This class retrieves the covid data from the API's data endpoint,
+    page by page as the `Cov19API` library does, and returns it in the
+    same format as its get_json.
+    """
+
+    def __init__(self, http: httpx.AsyncClient, base_url: str = COVID_API_URL) -> None:
+        self.http = http
+        self.base_url = base_url
+        # The host the calls are rate limited by, with the blocking requests
+        self.host = urlsplit(base_url).netloc
+
+    async def get(self, filters: list[str], structure: dict) -> dict:
+        """This method returns every page of the data matching the filters."""
+        # The wait for a free slot of the host is made off the event loop.
+        await asyncio.to_thread(covid_rate_limiter.acquire, self.host)
+        pages = CovidPages(filters, structure)
+        while True:
+            response = await self.http.get(self.base_url, params=pages.params())
+            if not pages.add(response.status_code, response):
+                return pages.result()
+
+
+class AsyncSingleFlight:
+    """
+    This class shares one in-flight call between the concurrent callers
+    awaiting the same key, like single_flight.SingleFlight does for threads.
+    """
+
+    def __init__(self) -> None:
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, function: Callable[[], Awaitable]):
+        """Returns the result of `await function()` for the key, awaiting it only once."""
+        task = self._in_flight.get(key)
+        if task is None:
+            task = self._in_flight[key] = asyncio.ensure_future(function())
+            task.add_done_callback(lambda _: self._in_flight.pop(key, None))
+        else:
+            self.shared += 1
+        # A caller being cancelled does not cancel the call of the others.
+        return await asyncio.shield(task)
+
+
+upstream_calls = AsyncSingleFlight()
+
+# The clients of the serving event loop, created on first use.
+_http: Optional[httpx.AsyncClient] = None
+_news_client: Optional[AsyncNewsClient] = None
+_covid_client: Optional[AsyncCovidClient] = None
+
+
+def default_clients() -> tuple[AsyncNewsClient, AsyncCovidClient]:
+    """
+    This function returns the news and covid clients shared by the
+    event loop, over one pooled HTTP client, created on first use with
+    the API key and urls from the config.json.
+    """
+    global _http, _news_client, _covid_client
+    if _http is None:
+        config = load_config()
+        connections = config.get('upstream_connections', 8)
+        _http = httpx.AsyncClient(limits=httpx.Limits(max_connections=connections,
+                                                      max_keepalive_connections=connections),
+                                  timeout=config.get('upstream_timeout', 10))
+        _news_client = AsyncNewsClient(config['news_api_key'], _http,
+                                       config.get('news_api_url', NEWS_API_URL))
+        _covid_client = AsyncCovidClient(_http, config.get('covid_api_url', COVID_API_URL))
+    return _news_client, _covid_client
+
+
+async def close_clients() -> None:
+    """This function closes the pooled connections of the shared clients."""
+    global _http, _news_client, _covid_client
+    if _http is not None:
+        await _http.aclose()
+    _http = _news_client = _covid_client = None
+
+
+async def async_news_API_request(covid_terms: str = DEFAULT_COVID_TERMS,
+                                 client: Optional[AsyncNewsClient] = None,
+                                 retries: int = 3) -> dict:
+    """
+    This function returns the news data matching the search terms, as
+    news_API_request does, and publishes them for the web interface.
+    Concurrent identical requests share a single fetch, retried with
+    backoff on a transient failure.
+    """
+    if client is None:
+        client = default_clients()[0]
+
+    async def fetch() -> dict:
+        news = await async_retry_with_backoff(lambda: client.get(covid_terms), retries=retries)
+        # Deduplicating and caching the news takes a while, off the loop.
+        return await asyncio.to_thread(publish_news, news)
+    return await upstream_calls.do(('news', covid_terms, client), fetch)
+
+
+async def async_covid_API_request(location: str = DEFAULT_LOCATION,
+                                  location_type: str = DEFAULT_LOCATION_TYPE,
+                                  client: Optional[AsyncCovidClient] = None,
+                                  incremental: bool = False, retries: int = 3) -> dict:
+    """
+    This function returns the covid data of the area, as
+    covid_API_request does (incrementally when `incremental` is set),
+    and publishes it for the web interface.
+    Concurrent identical requests share a single fetch, and the requests
+    failing with a transient error are retried with backoff.
+    """
+    if client is None:
+        client = default_clients()[1]
+
+    async def fetch() -> dict:
+        filters = ['areaType='+location_type, 'areaName='+location]
+        series = global_vars.store.snapshot().area_series.get((location, location_type))
+        if incremental and series is not None and series.latest_date and \
+                days_since(series.latest_date) <= MAX_INCREMENTAL_DAYS:
+            rows = await async_request_recent_days(filters, series.latest_date, client,
+                                                   retries=retries)
+            series, changed = merge_area_series(location, location_type, rows)
+            data = series.payload()
+        else:
+            async def attempt() -> dict:
+                with tracked_fetch('covid'):
+                    return await client.get(filters, COVID_API_STRUCTURE)
+            data = await async_retry_with_backoff(attempt, retries=retries)
+            rows = data['data']
+            changed = merge_area_series(location, location_type, rows)[1]
+        return await asyncio.to_thread(publish_covid_data, location, location_type, data,
+                                       rows, changed or not incremental)
+    return await upstream_calls.do(('covid', location, location_type, incremental, client),
+                                   fetch)
+
+
+async def async_request_recent_days(filters: list[str], latest_date: str,
+                                    client: AsyncCovidClient,
+                                    revision_days: int = REVISION_DAYS,
+                                    max_concurrency: int = 4,
+                                    retries: int = 3) -> list[dict]:
+    """
+    This function requests, one date filter at a time and at most
+    `max_concurrency` at once, the rows from `revision_days` before the
+    latest held date up to today, as request_recent_days does. Each
+    date is retried with backoff on a transient failure.
+    """
+    first_day = date.fromisoformat(latest_date) - timedelta(days=revision_days)
+    days = (date.today() - first_day).days + 1
+    dates = [(first_day + timedelta(days=day)).isoformat() for day in range(days)]
+    limit = asyncio.Semaphore(max_concurrency)
+
+    async def fetch(day: str) -> list[dict]:
+        async def attempt() -> list[dict]:
+            # The slot is released while waiting for a retry.
+            async with limit:
+                with tracked_fetch('covid'):
+                    return (await client.get(filters + ['date='+day],
+                                             COVID_API_STRUCTURE))['data']
+        return await async_retry_with_backoff(attempt, retries=retries)
+
+    results = await asyncio.gather(*(fetch(day) for day in dates), return_exceptions=True)
+    rows = []
+    for day, result in zip(dates, results):
+        if isinstance(result, BaseException):
+            logging.warning('Could not retrieve the covid data of %s: %s', day, result)
+        else:
+            rows.extend(result)
+    return rows
+
+
+async def refresh_data_async(claim_seconds: float) -> None:
+    """
+    This function retrieves the latest News and Covid data concurrently,
+    as refresh_data_from_apis does. A failure of one does not prevent
+    the other, both are logged. With a shared state file, only the
+    worker process holding the claim (for `claim_seconds`) fetches.
+    """
+    async def refresh(name: str, request: Callable[[], Awaitable], message: str) -> None:
+        try:
+            # The claim may wait on the shared state file, off the loop.
+            if await asyncio.to_thread(global_vars.store.claim, name, claim_seconds):
+                await request()
+        except Exception:
+            logging.error(message)
+
+    await asyncio.gather(
+        refresh('news', async_news_API_request,
+                'Could not complete the fetching of News data through the API. '
+                'Please check the network connection or the API key'),
+        refresh('covid', lambda: async_covid_API_request(incremental=True),
+                'Could not complete the fetching of Covid data through the API. '
+                'Please check the network connection'))
+
+
+async def refresh_periodically(interval: Optional[float], claim_seconds: float) -> None:
+    """
+    This function refreshes the data once, and then every `interval`
+    seconds when one is given, until it is cancelled.
+    """
+    while True:
+        await refresh_data_async(claim_seconds)
+        if not interval:
+            return
+        await asyncio.sleep(interval)
@@ -0,0 +1,87 @@
+"""
+This python file benchmarks the news deduplication on a synthetic
+article corpus. Each story is syndicated a few times, under a title
+with words swapped or dropped and at a different url, and the benchmark
+measures the time to deduplicate the corpus and how many stories are
+kept. Run it from the project directory:
+
+    python benchmarks/bench_news_dedup.py [--articles 20000] [--runs 5] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from news_dedup import deduplicate_news
+
+# The synthetic vocabulary, its words are drawn with Zipf-like weights
+# so that a few words (such as 'covid') are common to most articles.
+VOCABULARY = ['covid', 'vaccine', 'booster', 'cases', 'hospital', 'omicron', 'delta',
+              'lockdown', 'school', 'travel', 'rules', 'minister', 'rise', 'fall', 'week',
+              'england', 'wales', 'scotland', 'test', 'mask', 'study', 'doctors', 'nhs',
+              'record', 'variant', 'deaths', 'data', 'shows', 'new', 'warns']
+VOCABULARY += ['word%d' % rank for rank in range(5000)]
+WEIGHTS = [1 / rank for rank in range(1, len(VOCABULARY) + 1)]
+
+
+def synthetic_corpus(articles: int, copies: int = 4, seed: int = 1) -> tuple[list, int]:
+    """
+    Returns the shuffled corpus of about `articles` articles, and the
+    number of distinct stories in it.
+    """
+    generator = random.Random(seed)
+    stories = max(articles // copies, 1)
+    corpus = []
+    for story in range(stories):
+        title = generator.choices(VOCABULARY, WEIGHTS, k=10) + ['story%d' % story]
+        description = generator.choices(VOCABULARY, WEIGHTS, k=30) + ['story%d' % story]
+        for copy in range(copies):
+            variant = list(title)
+            if copy:
+                # A syndicated copy, with one word swapped and one dropped.
+                first, second = generator.sample(range(len(variant)), 2)
+                variant[first], variant[second] = variant[second], variant[first]
+                del variant[generator.randrange(len(variant))]
+            corpus.append({'title': ' '.join(variant).capitalize(),
+                           'description': ' '.join(description),
+                           'url': 'https://outlet%d.example/%d' % (copy, story),
+                           'content': 'x' * 200})
+    generator.shuffle(corpus)
+    return corpus[:articles], stories
+
+
+def benchmark(articles: int, runs: int) -> dict:
+    """Deduplicates the corpus `runs` times and summarises the timings."""
+    corpus, stories = synthetic_corpus(articles)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        kept = deduplicate_news(corpus)
+        timings.append(time.perf_counter() - start)
+    return {'articles': len(corpus), 'stories': stories, 'kept': len(kept), 'runs': runs,
+            'median_seconds': statistics.median(timings), 'max_seconds': max(timings)}
+
+
+def main() -> None:
+    """Parses the arguments, runs the benchmark and prints/saves the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--articles', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help='JSON file the results are written to')
+    args = parser.parse_args()
+    text = json.dumps(benchmark(args.articles, args.runs), indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+
+
+if __name__ == '__main__':
+    main()
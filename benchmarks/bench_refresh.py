@@ -0,0 +1,153 @@
+"""
+This python file contains the offline load test of the refresh and
+scheduling paths, against the replay server of upstream_replay (the
+recorded payloads with --payloads, synthetic ones otherwise). It times
+covid_API_request_batch over many areas, with and without throttled
+(429) and failed (500) upstream requests, concurrent news_API_request
+callers sharing one fetch, and a burst of scheduled updates run by the
+scheduler worker, and counts the upstream requests each one made. The
+faults are drawn from a seeded generator, so runs are reproducible.
+Run it from the project directory:
+
+    python benchmarks/bench_refresh.py [--areas 100] [--latency 0.05] [--seed 1]
+        [--output results.json]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from fixtures import load_payloads
+from bench_suite import metadata
+from upstream_replay import ReplayServer
+from fetch_pool import RateLimiter
+from scheduler import sched_instance, start_scheduler_worker
+from recurrence import refresh_coalescer
+from covid_data_handler import CovidClient, covid_API_request_batch
+from covid_data_handler import schedule_covid_updates
+from covid_news_handling import news_API_request, update_news
+
+# The fault profiles of the replay server: (throttle rate, failure rate)
+FAULTS = ((0, 0), (0.1, 0.05))
+
+
+def use_replay_server(work_dir: str, replay: ReplayServer) -> None:
+    """
+    This function points the dashboard's default clients at the replay
+    server, through the config.json of a scratch working directory.
+    """
+    with open(os.path.join(PROJECT_DIR, 'config.json'), encoding='utf-8') as file:
+        config = json.load(file)
+    config.update({'news_api_url': replay.news_url, 'covid_api_url': replay.covid_url})
+    with open(os.path.join(work_dir, 'config.json'), 'w', encoding='utf-8') as file:
+        json.dump(config, file)
+    shutil.copy(os.path.join(PROJECT_DIR, config['file_name']), work_dir)
+    os.chdir(work_dir)
+
+
+def bench_batch(replay: ReplayServer, areas: int) -> list:
+    """Times covid_API_request_batch over the areas, per fault profile and pool size."""
+    results = []
+    names = [('Area %d' % area, 'ltla') for area in range(areas)]
+    for throttle_rate, failure_rate in FAULTS:
+        for max_workers in (1, 8):
+            replay.throttle_rate, replay.failure_rate = throttle_rate, failure_rate
+            replay.stats.clear()
+            start = time.perf_counter()
+            # A new client per run, so no result is shared with the previous run.
+            fetched = covid_API_request_batch(names, max_workers=max_workers,
+                                              rate_limiter=RateLimiter(0),
+                                              client=CovidClient(replay.covid_url))
+            results.append({'name': 'covid_API_request_batch',
+                            'params': {'areas': areas, 'max_workers': max_workers,
+                                       'throttle_rate': throttle_rate,
+                                       'failure_rate': failure_rate},
+                            'seconds': time.perf_counter() - start,
+                            'fetched': len(fetched), 'failed': areas - len(fetched),
+                            'upstream_requests': replay.requests('covid'),
+                            'throttled': replay.requests('covid', 429),
+                            'failed_requests': replay.requests('covid', 500)})
+    replay.throttle_rate = replay.failure_rate = 0
+    return results
+
+
+def bench_news_callers(replay: ReplayServer, callers: int) -> list:
+    """Times concurrent news_API_request callers, which share one fetch."""
+    replay.stats.clear()
+    threads = [threading.Thread(target=news_API_request) for _ in range(callers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [{'name': 'news_API_request', 'params': {'callers': callers},
+             'seconds': time.perf_counter() - start,
+             'upstream_requests': replay.requests('news')}]
+
+
+def bench_scheduled_updates(replay: ReplayServer, updates: int) -> list:
+    """
+    Schedules a burst of covid and news updates, all due now, and times
+    the scheduler worker until it has run them all (coalesced or not).
+    """
+    replay.stats.clear()
+    skipped = refresh_coalescer.skipped
+    finished = threading.Event()
+    start = time.perf_counter()
+    for update in range(updates):
+        schedule_covid_updates(0, 'covid %d' % update)
+        update_news('news %d' % update, update_interval=0)
+    # Entered last, it runs after every update of the burst.
+    sched_instance.enter(delay=0, priority=3, action=finished.set)
+    start_scheduler_worker()
+    finished.wait()
+    return [{'name': 'scheduled updates', 'params': {'updates': updates},
+             'seconds': time.perf_counter() - start,
+             'coalesced': refresh_coalescer.skipped - skipped,
+             'upstream_requests': replay.requests()}]
+
+
+def main() -> None:
+    """Parses the arguments, runs the load tests and prints/saves the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--areas', type=int, default=100,
+                        help='the areas fetched by covid_API_request_batch')
+    parser.add_argument('--callers', type=int, default=32,
+                        help='the concurrent news_API_request callers')
+    parser.add_argument('--updates', type=int, default=20,
+                        help='the covid and news updates scheduled at once')
+    parser.add_argument('--latency', type=float, default=0.05,
+                        help='the seconds the replay server takes to answer')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--payloads', help='directory of recorded covid.json and news.json')
+    parser.add_argument('--output', help='JSON file the results are written to')
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.payloads)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir, \
+            ReplayServer(payloads, latency=args.latency, seed=args.seed) as replay:
+        try:
+            use_replay_server(work_dir, replay)
+            results = (bench_batch(replay, args.areas) +
+                       bench_news_callers(replay, args.callers) +
+                       bench_scheduled_updates(replay, args.updates))
+        finally:
+            os.chdir(cwd)
+    text = json.dumps({'meta': metadata(), 'results': results}, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+"""
+This python file contains the load test of the two serving modes: the
+current one (the Flask application on a threaded WSGI server) and the
+asynchronous one (asgi_app served by uvicorn). GET /index
+is sent by a growing number of concurrent keep-alive clients while
+news refreshes are kept in flight against a slow local stand-in for
+the NewsAPI, and the throughput and latency percentiles of each mode
+are printed (and saved as JSON). Run it from the project directory:
+
+    python benchmarks/bench_serving.py [--requests 4000] [--refreshes 8]
+        [--latency 0.5] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+import tempfile
+import threading
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from fixtures import FakeNewsAPI, load_payloads
+from bench_suite import http_etag, load_test, metadata, start_dashboard
+
+CONCURRENCY = (8, 64, 256)
+
+
+def keep_refreshing_blocking(news_url: str, refreshers: int, stopping: threading.Event) -> None:
+    """Keeps `refreshers` blocking news refreshes in flight, each on its own thread."""
+    from covid_news_handling import NewsClient, publish_news
+
+    def refresh() -> None:
+        client = NewsClient('key', base_url=news_url, cache_ttl=0)
+        while not stopping.is_set():
+            publish_news(client.get('Covid'))
+    for _ in range(refreshers):
+        threading.Thread(target=refresh, daemon=True).start()
+
+
+async def keep_refreshing_async(news_url: str, refreshers: int) -> None:
+    """Keeps `refreshers` asyncio news refreshes in flight, on the serving loop."""
+    import httpx
+    from async_upstream import AsyncNewsClient
+    from covid_news_handling import publish_news
+
+    async def refresh(client: AsyncNewsClient) -> None:
+        while True:
+            news = await client.get('Covid')
+            await asyncio.to_thread(publish_news, news)
+    async with httpx.AsyncClient(limits=httpx.Limits(max_connections=refreshers)) as http:
+        await asyncio.gather(*(refresh(AsyncNewsClient('key', http, base_url=news_url,
+                                                       cache_ttl=0))
+                               for _ in range(refreshers)))
+
+
+def start_asgi(news_url: str, refreshers: int):
+    """
+    This function serves asgi_app with uvicorn, from a background
+    thread, with the refreshes on the same event loop. It returns the
+    port and a function stopping the server.
+    """
+    import time
+    import uvicorn
+    import asgi_app
+    server = uvicorn.Server(uvicorn.Config(asgi_app.app, host='127.0.0.1', port=0,
+                                           log_level='warning'))
+
+    async def run() -> None:
+        refreshes = asyncio.create_task(keep_refreshing_async(news_url, refreshers))
+        await server.serve()
+        refreshes.cancel()
+
+    thread = threading.Thread(target=lambda: asyncio.run(run()), daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 30
+    while not server.started and time.monotonic() < deadline:
+        time.sleep(0.05)
+
+    def stop() -> None:
+        server.should_exit = True
+        thread.join(30)
+    return server.servers[0].sockets[0].getsockname()[1], stop
+
+
+def bench_mode(mode: str, port: int, requests: int) -> list:
+    """Load tests GET /index, full pages and revalidated (304) ones, on one server."""
+    results = []
+    etag = http_etag(port, '/index')
+    for concurrency in CONCURRENCY:
+        results.append({'name': 'GET /index', 'params': {'mode': mode, 'concurrency': concurrency},
+                        **load_test(port, '/index', concurrency, requests)})
+        results.append({'name': 'GET /index (If-None-Match)',
+                        'params': {'mode': mode, 'concurrency': concurrency},
+                        **load_test(port, '/index', concurrency, requests,
+                                    {'If-None-Match': etag})})
+    return results
+
+
+def main() -> None:
+    """Parses the arguments, load tests both modes and prints/saves the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--requests', type=int, default=4000,
+                        help='the GET /index requests sent per load test')
+    parser.add_argument('--refreshes', type=int, default=8,
+                        help='the news refreshes kept in flight during the load tests')
+    parser.add_argument('--latency', type=float, default=0.5,
+                        help='the seconds the local NewsAPI takes to answer')
+    parser.add_argument('--payloads', help='directory of recorded covid.json and news.json')
+    parser.add_argument('--output', help='JSON file the results are written to')
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.payloads)
+    cwd = os.getcwd()
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir, \
+            FakeNewsAPI(payloads['news'], delay=args.latency) as fake:
+        server = start_dashboard(work_dir, payloads, fake.url)
+        stopping = threading.Event()
+        try:
+            keep_refreshing_blocking(fake.url, args.refreshes, stopping)
+            results += bench_mode('wsgi', server.server_port, args.requests)
+        finally:
+            stopping.set()
+            server.shutdown()
+        port, stop = start_asgi(fake.url, args.refreshes)
+        try:
+            results += bench_mode('asgi', port, args.requests)
+        finally:
+            stop()
+            os.chdir(cwd)
+
+    text = json.dumps({'meta': metadata(), 'results': results}, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+    for result in results:
+        if result['params']['mode'] == 'asgi':
+            continue
+        asgi = next(other for other in results if other['name'] == result['name'] and
+                    other['params'] == {**result['params'], 'mode': 'asgi'})
+        print('%-28s concurrency %-4d wsgi %8.0f req/s  asgi %8.0f req/s  (%+.0f%%)' % (
+            result['name'], result['params']['concurrency'], result['requests_per_second'],
+            asgi['requests_per_second'],
+            (asgi['requests_per_second'] / result['requests_per_second'] - 1) * 100))
+
+
+if __name__ == '__main__':
+    main()
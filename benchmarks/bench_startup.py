@@ -0,0 +1,93 @@
+"""
+This python file benchmarks the start up of the dashboard application,
+cold (no on-disk cache) and warm (the cache holds the last payloads).
+Each start up runs in a fresh interpreter, in a scratch directory
+holding a copy of the config and CSV files, and measures the import of
+main, the creation of the application (create_app), the first GET /index
+and the phases of the start up profile. Run it from the project directory:
+
+    python benchmarks/bench_startup.py [--runs 5] [--output results.json]
+"""
+
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from payload_cache import save_payload
+from fixtures import synthetic_covid_payload, synthetic_news_payload
+
+# The code timed in the fresh interpreter, it prints its timings as JSON.
+STARTUP_PROBE = '''
+import json, time
+start = time.perf_counter()
+import main
+imported = time.perf_counter()
+app = main.create_app()
+created = time.perf_counter()
+response = app.test_client().get('/index')
+served = time.perf_counter()
+main.warmed_up.wait()
+print(json.dumps({'import_seconds': imported - start, 'create_app_seconds': created - imported,
+                  'first_index_seconds': served - created, 'total_seconds': served - start,
+                  'status': response.status_code, 'phases': main.startup_profile.seconds(),
+                  'has_local_data': bool(main.global_vars.store.snapshot().local_data_from_api)}))
+'''
+
+
+def run_startup(work_dir: str) -> dict:
+    """Starts the application once in a fresh interpreter and returns its timings."""
+    env = dict(os.environ, PYTHONPATH=PROJECT_DIR)
+    output = subprocess.run([sys.executable, '-c', STARTUP_PROBE], cwd=work_dir, env=env,
+                            capture_output=True, text=True, check=True, timeout=120)
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+
+def benchmark(mode: str, runs: int) -> dict:
+    """Runs the cold or warm start up `runs` times and summarises the timings."""
+    timings = []
+    for _ in range(runs):
+        with tempfile.TemporaryDirectory() as work_dir:
+            with open(os.path.join(PROJECT_DIR, 'config.json'), encoding='utf-8') as file:
+                config = json.load(file)
+            config['cache_file'] = os.path.join(work_dir, 'cache.sqlite3')
+            with open(os.path.join(work_dir, 'config.json'), 'w', encoding='utf-8') as file:
+                json.dump(config, file)
+            shutil.copy(os.path.join(PROJECT_DIR, config['file_name']), work_dir)
+            if mode == 'warm':
+                save_payload('covid:ltla:Exeter', synthetic_covid_payload(), config['cache_file'])
+                save_payload('news', synthetic_news_payload(), config['cache_file'])
+            timings.append(run_startup(work_dir))
+    summary = {'mode': mode, 'runs': runs,
+               'has_local_data': all(timing['has_local_data'] for timing in timings)}
+    for key in ('import_seconds', 'create_app_seconds', 'first_index_seconds', 'total_seconds'):
+        summary[key] = statistics.median(timing[key] for timing in timings)
+    summary['phase_seconds'] = {phase: statistics.median(timing['phases'][phase]
+                                                         for timing in timings)
+                                for phase in timings[0]['phases']}
+    return summary
+
+
+def main() -> None:
+    """Parses the arguments, runs both modes and prints/saves the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--output', help='JSON file the results are written to')
+    args = parser.parse_args()
+    results = [benchmark(mode, args.runs) for mode in ('cold', 'warm')]
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+"""
+This python file contains the offline benchmark suite of the data, news
+and request paths. It times parse_csv_data, load_csv_columns and
+process_covid_csv_data on synthetic CSV exports of 10^3 rows up to
+--max-rows, remove_unwanted_news on growing article feeds, a news fetch
+from a local stand-in for the NewsAPI, and the throughput and latency
+percentiles of GET /index under concurrent load. The results are saved
+as JSON, and --compare prints the change against the results of
+another commit. Run it from the project directory:
+
+    python benchmarks/bench_suite.py [--max-rows 1000000] [--output results.json]
+        [--compare baseline.json] [--payloads recorded_dir]
+"""
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import statistics
+import subprocess
+import http.client
+from typing import Callable, Optional
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+
+from fixtures import FakeNewsAPI, load_payloads, write_synthetic_csv
+from payload_cache import save_payload
+from covid_data_handler import parse_csv_data, load_csv_columns
+from covid_data_handler import process_covid_csv_data, covid_payload_name
+from covid_news_handling import NewsClient, remove_unwanted_news
+from news_exclusions import NewsExclusionIndex, article_key
+
+
+def time_call(function: Callable, repeat: int) -> dict:
+    """Calls the function `repeat` times and summarises the durations."""
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - start)
+    return {'repeat': repeat, 'min_seconds': min(durations),
+            'median_seconds': statistics.median(durations)}
+
+
+def bench_csv(max_rows: int, repeat: int) -> list:
+    """Times the CSV parsing and processing, for 10^3 rows up to max_rows."""
+    results = []
+    with tempfile.TemporaryDirectory() as work_dir:
+        rows = 1000
+        while rows <= max_rows:
+            path = write_synthetic_csv(os.path.join(work_dir, 'data.csv'), rows)
+            # The larger files are only timed once, they take seconds each.
+            runs = repeat if rows <= 100000 else 1
+            lines = parse_csv_data(path)
+            columns = load_csv_columns(path)
+            for name, function in (
+                    ('parse_csv_data', lambda: parse_csv_data(path)),
+                    ('process_covid_csv_data', lambda: process_covid_csv_data(lines)),
+                    ('load_csv_columns', lambda: load_csv_columns(path)),
+                    ('process_covid_csv_data(columns)', lambda: process_covid_csv_data(columns))):
+                results.append({'name': name, 'params': {'rows': rows},
+                                **time_call(function, runs)})
+            del lines, columns
+            rows *= 10
+    return results
+
+
+def bench_remove_news(repeat: int) -> list:
+    """Times remove_unwanted_news, a tenth of the articles being removed."""
+    results = []
+    for articles in (100, 1000, 10000):
+        feed = [{'title': 'Article %d' % i, 'url': 'https://news.example/%d' % i}
+                for i in range(articles)]
+        removed = feed[::10]
+        titles = [article['title'] for article in removed]
+        index = NewsExclusionIndex()
+        for article in removed:
+            index.exclude(article_key(article))
+        for kind, excluded in (('titles', titles), ('index', index)):
+            results.append({'name': 'remove_unwanted_news',
+                            'params': {'articles': articles, 'excluded': kind},
+                            **time_call(lambda: remove_unwanted_news(feed, excluded), repeat)})
+    return results
+
+
+def bench_news_fetch(payload: dict, repeat: int) -> list:
+    """Times a news fetch from the local NewsAPI, downloaded and revalidated."""
+    with FakeNewsAPI(payload) as fake:
+        def download() -> None:
+            NewsClient('key', base_url=fake.url).get('Covid')
+        client = NewsClient('key', base_url=fake.url, cache_ttl=0)
+        client.get('Covid')
+        return [{'name': 'news_fetch', 'params': {'response': 'download'},
+                 **time_call(download, repeat)},
+                {'name': 'news_fetch', 'params': {'response': 'revalidated'},
+                 **time_call(lambda: client.get('Covid'), repeat)}]
+
+
+def start_dashboard(work_dir: str, payloads: dict, news_url: str):
+    """
+    This function starts the dashboard from a scratch directory, with the
+    payloads in its cache and without the start up refresh, on a local
+    threaded server, and returns the server.
+    """
+    from werkzeug.serving import make_server
+    with open(os.path.join(PROJECT_DIR, 'config.json'), encoding='utf-8') as file:
+        config = json.load(file)
+    config.update({'cache_file': os.path.join(work_dir, 'cache.sqlite3'),
+                   'news_api_url': news_url, 'refresh_on_start': False})
+    with open(os.path.join(work_dir, 'config.json'), 'w', encoding='utf-8') as file:
+        json.dump(config, file)
+    shutil.copy(os.path.join(PROJECT_DIR, config['file_name']), work_dir)
+    save_payload(covid_payload_name(), payloads['covid'], config['cache_file'])
+    save_payload('news', payloads['news'], config['cache_file'])
+    # The application reads its config, CSV and cache from the working directory.
+    os.chdir(work_dir)
+    import main
+    main.app.debug = False
+    server = make_server('127.0.0.1', 0, main.app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def load_test(port: int, path: str, concurrency: int, requests: int,
+              headers: Optional[dict] = None) -> dict:
+    """
+    Sends `requests` GET requests from `concurrency` threads, each over
+    its own keep-alive connection, and returns the throughput and the
+    latency percentiles.
+    """
+    latencies = []
+    statuses = set()
+    lock = threading.Lock()
+
+    def worker(count: int) -> None:
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        own = []
+        for _ in range(count):
+            start = time.perf_counter()
+            connection.request('GET', path, headers=headers or {})
+            response = connection.getresponse()
+            response.read()
+            own.append(time.perf_counter() - start)
+            if response.will_close:
+                connection.close()
+                connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            with lock:
+                statuses.add(response.status)
+        connection.close()
+        with lock:
+            latencies.extend(own)
+
+    threads = [threading.Thread(target=worker, args=(requests // concurrency,))
+               for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {'requests': len(latencies), 'statuses': sorted(statuses),
+            'requests_per_second': len(latencies) / elapsed,
+            'p50_ms': percentiles[49] * 1000, 'p90_ms': percentiles[89] * 1000,
+            'p99_ms': percentiles[98] * 1000}
+
+
+def bench_index(payloads: dict, requests: int) -> list:
+    """Load tests GET /index, full pages and revalidated (304) ones."""
+    results = []
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as work_dir, FakeNewsAPI(payloads['news']) as fake:
+        server = start_dashboard(work_dir, payloads, fake.url)
+        try:
+            port = server.server_port
+            etag = http_etag(port, '/index')
+            for concurrency in (1, 8, 32):
+                results.append({'name': 'GET /index', 'params': {'concurrency': concurrency},
+                                **load_test(port, '/index', concurrency, requests)})
+                results.append({'name': 'GET /index (If-None-Match)',
+                                'params': {'concurrency': concurrency},
+                                **load_test(port, '/index', concurrency, requests,
+                                            {'If-None-Match': etag})})
+        finally:
+            server.shutdown()
+            os.chdir(cwd)
+    return results
+
+
+def http_etag(port: int, path: str) -> str:
+    """Returns the ETag of the path, warming up the dashboard snapshot."""
+    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    connection.request('GET', path)
+    response = connection.getresponse()
+    response.read()
+    connection.close()
+    return response.getheader('ETag')
+
+
+def metadata() -> dict:
+    """Returns the commit and environment the results were measured on."""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=PROJECT_DIR,
+                                capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {'commit': commit, 'python': platform.python_version(),
+            'platform': platform.platform(), 'cpus': os.cpu_count(),
+            'measured': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(results: list, baseline: list) -> None:
+    """Prints the change of every result found in the baseline results."""
+    previous = {(result['name'], json.dumps(result['params'], sort_keys=True)): result
+                for result in baseline}
+    for result in results:
+        before = previous.get((result['name'], json.dumps(result['params'], sort_keys=True)))
+        if before is None:
+            continue
+        # Durations should fall and throughputs rise.
+        key = 'median_seconds' if 'median_seconds' in result else 'requests_per_second'
+        change = (result[key] - before[key]) / before[key] * 100
+        print('%-34s %-45s %s %+.1f%%' % (result['name'], json.dumps(result['params']),
+                                          key, change))
+
+
+def main() -> None:
+    """Parses the arguments, runs the suite and prints/saves the results."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--max-rows', type=int, default=1000000,
+                        help='the largest CSV, up to 10000000')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='the GET /index requests sent per load test')
+    parser.add_argument('--payloads', help='directory of recorded covid.json and news.json')
+    parser.add_argument('--output', help='JSON file the results are written to')
+    parser.add_argument('--compare', help='JSON results of another commit to compare with')
+    args = parser.parse_args()
+
+    payloads = load_payloads(args.payloads)
+    results = (bench_csv(args.max_rows, args.repeat) + bench_remove_news(args.repeat) +
+               bench_news_fetch(payloads['news'], args.repeat) +
+               bench_index(payloads, args.requests))
+    text = json.dumps({'meta': metadata(), 'results': results}, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            file.write(text)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as file:
+            compare(results, json.load(file)['results'])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+This python file contains the fixtures shared by the benchmarks: the
+synthetic CSV exports, the API payloads (synthetic, or recorded ones
+loaded from a directory) and a local stand-in for the NewsAPI server,
+so that every benchmark runs offline.
+"""
+
+import os
+import json
+from datetime import date, timedelta
+from typing import Optional
+from upstream_replay import ReplayServer
+
+CSV_HEADER = ('areaCode,areaName,areaType,date,cumDailyNsoDeathsByDeathDate,'
+              'hospitalCases,newCasesBySpecimenDate')
+# The days of data of each synthetic area, the areas follow each other
+# in the file like in a multi-area export.
+DAYS_PER_AREA = 640
+LATEST_DATE = date(2021, 10, 28)
+
+
+def write_synthetic_csv(path: str, rows: int) -> str:
+    """
+    This function writes a CSV export of `rows` data rows, shaped like
+    the nation one (latest day first, with the missing values of the
+    recent days), and returns its path.
+    """
+    dates = [(LATEST_DATE - timedelta(days=day)).isoformat() for day in range(DAYS_PER_AREA)]
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write(CSV_HEADER + '\n')
+        written = 0
+        area = 0
+        while written < rows:
+            prefix = 'E%08d,Area %d,ltla,' % (area, area)
+            count = min(DAYS_PER_AREA, rows - written)
+            file.write(''.join(
+                prefix + dates[day] + ',' +
+                ('' if day < 14 else str(140000 + DAYS_PER_AREA - day)) + ',' +
+                ('' if day > 600 else str(7000 + day % 97)) + ',' +
+                ('' if day == 0 else str(8000 + day % 1013)) + '\n'
+                for day in range(count)))
+            written += count
+            area += 1
+    return path
+
+
+def synthetic_covid_payload(days: int = DAYS_PER_AREA) -> dict:
+    """Returns a covid payload shaped like the Cov19API one."""
+    return {'data': [{'areaCode': 'E07000041', 'areaName': 'Exeter', 'areaType': 'ltla',
+                      'date': (LATEST_DATE - timedelta(days=day)).isoformat(),
+                      'cumDailyNsoDeathsByDeathDate': None, 'hospitalCases': None,
+                      'newCasesBySpecimenDate': day} for day in range(days)],
+            'length': days}
+
+
+def synthetic_news_payload(articles: int = 100) -> dict:
+    """Returns a news payload shaped like the NewsAPI one."""
+    return {'status': 'ok', 'totalResults': articles,
+            'articles': [{'title': 'Article %d' % i, 'description': 'Story number %d' % i,
+                          'content': 'x' * 200, 'url': 'https://news.example/%d' % i}
+                         for i in range(articles)]}
+
+
+def load_payloads(directory: Optional[str] = None) -> dict:
+    """
+    This function returns the covid and news payloads: the recorded ones
+    (covid.json and news.json, saved responses of the APIs) from the
+    directory when given, the synthetic ones otherwise.
+    """
+    payloads = {'covid': synthetic_covid_payload(), 'news': synthetic_news_payload()}
+    if directory:
+        for name in payloads:
+            with open(os.path.join(directory, name + '.json'), encoding='utf-8') as file:
+                payloads[name] = json.load(file)
+    return payloads
+
+
+class FakeNewsAPI(ReplayServer):
+    """
+    This class serves a news payload on a local port, like the NewsAPI
+    everything endpoint does, answering 304 to a request holding its ETag,
+    after `delay` seconds (the latency of the actual API). `url` is the
+    url of the endpoint.
+    """
+
+    def __init__(self, payload: dict, delay: float = 0) -> None:
+        super().__init__({'news': payload}, latency=delay)
+        self.url = self.news_url
@@ -0,0 +1,19 @@
+"""
+This python file contains the loading of the config.json file,
+which is read once and then shared amongst all other files.
+"""
+
+import json
+from functools import lru_cache
+
+CONFIG_FILE = "config.json"
+
+
+@lru_cache(maxsize=None)
+def load_config(config_file: str = CONFIG_FILE) -> dict:
+    """
+    This function reads and parses the config file on its first
+    call, and returns the same parsed config on later calls.
+    """
+    with open(config_file, "r", encoding='utf-8') as jsonfile:
+        return json.load(jsonfile)
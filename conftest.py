@@ -0,0 +1,13 @@
+import pytest
+import global_vars
+
+@pytest.fixture
+def isolated_store():
+    # The state store emptied for the test, and given its values back
+    # after it, so the data the test publishes does not leak into the
+    # following tests. Publishing (instead of swapping the store) keeps
+    # the versions increasing, which the version keyed caches rely on.
+    before = global_vars.store.snapshot()
+    global_vars.store.publish(**global_vars.new_store().snapshot().values)
+    yield global_vars.store
+    global_vars.store.publish(**before.values)
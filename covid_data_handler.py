@@ -7,112 +7,415 @@ for the servers' data.
 """
 
 import sched
+import json
+import logging
+import threading
+from datetime import date, timedelta
+from typing import Callable, Optional, Union
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
 from uk_covid19 import Cov19API
-from scheduler import sched_instance
+from config_loader import load_config
+import csv_columns
+from area_series import AreaSeries
+from csv_columns import CsvColumns
+from scheduler import sched_instance, wake_scheduler
+from recurrence import RecurringJob, refresh_coalescer
+from fetch_pool import RateLimiter, fetch_concurrently, retry_with_backoff
+from single_flight import upstream_requests
+from metrics import csv_parse_seconds, tracked_fetch
+from rollups import area_rollups
+import payload_cache
 import global_vars
 
 
 def parse_csv_data(csv_filename: str) -> list[str]:
     """
     This function takes as input the file name, and returns
-    the file rows as a list.
+    the file rows as a list. For large files prefer
+    load_csv_columns, which does not keep the rows as strings.
     """
-    # Make an empty list.
-    file_rows = []
-    # Open the file for reading.
-    with open(csv_filename, "r", encoding='utf-8') as file:
-        # For each line
-        line = file.readline()
-        while line:
-            # Append the line to the file_rows list, while removing
-            # Trailing new lines `\n`
-            file_rows.append(line.replace("\n", ""))
-            line = file.readline()
-    return file_rows
+    # Open the file for reading and split it into lines, removing
+    # the trailing new lines `\n`
+    with csv_parse_seconds.time(function='parse_csv_data'):
+        with open(csv_filename, "r", encoding='utf-8') as file:
+            return file.read().splitlines()
 
 
-def process_covid_csv_data(covid_csv_data: list[str]) -> tuple[int, int, int]:
+def load_csv_columns(csv_filename: str) -> CsvColumns:
+    """
+    This function takes as input the file name, and returns the
+    file memory-mapped and parsed into typed columns.
+    """
+    with csv_parse_seconds.time(function='load_csv_columns'):
+        return csv_columns.load_csv_columns(csv_filename)
+
+
+def process_covid_csv_data(covid_csv_data: Union[list[str], CsvColumns]) -> tuple[int, int, int]:
     """
     This function takes as input a list containing covid related data in
-    a predetermined format. When the format matches, the function shall
-    return the following calculated variables:
-    total_deaths, current_hospital_cases, last7days_cases
-    """
-
-    # Define and assume zero count for all.
-    total_deaths = 0
-    current_hospital_cases = 0
-    last7days_cases = 0
-
-    # One count for the outer loop while the other for the inner loop
-    outside_count = 0
-    inside_count = 0
-
-    # For each row in the recieved list
-    for item in covid_csv_data:
-        # Exclude the first row by outside_count != 0, and empty items
-        # In other words, find the first non blank element after the first row
-        # Which is the header.
-        if (outside_count != 0 and item.split(',')[4] != '' and total_deaths == 0):
-            # Write only once and do not overwrite again due to total_deaths == 0
-            total_deaths = int(item.split(',')[4])
-        # Take the first data row and get the current_hospital_cases
-        if outside_count == 1:
-            current_hospital_cases = int(item.split(',')[5])
-        # Count 7 rows after finding the first non blank element
-        if (outside_count != 0 and item.split(',')[6] != '' and inside_count <= 7):
-            if inside_count == 0:
-                inside_count += 1
-            else:
-                # Exclude the first row by the above, as it
-                # represents the `yesterday's` incomplete new
-                # cases count.
-                last7days_cases += int(item.split(',')[6])
-                inside_count += 1
-        outside_count += 1
-    # Return the computed variables.
-    return last7days_cases, current_hospital_cases, total_deaths
-
-
-def covid_API_request(location: str = 'Exeter', location_type: str = 'ltla') -> dict:
+    a predetermined format (or the columns from load_csv_columns). When
+    the format matches, the function shall return the following
+    calculated variables:
+    last7days_cases, current_hospital_cases, total_deaths
+    """
+    # Rows are split only once, into typed columns, and the
+    # metrics are then computed over the columns.
+    if not isinstance(covid_csv_data, CsvColumns):
+        covid_csv_data = csv_columns.columns_from_lines(covid_csv_data)
+    return csv_columns.headline_metrics(covid_csv_data)
+
+
+# The host of the API used by the `Cov19API` library, calls
+# to it are rate limited as a whole, and its data endpoint.
+COVID_API_HOST = 'api.coronavirus.data.gov.uk'
+COVID_API_URL = 'https://' + COVID_API_HOST + '/v1/data'
+# The calls made to each host by all the request functions (batches,
+# incremental updates and scheduled refreshes) share one budget.
+COVID_API_REQUESTS_PER_SECOND = 10
+covid_rate_limiter = RateLimiter(COVID_API_REQUESTS_PER_SECOND)
+
+# The local area shown on the dashboard by default
+DEFAULT_LOCATION = 'Exeter'
+DEFAULT_LOCATION_TYPE = 'ltla'
+
+# The number of days before the latest one held that are requested
+# again by the incremental updates, as the latest figures get revised.
+REVISION_DAYS = 5
+# Past this many missing days, one request for the whole history
+# is cheaper than one request per day.
+MAX_INCREMENTAL_DAYS = 28
+
+# The selected columns for retrieval.
+COVID_API_STRUCTURE = {
+    'areaCode': 'areaCode',
+    'areaName': 'areaName',
+    'areaType': 'areaType',
+    'date': 'date',
+    'cumDailyNsoDeathsByDeathDate': 'cumDailyNsoDeathsByDeathDate',
+    'hospitalCases': 'hospitalCases',
+    'newCasesBySpecimenDate': 'newCasesBySpecimenDate',
+}
+
+
+def cov19_client(filters: list[str], structure: dict) -> dict:
+    """
+    This function retrieves the data matching the filters through
+    the `Cov19API` library. Any function with the same signature
+    can be passed as the client of the request functions below.
+    """
+    api = Cov19API(filters=filters, structure=structure)
+    return api.get_json()
+
+
+class CovidPages:
+    """
+    This class holds a retrieval of the covid data page by page, as the
+    `Cov19API` library does: the params of the next page, and the data
+    of the pages received until they run out. It is shared by CovidClient
+    and the async (async_upstream) client, which only differ in how the
+    pages are sent.
+    """
+
+    def __init__(self, filters: list[str], structure: dict) -> None:
+        self._params = {'filters': ';'.join(filters), 'format': 'json',
+                        'structure': json.dumps(structure, separators=(',', ':'))}
+        self.data: list[dict] = []
+        self.last_update: Optional[str] = None
+        self.page = 1
+
+    def params(self) -> dict:
+        """Returns the query params of the next page."""
+        return {**self._params, 'page': self.page}
+
+    def add(self, status: int, response) -> bool:
+        """
+        This method adds the data of a page's response (one with the
+        raise_for_status, json and headers of requests' responses), and
+        returns whether the next page is to be requested. The pages run
+        out with a 204 (No Content).
+        """
+        if status == 204:
+            return False
+        response.raise_for_status()
+        self.data.extend(response.json()['data'])
+        self.last_update = response.headers.get('last-modified')
+        self.page += 1
+        return True
+
+    def result(self) -> dict:
+        """Returns the data received, in the format of `Cov19API`'s get_json."""
+        return {'data': self.data, 'lastUpdate': self.last_update, 'length': len(self.data),
+                'totalPages': self.page - 1}
+
+
+class CovidClient:
+    """
+    This class retrieves the covid data from a data endpoint shaped like
+    the API's (such as a local replay of recorded responses), page by
+    page as the `Cov19API` library does, over a pooled session. It is
+    called like cov19_client.
+    """
+
+    def __init__(self, base_url: str = COVID_API_URL, timeout: float = 10,
+                 session: Optional[requests.Session] = None) -> None:
+        self.base_url = base_url
+        # The host the calls are rate limited by
+        self.host = urlsplit(base_url).netloc
+        self.timeout = timeout
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+
+    def __call__(self, filters: list[str], structure: dict) -> dict:
+        pages = CovidPages(filters, structure)
+        while True:
+            response = self.session.get(self.base_url, params=pages.params(),
+                                        timeout=self.timeout)
+            if not pages.add(response.status_code, response):
+                return pages.result()
+
+
+_default_client: Optional[Callable[[list[str], dict], dict]] = None
+_default_client_lock = threading.Lock()
+
+
+def default_covid_client() -> Callable[[list[str], dict], dict]:
+    """
+    This function returns the covid client used when none is passed to
+    the request functions: the `Cov19API` library, or a CovidClient of
+    the "covid_api_url" of the config.json when one is set (such as a
+    local replay server).
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            try:
+                url = load_config().get('covid_api_url')
+            except (OSError, ValueError):
+                url = None
+            _default_client = CovidClient(url) if url else cov19_client
+    return _default_client
+
+
+def client_host(client: Callable[[list[str], dict], dict]) -> str:
+    """Returns the host called by the client, the API's for the `Cov19API` library."""
+    return getattr(client, 'host', COVID_API_HOST)
+
+
+def covid_API_request(location: str = DEFAULT_LOCATION,
+                      location_type: str = DEFAULT_LOCATION_TYPE,
+                      client: Optional[Callable[[list[str], dict], dict]] = None,
+                      incremental: bool = False) -> dict:
     """
     This function will use the `Cov19API` library to get the latest
     COVID-19 related data, similar to the local csv. This information
     includes the area code, area name, area type, date, cumulative deaths,
     hospital cases, and new cases by the specified date.
+    When `incremental` is set and the area is already held, only the days
+    since the latest one held (and a few before it, which may have been
+    revised) are requested and merged into the held series.
+    Concurrent identical requests share a single fetch.
     """
+    if client is None:
+        client = default_covid_client()
+    return upstream_requests.do(('covid', location, location_type, incremental, client),
+                                _covid_API_request, location, location_type, client,
+                                incremental)
+
+
+def _covid_API_request(location: str, location_type: str,
+                       client: Callable[[list[str], dict], dict], incremental: bool) -> dict:
+    """Performs the covid_API_request, once per single-flight key."""
     # The setup of the filters, to filter the data from the API
     filters = [
         'areaType='+location_type,
         'areaName='+location
     ]
-    # The selected columns for retrieval.
-    columns = {
-        'areaCode': 'areaCode',
-        'areaName': 'areaName',
-        'areaType': 'areaType',
-        'date': 'date',
-        'cumDailyNsoDeathsByDeathDate': 'cumDailyNsoDeathsByDeathDate',
-        'hospitalCases': 'hospitalCases',
-        'newCasesBySpecimenDate': 'newCasesBySpecimenDate',
-    }
-    # The function setup and call to retrieve the data.
-    api = Cov19API(filters=filters, structure=columns)
-    data = api.get_json()
-    # For when the scheduler runs, update the data for the
+    series = global_vars.store.snapshot().area_series.get((location, location_type))
+    if incremental and series is not None and series.latest_date and \
+            days_since(series.latest_date) <= MAX_INCREMENTAL_DAYS:
+        rows = request_recent_days(filters, series.latest_date, client)
+        series, changed = merge_area_series(location, location_type, rows)
+        data = series.payload()
+    else:
+        # The function call to retrieve the data.
+        covid_rate_limiter.acquire(client_host(client))
+        with tracked_fetch('covid'):
+            data = client(filters, COVID_API_STRUCTURE)
+        rows = data['data']
+        changed = merge_area_series(location, location_type, rows)[1]
+    return publish_covid_data(location, location_type, data, rows, changed or not incremental)
+
+
+def publish_covid_data(location: str, location_type: str, data: dict,
+                       rows: list[dict], changed: bool) -> dict:
+    """
+    This function hands the fetched rows of the area to the rollups and,
+    when they changed, publishes the area's data for the web interface
+    and caches it. It is shared by the blocking and the asyncio requests.
+    """
+    # Keep the totals of the area's parents up to date.
+    area_rollups.update_area(rows)
+    # For when the scheduler runs, publish the data for the
     # web interface
-    global_vars.local_data_from_api = data
+    if changed:
+        global_vars.store.publish(local_data_from_api=data)
+        # Keep the last good payload for the next start up.
+        payload_cache.store(covid_payload_name(location, location_type), data)
     return data
 
 
-def schedule_covid_updates(update_interval: int, update_name: str) -> sched.Event:
+def covid_payload_name(location: str = DEFAULT_LOCATION,
+                       location_type: str = DEFAULT_LOCATION_TYPE) -> str:
+    """Returns the name the area's payload is cached under."""
+    return 'covid:' + location_type + ':' + location
+
+
+def restore_cached_covid_data(location: str = DEFAULT_LOCATION,
+                              location_type: str = DEFAULT_LOCATION_TYPE) -> bool:
+    """
+    This function loads the area's last good payload from the on-disk
+    cache into the state store, so the following updates can be incremental.
+    It returns whether a payload was found.
+    """
+    data = payload_cache.load(covid_payload_name(location, location_type))
+    if not data:
+        return False
+    merge_area_series(location, location_type, data['data'])
+    area_rollups.update_area(data['data'])
+    global_vars.store.publish(local_data_from_api=data)
+    return True
+
+
+def merge_area_series(location: str, location_type: str,
+                      rows: list[dict]) -> tuple[AreaSeries, list[str]]:
+    """
+    This function merges the rows into a copy of the area's AreaSeries
+    (a new one if the area is not held yet) and publishes the copy. It
+    returns the published series and the dates that changed.
+    """
+    area = (location, location_type)
+    merged = {}
+
+    def merge(state) -> dict:
+        # Merged under the write lock, so concurrent updates of the
+        # area are applied one after the other.
+        series = state.area_series.get(area) or AreaSeries()
+        merged['series'], merged['changed'] = series.merged(rows)
+        if area in state.area_series and not merged['changed']:
+            return {}
+        return {'area_series': {**state.area_series, area: merged['series']}}
+    global_vars.store.transact(merge)
+    return merged['series'], merged['changed']
+
+
+def days_since(iso_date: str) -> int:
+    """Returns the number of days from the given (ISO) date to today."""
+    return (date.today() - date.fromisoformat(iso_date)).days
+
+
+def request_recent_days(filters: list[str], latest_date: str,
+                        client: Optional[Callable[[list[str], dict], dict]] = None,
+                        revision_days: int = REVISION_DAYS) -> list[dict]:
+    """
+    This function requests, one date filter at a time, the rows from
+    `revision_days` before the latest held date up to today. The API
+    filters only on exact dates, so the days are requested concurrently.
+    """
+    if client is None:
+        client = default_covid_client()
+    first_day = date.fromisoformat(latest_date) - timedelta(days=revision_days)
+    days = (date.today() - first_day).days + 1
+    dates = [(first_day + timedelta(days=day)).isoformat() for day in range(days)]
+
+    def fetch(day: str) -> list[dict]:
+        covid_rate_limiter.acquire(client_host(client))
+        with tracked_fetch('covid'):
+            return client(filters + ['date='+day], COVID_API_STRUCTURE)['data']
+
+    results, failures = fetch_concurrently(dates, fetch, max_workers=4)
+    for day, error in failures.items():
+        logging.warning('Could not retrieve the covid data of %s: %s', day, error)
+    return [row for rows in results.values() for row in rows]
+
+
+def covid_API_request_batch(areas: list[tuple[str, str]], max_workers: int = 8,
+                            rate_limiter: Optional[RateLimiter] = None, retries: int = 3,
+                            client: Optional[Callable[[list[str], dict], dict]] = None) -> dict:
+    """
+    This function retrieves the data of many (location, location_type)
+    pairs concurrently, on at most `max_workers` threads, while keeping
+    to the calls per second of the API host (covid_rate_limiter, shared
+    with the other requests, unless another limiter is given). Requests
+    failing with a transient error are retried with backoff. The results
+    are merged into the per-area store area_data of the state store, keyed
+    by (location, location_type), and the results of this batch are
+    returned in the same format.
+    """
+    if client is None:
+        client = default_covid_client()
+    if rate_limiter is None:
+        rate_limiter = covid_rate_limiter
+    host = client_host(client)
+
+    def fetch(area: tuple[str, str]) -> dict:
+        location, location_type = area
+        filters = ['areaType='+location_type, 'areaName='+location]
+
+        def attempt() -> dict:
+            rate_limiter.acquire(host)
+            with tracked_fetch('covid'):
+                return client(filters, COVID_API_STRUCTURE)
+        return upstream_requests.do(('covid-area', location, location_type, client),
+                                    retry_with_backoff, attempt, retries=retries)
+
+    results, failures = fetch_concurrently(areas, fetch, max_workers=max_workers)
+    for (location, location_type), error in failures.items():
+        logging.error('Could not retrieve the covid data of %s (%s): %s',
+                      location, location_type, error)
+    for data in results.values():
+        area_rollups.update_area(data['data'])
+    if results:
+        # Publish a merged copy, so readers never see a half updated store.
+        global_vars.store.transact(lambda state: {'area_data': {**state.area_data, **results}})
+    return results
+
+
+def schedule_covid_updates(update_interval: int, update_name: str,
+                           location: str = DEFAULT_LOCATION,
+                           location_type: str = DEFAULT_LOCATION_TYPE) -> sched.Event:
     """
     With the use of the sched module, this function will schedule
-    the execution of covid data updates.
+    the execution of covid data updates, which only retrieve the
+    days that are new since the previous update.
     """
     # Input into the queue the action required with the correct update
     # interval (delay)
     event = sched_instance.enter(
-        delay=update_interval, priority=1, action=covid_API_request)
+        delay=update_interval, priority=1,
+        action=refresh_coalescer.wrap('covid', covid_API_request),
+        kwargs={'location': location, 'location_type': location_type, 'incremental': True})
+    # Let the scheduler worker know, the event may be due before
+    # the one it is currently waiting for.
+    wake_scheduler()
     print("Task:", update_name, " -- Scheduled.")
     return event
+
+
+def schedule_recurring_covid_updates(rule, update_name: str,
+                                     location: str = DEFAULT_LOCATION,
+                                     location_type: str = DEFAULT_LOCATION_TYPE) -> RecurringJob:
+    """
+    This function schedules covid data updates recurring by the given
+    rule (such as recurrence.DailyAt), re-armed after every run.
+    """
+    job = RecurringJob(rule, covid_API_request, priority=1, key='covid',
+                       kwargs={'location': location, 'location_type': location_type,
+                               'incremental': True}).start()
+    print("Task:", update_name, " -- Scheduled", str(rule) + ".")
+    return job
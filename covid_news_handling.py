@@ -5,40 +5,202 @@ usage of an API and the scheduling of news data
 updates for the servers' data.
 """
 
-import json
 import sched
+import time
+import threading
+from typing import Optional, Union
 import requests
-from scheduler import sched_instance
+from requests.adapters import HTTPAdapter
+from scheduler import sched_instance, wake_scheduler
+from recurrence import RecurringJob, refresh_coalescer
+from config_loader import load_config
+from single_flight import upstream_requests
+from news_exclusions import NewsExclusionIndex
+from news_dedup import NewsDeduplicator, deduplicate_news
+from metrics import tracked_fetch
+import payload_cache
 import global_vars
 
+NEWS_API_URL = 'https://newsapi.org/v2/everything'
+# The search terms of the scheduled news updates
+DEFAULT_COVID_TERMS = 'Covid COVID-19 coronavirus'
+# The number of (deduplicated) articles kept, as many as one page of the API
+NEWS_ARTICLES_KEPT = 100
 
-def news_API_request(covid_terms: str = 'Covid COVID-19 coronavirus') -> dict:
+
+class NewsClient:
+    """
+    This class retrieves the news from the NewsAPI over a pooled
+    (keep-alive) session. Responses are cached per query string for
+    `cache_ttl` seconds, after which the query is revalidated with a
+    conditional request (ETag/Last-Modified) so an unchanged result
+    is not downloaded and parsed again.
+    """
+
+    def __init__(self, api_key: str, base_url: str = NEWS_API_URL,
+                 timeout: float = 10, cache_ttl: float = 300,
+                 session: Optional[requests.Session] = None) -> None:
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        self.session = session
+        # The cache entries are keyed by the query string and hold
+        # the parsed payload, its validators and when it was fetched.
+        self._cache: dict[str, dict] = {}
+        self._lock = threading.Lock()
+        # Answered from the cache, and revalidated (304) responses
+        self.cache_hits = 0
+        self.revalidated = 0
+
+    def get(self, covid_terms: str) -> dict:
+        """
+        This method returns the news matching the search terms,
+        from the cache while it is fresh, otherwise from the API.
+        """
+        query = covid_terms.replace(' ', ' OR ')
+        with self._lock:
+            cached = self._cache.get(query)
+        if cached and time.monotonic() - cached['fetched'] < self.cache_ttl:
+            self.cache_hits += 1
+            return cached['payload']
+
+        # Revalidate what is cached instead of downloading it again.
+        headers = {}
+        if cached and cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached and cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+        # Make the HTTPS GET request
+        with tracked_fetch('news'):
+            response = self.session.get(self.base_url, headers=headers, timeout=self.timeout,
+                                        params={'q': query, 'apiKey': self.api_key})
+            if response.status_code == 304 and cached:
+                self.revalidated += 1
+                payload = cached['payload']
+                # A 304 need not send the validators again, the cached
+                # ones are kept unless it does.
+                etag = response.headers.get('ETag', cached['etag'])
+                last_modified = response.headers.get('Last-Modified', cached['last_modified'])
+            else:
+                response.raise_for_status()
+                # Parse the body once, it is shared by all the callers.
+                payload = response.json()
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+        with self._lock:
+            self._cache[query] = {'payload': payload, 'fetched': time.monotonic(),
+                                  'etag': etag, 'last_modified': last_modified}
+        return payload
+
+
+_default_client: Optional[NewsClient] = None
+_default_client_lock = threading.Lock()
+
+
+def default_news_client() -> NewsClient:
+    """
+    This function returns the news client shared by the dashboard,
+    created on first use with the API key (and optionally the API
+    url, such as a local stand-in) from the config.json.
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            config = load_config()
+            _default_client = NewsClient(config['news_api_key'],
+                                         config.get('news_api_url', NEWS_API_URL))
+    return _default_client
+
+
+def news_client_stats() -> dict:
+    """
+    This function returns the cache counters of the shared news client,
+    zero while it has not been created.
+    """
+    client = _default_client
+    if client is None:
+        return {'cache_hits': 0, 'revalidated': 0}
+    return {'cache_hits': client.cache_hits, 'revalidated': client.revalidated}
+
+
+def news_API_request(covid_terms: str = DEFAULT_COVID_TERMS,
+                     client: Optional[NewsClient] = None) -> dict:
     """
     This function accepts as input the search terms
     and returns the news data in a dict format.
     Please note that this function uses a private
     API key, make sure to update it with your own
     using the config.json.
+    Concurrent identical requests share a single fetch.
     """
-    # Retrieve the API key from the config.json file, please update
-    # with your own private key.
-    with open("config.json", "r", encoding='utf-8') as jsonfile:
-        config_data = json.load(jsonfile)
-    # Set up the request url while configuring the
-    # parameters
-    url = 'https://newsapi.org/v2/everything?'
-    url += 'q=' + covid_terms.replace(' ', ' OR ')
-    url += '&apiKey=' + config_data['news_api_key']
-    # Make the HTTPS GET request
-    response = requests.get(url)
-    # For when the scheduler runs, update the news data for
-    # the web interface
-    global_vars.news_articles = response.json()['articles']
-    # Return the data
-    return response.json()
-
-
-def update_news(update_name: str, update_interval: int = 15) -> sched.Event:
+    if client is None:
+        client = default_news_client()
+    return upstream_requests.do(('news', covid_terms, client),
+                                _news_API_request, covid_terms, client)
+
+
+def _news_API_request(covid_terms: str, client: NewsClient) -> dict:
+    """Performs the news_API_request, once per single-flight key."""
+    return publish_news(client.get(covid_terms))
+
+
+# Serialises the publications, so no fetched story is lost between
+# reading the published articles and publishing the new ones.
+_publish_lock = threading.Lock()
+
+
+def publish_news(news: dict) -> dict:
+    """
+    This function publishes the fetched news for the web interface and
+    caches them. It is shared by the blocking and the asyncio requests.
+    The fetched articles are deduplicated against the ones published
+    already, the new stories are published first and followed by the
+    published ones, up to NEWS_ARTICLES_KEPT articles. It returns the
+    fetched payload with its own articles deduplicated (one per story),
+    the published list being kept in the state store.
+    """
+    # One article per story of this fetch, in the order fetched
+    fetched = deduplicate_news(news['articles'])
+    with _publish_lock:
+        published = global_vars.store.snapshot().news_articles
+        # Keep one article per story, the published ones being kept first.
+        deduplicator = NewsDeduplicator()
+        deduplicator.feed(published)
+        added = [article for article in fetched if deduplicator.add(article)]
+        # For when the scheduler runs, update the news data for the web
+        # interface, unless no new story was fetched (such as when the
+        # client's cached news were returned).
+        if not added:
+            return {**news, 'articles': fetched}
+        # A new list, the client's cached payload is left as fetched.
+        articles = (added + published)[:NEWS_ARTICLES_KEPT]
+        global_vars.store.publish(news_articles=articles)
+    # Keep the last published articles for the next start up.
+    payload_cache.store('news', {**news, 'articles': articles})
+    # Return the data of this fetch
+    return {**news, 'articles': fetched}
+
+
+def restore_cached_news() -> bool:
+    """
+    This function loads the last good news payload from the on-disk
+    cache into the state store, and returns whether one was found.
+    """
+    news = payload_cache.load('news')
+    if not news:
+        return False
+    global_vars.store.publish(news_articles=news['articles'])
+    return True
+
+
+def update_news(update_name: str, update_interval: int = 15,
+                covid_terms: str = DEFAULT_COVID_TERMS) -> sched.Event:
     """
     With the use of the sched module, this function will schedule
     the execution of covid news updates.
@@ -46,20 +208,41 @@ def update_news(update_name: str, update_interval: int = 15) -> sched.Event:
     # Input into the queue the action required with the correct update
     # interval (delay)
     event = sched_instance.enter(
-        delay=update_interval, priority=2, action=news_API_request)
+        delay=update_interval, priority=2,
+        action=refresh_coalescer.wrap('news', news_API_request),
+        kwargs={'covid_terms': covid_terms})
+    # Let the scheduler worker know, the event may be due before
+    # the one it is currently waiting for.
+    wake_scheduler()
     print("Task:", update_name, " -- Scheduled.")
     return event
 
 
-def remove_unwanted_news(news_articles: list, news_to_be_excluded: list) -> list:
+def schedule_recurring_news_updates(rule, update_name: str,
+                                    covid_terms: str = DEFAULT_COVID_TERMS) -> RecurringJob:
+    """
+    This function schedules covid news updates recurring by the given
+    rule (such as recurrence.DailyAt), re-armed after every run.
+    """
+    job = RecurringJob(rule, news_API_request, priority=2, key='news',
+                       kwargs={'covid_terms': covid_terms}).start()
+    print("Task:", update_name, " -- Scheduled", str(rule) + ".")
+    return job
+
+
+def remove_unwanted_news(news_articles: list,
+                         news_to_be_excluded: Union[list, NewsExclusionIndex]) -> list:
     """
-    This function recieves as input two lists of news.
-    One being the main news and the other being the
-    news to be excluded and returns the list of kept news.
+    This function recieves as input the main news and the
+    news to be excluded, either a list of titles or a
+    NewsExclusionIndex, and returns the list of kept news.
     news_articles - news_to_be_excluded
     """
+    if isinstance(news_to_be_excluded, NewsExclusionIndex):
+        return news_to_be_excluded.filter(news_articles)
     # Create a new list, iterating over each element in
     # news_articles, and keeping it only if it is not
-    # found in the news_to_be_excluded.
+    # found in the (set of the) news_to_be_excluded.
+    excluded_titles = set(news_to_be_excluded)
     return [kept_news for kept_news in news_articles if \
-                not kept_news['title'] in news_to_be_excluded]
+                not kept_news['title'] in excluded_titles]
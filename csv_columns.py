@@ -0,0 +1,300 @@
+"""
+This python file contains the columnar CSV engine used for loading
+the covid data exports. The file is memory-mapped and every column
+is parsed once into a typed array, so the metrics can be computed
+over whole columns instead of splitting each row again and again.
+"""
+
+import csv
+import mmap
+from array import array
+from datetime import date
+from itertools import accumulate, compress, islice
+from operator import methodcaller
+from typing import Iterable, Iterator, Optional, Union
+from rolling_metrics import RollingSeries
+
+# Columns holding text are dictionary encoded, the date column is
+# stored as day ordinals, and every other column is an int64 metric
+# with a missing-value mask.
+TEXT_COLUMNS = ('areaCode', 'areaName', 'areaType')
+DATE_COLUMNS = ('date',)
+
+# The number of bytes (or rows, for lines already read) split at a
+# time, this bounds the temporary memory needed while the columns
+# are being filled.
+CHUNK_BYTES = 4 * 1024 * 1024
+CHUNK_ROWS = 65536
+
+Token = Union[str, bytes]
+
+
+class TextColumn:
+    """
+    A dictionary encoded text column, each distinct value is stored
+    once and the rows only hold the integer code of their value.
+    """
+
+    def __init__(self) -> None:
+        self.values: list[str] = []
+        self.codes = array('I')
+        self._lookup: dict[Token, int] = {}
+
+    def extend(self, tokens: list[Token]) -> None:
+        """Appends the raw tokens of a chunk to the column."""
+        lookup = self._lookup
+        # Look all the tokens up in one pass, only the values seen
+        # for the first time need registering.
+        codes = list(map(lookup.get, tokens))
+        if None in codes:
+            for index, token in enumerate(tokens):
+                if codes[index] is None:
+                    code = lookup.get(token)
+                    if code is None:
+                        code = lookup[token] = len(self.values)
+                        self.values.append(
+                            token.decode('utf-8') if isinstance(token, bytes) else token)
+                    codes[index] = code
+        self.codes.extend(codes)
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, index: int) -> str:
+        return self.values[self.codes[index]]
+
+
+class DateColumn:
+    """
+    A date column stored as proleptic Gregorian ordinals, ISO dates
+    repeat heavily across areas so each distinct string is parsed once.
+    """
+
+    def __init__(self) -> None:
+        self.ordinals = array('i')
+        self._lookup: dict[Token, int] = {}
+
+    def extend(self, tokens: list[Token]) -> None:
+        """Appends the raw tokens of a chunk to the column."""
+        lookup = self._lookup
+        ordinals = list(map(lookup.get, tokens))
+        if None in ordinals:
+            for index, token in enumerate(tokens):
+                if ordinals[index] is None:
+                    ordinal = lookup.get(token)
+                    if ordinal is None:
+                        text = token.decode('ascii') if isinstance(token, bytes) else token
+                        ordinal = lookup[token] = date.fromisoformat(text).toordinal()
+                    ordinals[index] = ordinal
+        self.ordinals.extend(ordinals)
+
+    def __len__(self) -> int:
+        return len(self.ordinals)
+
+    def __getitem__(self, index: int) -> str:
+        return date.fromordinal(self.ordinals[index]).isoformat()
+
+
+class IntColumn:
+    """
+    An int64 metric column with a missing-value mask. Only the non
+    missing (non blank) cells are held in `values`, in row order, and
+    `mask` has a one byte flag per row telling whether it holds a value.
+    """
+
+    def __init__(self) -> None:
+        self.values = array('q')
+        self.mask = bytearray()
+        # The position of each row's value amongst the non missing values,
+        # counted on the first access after the column is extended.
+        self._ranks: Optional[array] = None
+
+    def extend(self, tokens: list[Token]) -> None:
+        """Appends the raw tokens of a chunk to the column."""
+        # Both passes iterate in C, the blank tokens are falsy.
+        present = bytearray(map(bool, tokens))
+        self.mask += present
+        self.values.extend(map(int, compress(tokens, present)))
+        self._ranks = None
+
+    def __len__(self) -> int:
+        return len(self.mask)
+
+    def __getitem__(self, index: int) -> Union[int, None]:
+        if not self.mask[index]:
+            return None
+        if self._ranks is None:
+            self._ranks = array('q', accumulate(self.mask, initial=0))
+        return self.values[self._ranks[index % len(self.mask)]]
+
+    def present_values(self, limit: int) -> array:
+        """Returns the first `limit` non missing values of the column."""
+        return self.values[:limit]
+
+
+class CsvColumns:
+    """
+    This class holds the header and the typed columns of a covid
+    CSV export, columns are looked up by their header name.
+    """
+
+    def __init__(self, header: list[str]) -> None:
+        self.header = header
+        self.columns = [_make_column(name) for name in header]
+        self._by_name = dict(zip(header, self.columns))
+
+    def __len__(self) -> int:
+        return len(self.columns[0]) if self.columns else 0
+
+    def __getitem__(self, name: str):
+        return self._by_name[name]
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._by_name
+
+    def feed(self, chunks: Iterable[list[Token]]) -> None:
+        """
+        Appends chunks of data lines (without their line endings)
+        column by column. Each chunk is joined and split once, then
+        every column is a strided slice of the resulting cells.
+        """
+        width = len(self.columns)
+        dates = self.header.index('date') if 'date' in self.header else None
+        for lines in chunks:
+            # Skip blank lines (such as a trailing new line)
+            lines = [line for line in lines if line]
+            if not lines:
+                continue
+            separator, quote = (b',', b'"') if isinstance(lines[0], bytes) else (',', '"')
+            joined = separator.join(lines)
+            if quote in joined:
+                # Quoted cells (such as "Bristol, City of") are split by
+                # the csv module, row by row.
+                rows = _quoted_rows(lines)
+            else:
+                # The fast path needs every row to hold every cell, and a date.
+                if set(map(methodcaller('count', separator), lines)) == {width - 1}:
+                    cells = joined.split(separator)
+                    if dates is None or separator[:0] not in cells[dates::width]:
+                        for index, column in enumerate(self.columns):
+                            column.extend(cells[index::width])
+                        continue
+                rows = [line.split(separator) for line in lines]
+            self._extend_rows(rows, separator[:0], dates)
+
+    def _extend_rows(self, rows: list[list[Token]], blank: Token, dates: Optional[int]) -> None:
+        """
+        This method transposes the rows one by one, with short rows padded
+        by blank cells and extra cells dropped. The rows without a date are
+        skipped, as the date is what a row is about.
+        """
+        width = len(self.columns)
+        padding = [blank] * width
+        rows = [(row + padding)[:width] for row in rows]
+        if dates is not None:
+            rows = [row for row in rows if row[dates]]
+        if rows:
+            for column, tokens in zip(self.columns, zip(*rows)):
+                column.extend(list(tokens))
+
+
+def _quoted_rows(lines: list[Token]) -> list[list[Token]]:
+    """Returns the cells of the lines holding quoted cells, as the lines' type."""
+    if isinstance(lines[0], str):
+        return list(csv.reader(lines))
+    return [[cell.encode('utf-8') for cell in row]
+            for row in csv.reader(line.decode('utf-8') for line in lines)]
+
+
+def _make_column(name: str):
+    """Returns the empty column matching the header name."""
+    if name in TEXT_COLUMNS:
+        return TextColumn()
+    if name in DATE_COLUMNS:
+        return DateColumn()
+    return IntColumn()
+
+
+def _mapped_chunks(mapped: mmap.mmap, start: int) -> Iterator[list[bytes]]:
+    """
+    Yields the lines of the memory-mapped file from `start` in blocks
+    of about CHUNK_BYTES, each block ending on a line boundary.
+    """
+    size = len(mapped)
+    while start < size:
+        end = mapped.find(b'\n', min(start + CHUNK_BYTES, size))
+        end = size if end == -1 else end + 1
+        block = mapped[start:end]
+        if b'\r' in block:
+            block = block.replace(b'\r', b'')
+        yield block.split(b'\n')
+        start = end
+
+
+def _line_chunks(lines: Iterable[str]) -> Iterator[list[str]]:
+    """Yields the given lines in chunks of CHUNK_ROWS, without line endings."""
+    lines = iter(lines)
+    while True:
+        chunk = [line.rstrip('\r\n') for line in islice(lines, CHUNK_ROWS)]
+        if not chunk:
+            return
+        yield chunk
+
+
+def load_csv_columns(csv_filename: str) -> CsvColumns:
+    """
+    This function memory-maps the CSV file and parses it into
+    typed columns, without holding a list of the file rows.
+    """
+    with open(csv_filename, 'rb') as file:
+        # Memory mapping an empty file is not allowed, there is
+        # nothing to parse in that case anyway.
+        if not file.seek(0, 2):
+            return CsvColumns([])
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            header = next(csv.reader([mapped.readline().rstrip(b'\r\n').decode('utf-8')]))
+            columns = CsvColumns(header)
+            columns.feed(_mapped_chunks(mapped, mapped.tell()))
+    return columns
+
+
+def columns_from_lines(csv_lines: list[str]) -> CsvColumns:
+    """
+    This function builds the typed columns from rows that have
+    already been read, the first row being the header.
+    """
+    if not csv_lines:
+        return CsvColumns([])
+    columns = CsvColumns(next(csv.reader([csv_lines[0].rstrip('\r\n')])))
+    columns.feed(_line_chunks(islice(csv_lines, 1, None)))
+    return columns
+
+
+def calendar_series(columns: CsvColumns, name: str) -> RollingSeries:
+    """
+    This function returns the rolling series of a metric column over
+    calendar days, from the latest day holding a value, with the blank
+    (and missing) days counted as zero.
+    """
+    column = columns[name]
+    days = compress(columns['date'].ordinals, column.mask)
+    return RollingSeries.from_days(zip(days, column.values))
+
+
+def headline_metrics(columns: CsvColumns) -> tuple[int, int, int]:
+    """
+    This function computes the last7days_cases, current_hospital_cases
+    and total_deaths from the typed columns, matching the row based
+    rules of process_covid_csv_data.
+    """
+    if not len(columns):
+        return 0, 0, 0
+    # The latest non blank cumulative deaths figure.
+    deaths = columns['cumDailyNsoDeathsByDeathDate']
+    total_deaths = next(iter(deaths.present_values(1)), 0)
+    # The hospital cases of the first data row.
+    current_hospital_cases = columns['hospitalCases'][0] or 0
+    # The new cases of the seven days before the latest one reported,
+    # which represents the `yesterday's` incomplete count.
+    last7days_cases = calendar_series(columns, 'newCasesBySpecimenDate').window_sum(7)
+    return last7days_cases, current_hospital_cases, total_deaths
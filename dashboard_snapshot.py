@@ -0,0 +1,78 @@
+"""
+This python file contains the precomputed dashboard snapshot. The
+snapshot holds the values shown on the dashboard and their rendered
+HTML, and is only rebuilt when a data update lands or the user
+changes something, instead of on every page load.
+"""
+
+import hashlib
+import threading
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Callable, Hashable, Mapping, Optional
+
+
+@dataclass(frozen=True)
+class DashboardSnapshot:
+    """
+    An immutable view of the dashboard, `version` identifies the
+    data it was built from and `etag` the rendered HTML.
+    """
+    version: Hashable
+    context: Mapping
+    html: str
+    etag: str
+
+
+class SnapshotCache:
+    """
+    This class keeps the latest snapshot and rebuilds it, once, when
+    it is requested for a version other than the one it was built for.
+    """
+
+    def __init__(self, build_context: Callable[[], dict],
+                 render: Callable[[Mapping], str]) -> None:
+        self._build_context = build_context
+        self._render = render
+        self._snapshot: Optional[DashboardSnapshot] = None
+        self._lock = threading.Lock()
+        # Requests served from the snapshot, and rebuilds
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version: Hashable) -> DashboardSnapshot:
+        """Returns the snapshot for the given version, rebuilding it if stale."""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            self.hits += 1
+            return snapshot
+        with self._lock:
+            # Another request may have rebuilt it while waiting.
+            snapshot = self._snapshot
+            if snapshot is None or snapshot.version != version:
+                self.misses += 1
+                snapshot = build_snapshot(version, self._build_context(), self._render)
+                self._snapshot = snapshot
+            else:
+                self.hits += 1
+        return snapshot
+
+    def peek(self, version: Hashable) -> Optional[DashboardSnapshot]:
+        """Returns the snapshot if it is built for the given version, never rebuilding it."""
+        snapshot = self._snapshot
+        if snapshot is not None and snapshot.version == version:
+            self.hits += 1
+            return snapshot
+        return None
+
+
+def build_snapshot(version: Hashable, context: dict,
+                   render: Callable[[Mapping], str]) -> DashboardSnapshot:
+    """
+    This function renders the given context and wraps it, with
+    the ETag of the HTML, into an immutable snapshot.
+    """
+    context = MappingProxyType(dict(context))
+    html = render(context)
+    etag = hashlib.sha1(html.encode('utf-8')).hexdigest()
+    return DashboardSnapshot(version=version, context=context, html=html, etag=etag)
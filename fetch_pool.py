@@ -0,0 +1,152 @@
+"""
+This python file contains the helpers used for fetching data from the
+upstream APIs concurrently: a bounded pool of workers, a per-host rate
+limiter and a retry with exponential backoff of the transient failures,
+for the blocking requests and the asyncio ones alike.
+"""
+
+import re
+import time
+import asyncio
+import random
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Hashable, Iterable, TypeVar
+import requests
+from uk_covid19.exceptions import FailedRequestError
+try:
+    import httpx
+except ImportError:
+    # httpx is only needed by the asynchronous serving mode.
+    httpx = None
+
+T = TypeVar('T')
+
+# The HTTP statuses worth retrying: throttled (429) and the server's errors.
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# The `Cov19API` library only keeps the status of a failed request in the
+# message of its FailedRequestError ("Request failed .... 503 - ...").
+_FAILED_REQUEST_STATUS = re.compile(r'Request failed \.+ (\d{3})')
+
+
+class RateLimiter:
+    """
+    This class spaces out the calls made to each host, so that no
+    host receives more than `requests_per_second` calls. Callers
+    reserve the next free slot and then sleep until it is reached.
+    """
+
+    def __init__(self, requests_per_second: float) -> None:
+        self.interval = 1 / requests_per_second if requests_per_second else 0
+        self._next_slot: dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, host: str) -> None:
+        """Blocks until a call can be made to the given host."""
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(host, now))
+            self._next_slot[host] = slot + self.interval
+        # Sleep outside of the lock, the slot is already reserved.
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    Returns whether the error may not happen again on a retry: a timeout,
+    a connection error, or a throttled or failed (5xx) HTTP response.
+    Other errors (such as a 404, or a bug) are raised straight away.
+    """
+    if isinstance(error, (requests.Timeout, requests.ConnectionError,
+                          TimeoutError, ConnectionError)):
+        return True
+    response = getattr(error, 'response', None)
+    if isinstance(error, requests.HTTPError) and response is not None:
+        return response.status_code in RETRY_STATUSES
+    if isinstance(error, FailedRequestError):
+        status = _FAILED_REQUEST_STATUS.search(str(error))
+        return status is not None and int(status.group(1)) in RETRY_STATUSES
+    if httpx is not None:
+        if isinstance(error, httpx.TransportError):
+            return True
+        if isinstance(error, httpx.HTTPStatusError):
+            return error.response.status_code in RETRY_STATUSES
+    return False
+
+
+def backoff_delay(attempt: int, base_delay: float, max_delay: float) -> float:
+    """
+    Returns the wait before the retry following the given (0 based)
+    attempt. It doubles every attempt, with some jitter so callers do
+    not retry in lockstep.
+    """
+    delay = min(max_delay, base_delay * 2 ** attempt)
+    return delay * random.uniform(0.5, 1)
+
+
+def retry_with_backoff(function: Callable[[], T], retries: int = 3,
+                       base_delay: float = 0.5, max_delay: float = 30,
+                       retry_on: Callable[[Exception], bool] = is_transient) -> T:
+    """
+    This function calls the given function, and when it raises a
+    transient error (as told by `retry_on`), calls it again up to
+    `retries` more times. The waits in between double every attempt,
+    with some jitter so callers do not retry in lockstep.
+    """
+    attempt = 0
+    while True:
+        try:
+            return function()
+        except Exception as error:
+            if attempt >= retries or not retry_on(error):
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            logging.warning('Upstream request failed, retrying in %.2f Seconds', delay)
+            time.sleep(delay)
+            attempt += 1
+
+
+async def async_retry_with_backoff(function: Callable[[], Awaitable[T]], retries: int = 3,
+                                   base_delay: float = 0.5, max_delay: float = 30,
+                                   retry_on: Callable[[Exception], bool] = is_transient) -> T:
+    """
+    This function awaits the given coroutine function with the retry
+    policy of retry_with_backoff, sleeping on the event loop in between.
+    """
+    attempt = 0
+    while True:
+        try:
+            return await function()
+        except Exception as error:
+            if attempt >= retries or not retry_on(error):
+                raise
+            delay = backoff_delay(attempt, base_delay, max_delay)
+            logging.warning('Upstream request failed, retrying in %.2f Seconds', delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+
+def fetch_concurrently(keys: Iterable[Hashable], fetch: Callable[[Hashable], T],
+                       max_workers: int = 8) -> tuple[dict, dict]:
+    """
+    This function calls `fetch` for every key on a pool of at most
+    `max_workers` threads. It returns two dicts keyed like the input,
+    one with the results and one with the exceptions of failed keys.
+    """
+    keys = list(dict.fromkeys(keys))
+    results, failures = {}, {}
+    if not keys:
+        return results, failures
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(keys))) as pool:
+        futures = {key: pool.submit(fetch, key) for key in keys}
+        for key, future in futures.items():
+            try:
+                results[key] = future.result()
+            except Exception as error:
+                failures[key] = error
+    return results, failures
@@ -1,8 +1,25 @@
 """
-This python file holds the data structures necessary for
-updating the website interface data when the schedule
-module executes.
+This python file holds the state store shared by the scheduled
+updates and the web interface. Every update publishes a new,
+versioned snapshot of the data, which the web requests read:
+
+news_articles - the latest news articles
+local_data_from_api - the covid data of the local area
+area_data - the covid data of every tracked area, keyed by (location, location_type)
+area_series - the incrementally updated AreaSeries of each area, keyed the same way
+area_store_version - bumped whenever CSV dumps are ingested into the area store
 """
 
-news_articles = []
-local_data_from_api = []
+from state_store import StateStore
+
+# The keys which can be shared with other worker processes (JSON values).
+SHARED_KEYS = ('news_articles', 'local_data_from_api')
+
+
+def new_store() -> StateStore:
+    """Returns a state store holding the initial (empty) values."""
+    return StateStore(news_articles=[], local_data_from_api=[], area_data={}, area_series={},
+                      area_store_version=0)
+
+
+store = new_store()
@@ -0,0 +1,64 @@
+"""
+This python file contains the in-memory cache of the JSON API
+responses. A response is serialised, gzipped and hashed once per
+data version, and then served as is until the data changes.
+"""
+
+import gzip
+import json
+import hashlib
+import threading
+from dataclasses import dataclass
+from typing import Callable, Hashable
+
+
+@dataclass(frozen=True)
+class CachedJson:
+    """The serialised body of a response, gzipped, and its ETag."""
+    version: Hashable
+    body: bytes
+    gzipped: bytes
+    etag: str
+
+
+class JsonResponseCache:
+    """
+    This class caches one serialised response per key, the response
+    is built again once it is requested for another data version.
+    """
+
+    def __init__(self, max_entries: int = 1024) -> None:
+        self.max_entries = max_entries
+        self._entries: dict[Hashable, CachedJson] = {}
+        self._lock = threading.Lock()
+        # Responses served from the cache, and built
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: Hashable, build: Callable[[], object]) -> CachedJson:
+        """
+        Returns the cached response of the key for the given version,
+        building it with `build` (which returns the JSON data) if needed.
+        """
+        cached = self._entries.get(key)
+        if cached is not None and cached.version == version:
+            self.hits += 1
+            return cached
+        self.misses += 1
+        cached = serialise(version, build())
+        with self._lock:
+            if len(self._entries) >= self.max_entries and key not in self._entries:
+                # Entries of older versions are dropped first, they are never served again.
+                self._entries = {entry_key: entry for entry_key, entry in self._entries.items()
+                                 if entry.version == version}
+                if len(self._entries) >= self.max_entries:
+                    self._entries.clear()
+            self._entries[key] = cached
+        return cached
+
+
+def serialise(version: Hashable, data: object) -> CachedJson:
+    """This function serialises the data into compact JSON, gzipped and hashed."""
+    body = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    return CachedJson(version=version, body=body, gzipped=gzip.compress(body, 6),
+                      etag=hashlib.sha1(body).hexdigest())
@@ -6,156 +6,379 @@ dashboard that is very helpful when trying to attain updates
 on the recent developments of COVID-19.
 """
 
+# Imported first, the start up phases are timed from its import.
+from startup import IMPORT_STARTED, StartupProfile, print_report, profiling_enabled
+import os
+import sys
 import time
-import json
+import queue
+import atexit
 import logging
-from flask import Flask, render_template, request
+import threading
+from logging.handlers import QueueHandler, QueueListener
+from typing import Callable, Hashable, Optional
 import global_vars
+from state_store import SqliteStateBackend, StateSnapshot
+from news_exclusions import NewsExclusionIndex, article_key
+import metrics
+from single_flight import upstream_requests
+from recurrence import refresh_coalescer
+from dashboard_snapshot import SnapshotCache
+from update_registry import UpdateRegistry
+from json_cache import JsonResponseCache, CachedJson
+from rolling_metrics import RollingSeries, window_metrics
+from config_loader import load_config
+import payload_cache
 from scheduler import sched_instance
-from covid_news_handling import news_API_request
-from covid_news_handling import update_news
-from covid_news_handling import remove_unwanted_news
-from covid_data_handler import parse_csv_data
-from covid_data_handler import process_covid_csv_data
-from covid_data_handler import covid_API_request
-from covid_data_handler import schedule_covid_updates
-from time_conversions import hhmm_to_seconds
+from scheduler import start_scheduler_worker
+from time_conversions import seconds_until
+from recurrence import DailyAt, Every, RecurringJob
+from area_store import AreaStore, STORE_FILE
+from rollups import AreaHierarchy, area_rollups
+from series_pyramid import AGGREGATIONS, DEFAULT_METRIC, DEFAULT_POINTS, MAX_POINTS
+from series_pyramid import RESOLUTIONS, PyramidCache, column_points, daily_points
 
+# Importing this module is kept cheap: Flask, the data handlers (and
+# through them requests and uk_covid19), the config and the data are
+# loaded by create_app, when the application is first used (main.app),
+# or by the background warm-up it starts.
+startup_profile = StartupProfile(IMPORT_STARTED)
 
-# Initialize the logging mechanism
-logging.basicConfig(filename='sys.log', level=logging.INFO,
-                    format="%(levelname)s | %(asctime)s | %(message)s")
+# Data structures for handling the deleted news
+# and updates respectively, the deleted news are
+# loaded from the cache file once the config is read.
+deleted_news = NewsExclusionIndex()
+update_registry = UpdateRegistry()
+# Incremented on every change made by the user (deleted news,
+# added or deleted updates), together with the data_version it
+# identifies the dashboard snapshot.
+user_changes_version = 0
 
-app = Flask(__name__)
+# Basic information passed to the HTML template, customizable
+# through the json.config (read by create_app).
+config_data = {}
+file_name = title = image = covid_content = news_content = None
 
-# Useful for rapid development, for production comment the following
-# line. This allows the webpage to refresh and update content whenever
-# any file changes
-app.debug = True
+# Assume no national data until the CSV has been parsed.
+nation_location = ''
+csv_covid_data = None
+# Counts the loads of the CSV, the version of the nation's chart data.
+csv_covid_version = 0
+last7days_cases, current_hospital_cases, total_deaths = 0, 0, 0
 
-# Data structures for handling the deleted news
-# and updates respectively
-deleted_news_list = []
-updates_list = []
+# The area store of the daily CSV dumps, when a directory is set in the config,
+# and whether its rows have been handed to the rollups by this process.
+area_store = None
+area_store_rolled_up = False
 
-# Basic information passed to the HTML template, customizable
-# through the json.config.
-try:
-    with open("config.json", "r", encoding='utf-8') as jsonfile:
-        config_data = json.load(jsonfile)
-except Exception:
-    logging.critical('Config file could not be opened, '
-                     'please check the path or the existence of the file.')
-
-try:
-    # File name/path for the CSV data to be embedded
-    file_name = config_data['file_name']
-    # The main title of the dashboard
-    title = config_data['title']
-    # The image name/filepath for the dashboard logo/banner
-    image = config_data['image']
-    # A prompt message to specify the type of update in the
-    # updates column found in the dashboard.
-    covid_content = config_data['covid_content']
-    news_content = config_data['news_content']
-except Exception:
-    logging.critical('One or more keys have not been found in the '
-                     'config.json file, please ensure all of the keys/parameters configured.')
-
-try:
-    # Retrieve the news articles using the function call
-    global_vars.news_articles = news_API_request()['articles']
-
-    # Retrieve the covid data using the function call
-    global_vars.local_data_from_api = covid_API_request()
-except:
-    logging.error('Could not complete the fetching of Covid and/or News data '
-                  'through the APIs. Please check the network connection or the API key')
-
-try:
-    # Parse the csv data, deduce the location provided in the
-    # CSV data and by the function call, calculate the
-    # last7days_cases, current_hospital_cases, total_deaths
-    # variables required for the interface.
-    csv_covid_data = parse_csv_data(file_name)
-    nation_location = csv_covid_data[1].split(',')[1]
-    last7days_cases, current_hospital_cases, total_deaths = process_covid_csv_data(
-        csv_covid_data)
-except:
-    logging.error('Could not parse the local CSV data, please '
-                  'check the existence/correctness of the file and its\' name/path')
-
-
-@app.route("/index", methods=['GET'])
+# Set once the background warm-up has loaded the data, the requests
+# showing the national data wait for it (at most WARM_UP_TIMEOUT seconds).
+warmed_up = threading.Event()
+WARM_UP_TIMEOUT = 30
+
+# The seconds for which the start up refresh of one worker process
+# stands for all of them.
+REFRESH_CLAIM_SECONDS = 60
+
+# When served by asgi_app, the event loop makes the start up refresh
+# with non-blocking requests instead of the scheduler worker.
+SERVING_MODE = os.environ.get('DASHBOARD_SERVING', 'wsgi')
+
+# The routes of the dashboard, as (rule, view function, options),
+# registered on the Flask application by create_app.
+routes = []
+
+
+def route(rule: str, **options):
+    """This function records the decorated view function as the route of the rule."""
+    def register(view):
+        routes.append((rule, view, options))
+        return view
+    return register
+
+
+def setup_logging() -> None:
+    """
+    This function initializes the logging mechanism. The records are
+    queued by the requests and written to the file by a background
+    thread, so the disk I/O is kept off the request path.
+    """
+    log_queue = queue.SimpleQueue()
+    log_file_handler = logging.FileHandler('sys.log')
+    log_file_handler.setFormatter(logging.Formatter("%(levelname)s | %(asctime)s | %(message)s"))
+    log_listener = QueueListener(log_queue, log_file_handler)
+    logging.basicConfig(level=logging.INFO, handlers=[QueueHandler(log_queue)])
+    log_listener.start()
+    atexit.register(log_listener.stop)
+
+
+def load_settings() -> None:
+    """
+    This function reads the config.json, and opens the caches and
+    stores it sets up (none of which needs the network).
+    """
+    global config_data, file_name, title, image, covid_content, news_content
+    global deleted_news, area_store
+    try:
+        config_data = load_config()
+    except Exception:
+        config_data = {}
+        logging.critical('Config file could not be opened, '
+                         'please check the path or the existence of the file.')
+
+    try:
+        # File name/path for the CSV data to be embedded
+        file_name = config_data['file_name']
+        # The main title of the dashboard
+        title = config_data['title']
+        # The image name/filepath for the dashboard logo/banner
+        image = config_data['image']
+        # A prompt message to specify the type of update in the
+        # updates column found in the dashboard.
+        covid_content = config_data['covid_content']
+        news_content = config_data['news_content']
+    except Exception:
+        logging.critical('One or more keys have not been found in the '
+                         'config.json file, please ensure all of the keys/parameters configured.')
+
+    # Start up from the last good Covid and News data kept in the on-disk
+    # cache, the fresh data is fetched by the scheduler worker in the
+    # background so the start up never waits on the APIs.
+    payload_cache.enable(config_data.get('cache_file', payload_cache.CACHE_FILE))
+    # With several worker processes (such as gunicorn's), the fetched data
+    # is shared through the state file, when one is set in the config.
+    if config_data.get('state_file'):
+        global_vars.store.attach_backend(
+            SqliteStateBackend(config_data['state_file'], global_vars.SHARED_KEYS))
+    # The news removed by the user are kept with the cached data.
+    deleted_news = NewsExclusionIndex(config_data.get('cache_file', payload_cache.CACHE_FILE))
+    # The daily CSV dumps of every area type, when a directory is set in
+    # the config, are ingested into the area store by the scheduler worker.
+    if config_data.get('csv_directory'):
+        area_store = AreaStore(config_data.get('area_store_file', STORE_FILE))
+
+
+def restore_cached_data() -> None:
+    """This function publishes the News and Covid data kept in the on-disk cache."""
+    from covid_news_handling import restore_cached_news
+    from covid_data_handler import restore_cached_covid_data
+    if not restore_cached_news():
+        logging.info('No cached News data, waiting for the first fetch.')
+    if not restore_cached_covid_data():
+        logging.info('No cached Covid data, waiting for the first fetch.')
+
+
+def load_national_data() -> None:
+    """
+    This function loads the csv data into typed columns, deduces the
+    location provided in the CSV data and calculates the
+    last7days_cases, current_hospital_cases, total_deaths
+    variables required for the interface.
+    """
+    global csv_covid_data, csv_covid_version, nation_location
+    global last7days_cases, current_hospital_cases, total_deaths
+    from covid_data_handler import load_csv_columns, process_covid_csv_data
+    try:
+        csv_covid_data = load_csv_columns(file_name)
+        csv_covid_version += 1
+        nation_location = csv_covid_data['areaName'][0]
+        last7days_cases, current_hospital_cases, total_deaths = process_covid_csv_data(
+            csv_covid_data)
+    except:
+        logging.error('Could not parse the local CSV data, please '
+                      'check the existence/correctness of the file and its\' name/path')
+
+
+def load_area_hierarchy() -> None:
+    """
+    This function sets the parent of each area, for the rollups of the
+    local areas' data up to their utla, region and nation, when set in
+    the config.
+    """
+    if config_data.get('area_hierarchy_file'):
+        try:
+            area_rollups.set_hierarchy(
+                AreaHierarchy.from_lookup_csv(config_data['area_hierarchy_file']))
+        except (OSError, KeyError, ValueError):
+            logging.error('Could not load the area hierarchy, please check the '
+                          'existence/correctness of the area_hierarchy_file')
+
+
+def refresh_data_from_apis() -> None:
+    """
+    This function retrieves the latest News and Covid data, it is run
+    by the scheduler worker at start up. A failure of one does not
+    prevent the other, both are logged. With a shared state file, only
+    the first worker process fetches, the others pick up its data.
+    """
+    from covid_news_handling import news_API_request
+    from covid_data_handler import covid_API_request
+    try:
+        # Retrieve the news articles using the function call
+        if global_vars.store.claim('news', REFRESH_CLAIM_SECONDS):
+            news_API_request()
+    except Exception:
+        logging.error('Could not complete the fetching of News data through the API. '
+                      'Please check the network connection or the API key')
+    try:
+        # Retrieve the covid data using the function call
+        if global_vars.store.claim('covid', REFRESH_CLAIM_SECONDS):
+            covid_API_request(incremental=True)
+    except Exception:
+        logging.error('Could not complete the fetching of Covid data through the API. '
+                      'Please check the network connection')
+
+
+def ingest_csv_dumps() -> None:
+    """
+    This function ingests the new or changed CSV dumps of the directory,
+    and publishes a new data version when rows were upserted. The rows of
+    the local areas of the ingested dumps are then handed to the rollups,
+    which only add the ones that changed to the totals of their parents.
+    On the first ingest after a restart, every local area is handed over.
+    """
+    global area_store_rolled_up
+    changed = set()
+    summary = area_store.ingest_directory(config_data['csv_directory'], changed)
+    logging.info('Ingested the CSV dumps: %s', summary)
+    if summary['ingested'] or not area_store_rolled_up:
+        leaf_level = area_rollups.leaf_level
+        codes = None
+        if area_store_rolled_up:
+            codes = [code for level, code in changed if level == leaf_level]
+        if codes is None or codes:
+            for batch in area_store.row_batches(leaf_level, codes):
+                area_rollups.update_area(batch)
+        area_store_rolled_up = True
+        global_vars.store.transact(
+            lambda state: {'area_store_version': state.area_store_version + 1})
+
+
+def start_scheduled_work() -> None:
+    """
+    This function starts the background worker thread running the
+    scheduled data updates, off the path of the web requests. The updated
+    data is published to the state store, which the next request then
+    picks up. The first update refreshes the data restored from the cache
+    (unless turned off in the config, such as for the offline benchmarks,
+    or made by the event loop of asgi_app), and the CSV dumps are
+    ingested at start up and then every `csv_ingest_interval` seconds.
+    """
+    if area_store is not None:
+        sched_instance.enter(delay=0, priority=3, action=ingest_csv_dumps)
+        RecurringJob(Every(config_data.get('csv_ingest_interval', 3600)), ingest_csv_dumps,
+                     priority=3, key='csv').start()
+    if config_data.get('refresh_on_start', True) and SERVING_MODE != 'asgi':
+        sched_instance.enter(delay=0, priority=1, action=refresh_data_from_apis)
+    start_scheduler_worker()
+
+
+def warm_up() -> None:
+    """
+    This function is the background warm-up started by create_app: it
+    loads the data, in order, and then starts the scheduled work (so the
+    start up refresh is published after the cached data). A failed step
+    is logged and does not prevent the next ones.
+    """
+    try:
+        for name, step in (('restore cache', restore_cached_data),
+                           ('national CSV', load_national_data),
+                           ('area hierarchy', load_area_hierarchy),
+                           ('scheduler', start_scheduled_work)):
+            try:
+                with startup_profile.phase(name):
+                    step()
+            except Exception:
+                logging.exception('The %s step of the start up failed', name)
+    finally:
+        if profiling_enabled():
+            print_report(startup_profile)
+        warmed_up.set()
+
+
+# Serialises the creation of the application, first used from any thread.
+app_lock = threading.Lock()
+
+
+def create_app():
+    """
+    This function creates the Flask application of the dashboard, once:
+    it sets up the logging, reads the config, imports Flask and registers
+    the routes, and starts the background warm-up loading the data. It is
+    called on the first use of main.app, or directly.
+    """
+    global app
+    with app_lock:
+        if 'app' in globals():
+            return app
+        with startup_profile.phase('logging'):
+            setup_logging()
+        with startup_profile.phase('config'):
+            load_settings()
+        with startup_profile.phase('flask app'):
+            from flask import Flask
+            flask_app = Flask(__name__)
+            # The news delete buttons identify the article by its key.
+            flask_app.add_template_filter(article_key)
+            for rule, view, options in routes:
+                flask_app.add_url_rule(rule, view_func=view, **options)
+            # Useful for rapid development, for production comment the following
+            # line. This allows the webpage to refresh and update content whenever
+            # any file changes
+            flask_app.debug = True
+        threading.Thread(target=warm_up, name='startup-warm-up', daemon=True).start()
+        app = flask_app
+        return app
+
+
+def __getattr__(name: str):
+    """Creates the application on the first use of main.app (PEP 562)."""
+    if name == 'app':
+        return create_app()
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
+
+
+@route("/index", methods=['GET'])
 def home():
     """
     The webserver containing the elements and logic needed
     to calculate the required information and render it in the
     HTML template.
     """
+    from flask import request, make_response, abort
     # For the lifetime of the server, use the following global variables.
-    global deleted_news_list
-    global updates_list
-    global sched_instance
-
-    # The implemented HTML template has the following meta tag
-    # <meta http-equiv="refresh" content="60;url='/index'">
-    # which refreshed the website. The following statement checks
-    # the queue for any possible data update, and when the delay
-    # or time interval passes, it becomes ready for execution
-    # and the following line executes it.
-    logging.info('Next scheduled update: %s Seconds', str(sched_instance.run(blocking=False)))
-
-    # Assume zero infections and then traverse the
-    # last 7 days data, excluding the first
-    # as it is incomplete, and sum the number of infections
-    local_7day_infections = 0
-    for day in global_vars.local_data_from_api['data'][1:8]:
-        local_7day_infections += day['newCasesBySpecimenDate']
-    # Retrieve dynamically the area name from the data
-    # retrieved from the function call.
-    location = global_vars.local_data_from_api['data'][0]['areaName']
+    global user_changes_version
 
     # If a delete update button has been pressed, retrieve the identifier
-    # which is the title of the update
+    # which is the id of the update (or its title, for older pages)
     delete_update = request.args.get('update_item')
     if delete_update:
         logging.info('Deleting the following update: %s', delete_update)
-        # Traverse all the updates list elements
-        for i in range(len(updates_list)):
-            # If the title matches the input of the user (by pressing
-            # the delete button on the update)
-            if updates_list[i]['title'] == delete_update:
-                # Cancel the scheduled element and remove it from the
-                # queue
-                try:
-                    sched_instance.cancel(updates_list[i]['event_handler'])
-                # If the element is not in the queue anymore, (if it is already
-                # executed), do not halt the application, proceed with the
-                # remaining logic, of removing from the web interface.
-                except ValueError:
-                    logging.warning('The event_handler could not be found, '
-                                    'might already be executed')
-                # And delete it from the updates_list, to remove it from
-                # the interface
-                del updates_list[i]
-                logging.info('Deleted the following update: %s', delete_update)
-                break
-
-    # If the delete button of the news is pressed,
-    # maintain the list of unwanted news.
+        # Cancel every scheduled event of the update and remove it
+        # from the interface.
+        if delete_update.isdigit():
+            deleted = [update_registry.cancel(int(delete_update))]
+        else:
+            deleted = update_registry.cancel_title(delete_update)
+        if any(deleted):
+            user_changes_version += 1
+            logging.info('Deleted the following update: %s', delete_update)
+
+    # If the delete button of the news is pressed, add the
+    # article's key (or, for older pages, its title) to the
+    # index of unwanted news.
     delete_news = request.args.get('notif')
     if delete_news:
         logging.info('Deleting the following news: %s', delete_news)
-        if delete_news not in deleted_news_list:
-            deleted_news_list.append(delete_news)
+        if len(delete_news) == 32 and all(char in '0123456789abcdef' for char in delete_news):
+            deleted = deleted_news.exclude(delete_news)
+        else:
+            deleted = deleted_news.exclude_title(
+                delete_news, global_vars.store.snapshot().news_articles)
+        if deleted:
+            user_changes_version += 1
             logging.info('Deleted the following news: %s', delete_news)
 
-    # After that, use the function call to subtract the unwanted news articles
-    # and update the list.
-    global_vars.news_articles = remove_unwanted_news(
-        news_articles=global_vars.news_articles, news_to_be_excluded=deleted_news_list)
-
     # Check if the add update form has been clicked and includes the mandatory
     # textfield for the label.
     update_text = request.args.get('two')
@@ -169,68 +392,432 @@ def home():
         covid_data_flag = request.args.get('covid-data')
         news_flag = request.args.get('news')
 
-        # Then take a time stamp for the current time and calculate the absolute
-        # difference between the user entered time and the time of adding the
-        # update.
+        # Then take a time stamp for the current time and calculate the
+        # seconds until the next occurrence of the user entered time,
+        # which is tomorrow when it has already passed today. A malformed
+        # time is rejected before anything is scheduled or invalidated.
         curr_time = time.localtime(time.time())
-        current_time = str(curr_time.tm_hour)+':'+str(curr_time.tm_min)
-        update_interval = abs(hhmm_to_seconds(
-            update_time)-hhmm_to_seconds(current_time))
+        try:
+            update_interval = seconds_until(update_time or '')
+        except ValueError:
+            update_interval = None
+        if update_interval is None:
+            logging.error('Could not add the update, malformed time: %s', update_time)
+            abort(400)
 
         # Then prepare an informative string, used in the ['content'] part of the
         # update.
         update_content = ', initiated at ' + str(curr_time.tm_year)+'-' + \
-            str(curr_time.tm_mday)+'-'+str(curr_time.tm_mday)+' - ' + \
+            str(curr_time.tm_mon)+'-'+str(curr_time.tm_mday)+' - ' + \
             str(curr_time.tm_hour)+':'+str(curr_time.tm_min)+':' + \
             str(curr_time.tm_sec)
-        update_content += ', with a delay of (Seconds) '
+        if repeat_flag:
+            # A repeated update recurs every day at the entered time.
+            rule = DailyAt.from_hhmm(update_time)
+            update_content += ', repeating ' + str(rule) + ', first in (Seconds) '
+        else:
+            update_content += ', with a delay of (Seconds) '
+        user_changes_version += 1
+        # The data handlers are loaded by the warm-up, but may not be yet.
+        from covid_data_handler import schedule_covid_updates, schedule_recurring_covid_updates
+        from covid_news_handling import update_news, schedule_recurring_news_updates
 
         # If the covid data flag is selected (update the covid data)
         # Use the function call to add an update to the queue, and
-        # append the update to the updates_list for proper viewing
-        # in the interface.
+        # register the update for proper viewing in the interface.
+        fire_time = time.time() + update_interval
+        new_updates = []
         if covid_data_flag:
-            event = schedule_covid_updates(update_interval, update_text)
-            updates_list.append({'title': update_text, 'content': covid_content +
-                                update_content+str(update_interval), 'event_handler': event})
+            if repeat_flag:
+                handle = schedule_recurring_covid_updates(rule, update_text)
+            else:
+                handle = schedule_covid_updates(update_interval, update_text)
+            new_updates.append((update_text, covid_content+update_content+str(update_interval),
+                                fire_time, [handle]))
             logging.info('Added the following update: %s %s %s',
                          covid_content, update_content, str(update_interval))
-            if repeat_flag:
-                event = schedule_covid_updates(
-                    update_interval+86400, update_text)
-                updates_list.append({'title': update_text, 'content':
-                                     covid_content + update_content+str(update_interval+86400),
-                                     'event_handler': event})
-                logging.info('Added the following update: %s %s %s through'
-                             'the usage of the repeat flag.',
-                             covid_content, update_content, str(update_interval+86400))
 
         # The same is true as for the covid_data_flag.
         if news_flag:
-            event = update_news(update_text, update_interval=update_interval)
-            updates_list.append({'title': update_text, 'content': news_content +
-                                update_content+str(update_interval), 'event_handler': event})
+            if repeat_flag:
+                handle = schedule_recurring_news_updates(rule, update_text)
+            else:
+                handle = update_news(update_text, update_interval=update_interval)
+            new_updates.append((update_text, news_content+update_content+str(update_interval),
+                                fire_time, [handle]))
             logging.info('Added the following update: %s %s %s',
                          news_content, update_content, str(update_interval))
-            if repeat_flag:
-                event = update_news(
-                    update_text, update_interval=update_interval+86400)
-                updates_list.append({'title': update_text, 'content': news_content +
-                                    update_content+str(update_interval+86400),
-                                    'event_handler': event})
-                logging.info('Added the following update: %s %s %s '
-                             'through the usage of the repeat flag.',
-                             news_content, update_content, str(update_interval+86400))
-
-    # After setting all the variables in the proper format, pass them to the template
-    # for flask to prepare the HTML's response.
-    return render_template("index.html",news_articles=global_vars.news_articles,
-                           nation_location=nation_location,
-                           national_7day_infections=last7days_cases,
-                           deaths_total=total_deaths, hospital_cases=current_hospital_cases,
-                           location=location, local_7day_infections=local_7day_infections,
-                           image=image, title=title, updates=updates_list)
+        update_registry.add_many(new_updates)
+
+    # Serve the pre-rendered dashboard, rebuilt only when the data or the
+    # user's changes have moved on since it was built. When the browser
+    # already holds this version (If-None-Match) a 304 is returned instead.
+    snapshot = dashboard_snapshots.get(data_version())
+    response = make_response(snapshot.html)
+    response.set_etag(snapshot.etag)
+    response.headers['Cache-Control'] = 'no-cache'
+    return response.make_conditional(request)
+
+
+def build_dashboard_context() -> dict:
+    """
+    This function calculates the values shown on the dashboard
+    from the latest data and the user's changes.
+    """
+    # The national data is loaded by the warm-up, which the first
+    # snapshot waits for.
+    warmed_up.wait(WARM_UP_TIMEOUT)
+    # Read all the data from one snapshot, so the values shown
+    # are consistent with each other.
+    state = global_vars.store.snapshot()
+    location, local_7day_infections = local_figures(state)
+    news_articles = shown_news(state)
+
+    return {'news_articles': news_articles, 'nation_location': nation_location,
+            'national_7day_infections': last7days_cases, 'deaths_total': total_deaths,
+            'hospital_cases': current_hospital_cases, 'location': location,
+            'local_7day_infections': local_7day_infections, 'image': image,
+            'title': title, 'updates': list(update_registry)}
+
+
+def local_figures(state) -> tuple[str, int]:
+    """
+    This function returns the name of the local area and its number of
+    infections over the last 7 days, from the state snapshot.
+    """
+    # Sum the number of infections over the last 7 days data,
+    # excluding the first as it is incomplete.
+    local_data = (state.local_data_from_api or {}).get('data') or []
+    local_7day_infections = local_seven_day_sum(state, local_data)
+    # Retrieve dynamically the area name from the data
+    # retrieved from the function call (unless none has been yet).
+    location = local_data[0]['areaName'] if local_data else 'your area (data pending)'
+    return location, local_7day_infections
+
+
+def shown_news(state) -> list[dict]:
+    """
+    This function returns the news articles of the state snapshot
+    without the ones deleted by the user.
+    """
+    from covid_news_handling import remove_unwanted_news
+    # Use the function call to subtract the unwanted news articles, the
+    # stored articles are left whole and only filtered for the view.
+    with metrics.news_filter_seconds.time():
+        return remove_unwanted_news(
+            news_articles=state.news_articles, news_to_be_excluded=deleted_news)
+
+
+def local_seven_day_sum(state, local_data: list[dict]) -> int:
+    """
+    This function returns the 7-day sum of the local area's new cases,
+    as kept up to date by the area's series while rows are merged into
+    it. Data not held as a series (such as picked up from the state file
+    of another worker process) is summed from its rows instead.
+    """
+    if local_data:
+        latest = local_data[0]
+        series = state.area_series.get((latest.get('areaName'), latest.get('areaType')))
+        if series is not None and series.latest_date == latest['date']:
+            return series.seven_day_sum
+    return RollingSeries.from_rows(local_data, 'newCasesBySpecimenDate').window_sum(7)
+
+
+def render_dashboard(context: dict) -> str:
+    """
+    After setting all the variables in the proper format, pass them to the
+    template for flask to prepare the HTML's response.
+    """
+    from flask import render_template
+    with metrics.template_render_seconds.time():
+        return render_template("index.html", **context)
+
+
+# The latest dashboard snapshot, shared by all the requests.
+dashboard_snapshots = SnapshotCache(build_dashboard_context, render_dashboard)
+
+# The serialised JSON API responses, per endpoint and data version.
+json_responses = JsonResponseCache()
+
+
+def json_response(cached: CachedJson):
+    """
+    This function prepares the response of a cached JSON body, gzipped
+    when the client accepts it, answering 304 when the client already
+    holds it.
+    """
+    from flask import request, make_response
+    if 'gzip' in request.accept_encodings:
+        response = make_response(cached.gzipped)
+        response.headers['Content-Encoding'] = 'gzip'
+    else:
+        response = make_response(cached.body)
+    response.mimetype = 'application/json'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = 'no-cache'
+    response.set_etag(cached.etag)
+    return response.make_conditional(request)
+
+
+def data_version(state: Optional[StateSnapshot] = None) -> tuple[int, int]:
+    """
+    Returns the version of the data and of the user's changes. A cached
+    response built from a snapshot is keyed on that snapshot's version,
+    so a publish racing the build cannot cache stale data under the new one.
+    """
+    version = global_vars.store.version if state is None else state.version
+    return version, user_changes_version
+
+
+@route("/api/headline", methods=['GET'])
+def api_headline():
+    """
+    The national and local headline metrics shown on the dashboard,
+    computed from the state snapshot without rendering the dashboard.
+    """
+    state = global_vars.store.snapshot()
+
+    def build() -> dict:
+        warmed_up.wait(WARM_UP_TIMEOUT)
+        location, local_7day_infections = local_figures(state)
+        return {'national': {'location': nation_location,
+                             'last7days_cases': last7days_cases,
+                             'current_hospital_cases': current_hospital_cases,
+                             'total_deaths': total_deaths},
+                'local': {'location': location,
+                          'last7days_cases': local_7day_infections}}
+    return json_response(json_responses.get('headline', data_version(state), build))
+
+
+@route("/api/areas/<location_type>/<location>/series", methods=['GET'])
+def api_area_series(location_type: str, location: str):
+    """The daily series of a tracked area, latest first."""
+    from flask import abort
+    state = global_vars.store.snapshot()
+    series = state.area_series.get((location, location_type))
+    if series is None and (location, location_type) not in state.area_data \
+            and area_store is None:
+        abort(404)
+
+    def build() -> dict:
+        if series is not None:
+            return series.payload()
+        if (location, location_type) in state.area_data:
+            return state.area_data[(location, location_type)]
+        # Otherwise from the ingested CSV dumps
+        return area_store.series(location, location_type)
+    cached = json_responses.get(('series', location_type, location), data_version(state), build)
+    if cached.body == b'null':
+        abort(404)
+    return json_response(cached)
+
+
+# The chart series of every area and metric, per version of the area's data.
+series_pyramids = PyramidCache()
+
+
+def area_chart_source(location_type: str, location: str, metric: str,
+                      state: StateSnapshot) -> tuple[Hashable, Callable[[], list]]:
+    """
+    This function returns the version of the area's data and a function
+    returning the daily points of the area's metric, from the fetched
+    data, the ingested CSV dumps or (for the nation) the local CSV,
+    whichever holds the area first. The version only changes with the
+    area's data, so the refreshes of other areas or of the news keep
+    the area's pyramid.
+    """
+    area = (location, location_type)
+    if area in state.area_series:
+        series = state.area_series[area]
+        return (('series', series.latest_date, len(series)),
+                lambda: daily_points(series.payload()['data'], metric))
+    if area in state.area_data:
+        data = state.area_data[area]['data']
+        return (('data', data[0]['date'] if data else None, len(data)),
+                lambda: daily_points(data, metric))
+
+    def stored_points() -> list:
+        # The ingested CSV dumps, then the local CSV for the nation
+        if area_store is not None:
+            data = area_store.series(location, location_type)
+            if data is not None:
+                return daily_points(data['data'], metric)
+        if location_type == 'nation' and location == nation_location and csv_covid_data is not None:
+            return column_points(csv_covid_data, metric)
+        return []
+    # Only queried when the pyramid is built, the store and the CSV
+    # change with their ingests and loads.
+    return ('stored', state.area_store_version, csv_covid_version), stored_points
+
+
+def area_chart_points(location_type: str, location: str, metric: str,
+                      state: StateSnapshot) -> list:
+    """Returns the daily points of the area's metric, from the given snapshot."""
+    warmed_up.wait(WARM_UP_TIMEOUT)
+    _, points = area_chart_source(location_type, location, metric, state)
+    return points()
+
+
+@route("/api/areas/<location_type>/<location>/chart", methods=['GET'])
+def api_area_chart(location_type: str, location: str):
+    """
+    The trend chart of an area's metric, at a daily, weekly or monthly
+    resolution, downsampled to at most `points` points (oldest first).
+    """
+    from flask import request, abort
+    metric = request.args.get('metric', DEFAULT_METRIC)
+    resolution = request.args.get('resolution', RESOLUTIONS[0])
+    points = request.args.get('points', DEFAULT_POINTS, type=int)
+    if metric not in AGGREGATIONS or resolution not in RESOLUTIONS or \
+            not 3 <= points <= MAX_POINTS:
+        abort(400)
+    state = global_vars.store.snapshot()
+
+    def build():
+        # The pyramid is only built again when the area's data changes.
+        warmed_up.wait(WARM_UP_TIMEOUT)
+        version, daily = area_chart_source(location_type, location, metric, state)
+        pyramid = series_pyramids.get((location_type, location, metric), version,
+                                      daily, AGGREGATIONS[metric])
+        if pyramid is None:
+            return None
+        return {'location': location, 'location_type': location_type, 'metric': metric,
+                'resolution': resolution, 'length': len(pyramid.levels[resolution]),
+                'points': pyramid.view(resolution, points)}
+    cached = json_responses.get(('chart', location_type, location, metric, resolution, points),
+                                data_version(state), build)
+    if cached.body == b'null':
+        abort(404)
+    return json_response(cached)
+
+
+@route("/api/areas/<location_type>/<location>/metrics", methods=['GET'])
+def api_area_metrics(location_type: str, location: str):
+    """
+    The 7, 14 and 28-day sums of an area's metric over calendar days, their
+    week-over-week change and, for the areas whose population is set in the
+    config ("area_populations", keyed by type:name), their rates per 100k.
+    """
+    from flask import request, abort
+    metric = request.args.get('metric', DEFAULT_METRIC)
+    # Only the daily counts add up over a window.
+    if AGGREGATIONS.get(metric) != 'sum':
+        abort(400)
+    state = global_vars.store.snapshot()
+
+    def build():
+        points = area_chart_points(location_type, location, metric, state)
+        if not points:
+            return None
+        population = config_data.get('area_populations', {}).get(location_type + ':' + location)
+        return {'location': location, 'location_type': location_type, 'metric': metric,
+                'latest_date': points[-1][0],
+                **window_metrics(RollingSeries.from_points(points), population)}
+    cached = json_responses.get(('metrics', location_type, location, metric),
+                                data_version(state), build)
+    if cached.body == b'null':
+        abort(404)
+    return json_response(cached)
+
+
+@route("/api/rollups/<level>/<area_code>/series", methods=['GET'])
+def api_rollup_series(level: str, area_code: str):
+    """
+    The daily totals of a parent area, summed from its local areas, latest
+    first, with the number of local areas summed. With ?complete=1, only
+    the days summing all of the parent's local areas are served.
+    """
+    from flask import abort, request
+    complete = request.args.get('complete', '') not in ('', '0')
+    cached = json_responses.get(('rollup', level, area_code, complete), data_version(),
+                                lambda: area_rollups.series(level, area_code, complete))
+    if cached.body == b'null':
+        abort(404)
+    return json_response(cached)
+
+
+@route("/api/areas/<location_type>", methods=['GET'])
+def api_areas(location_type: str):
+    """The names of the areas of the type held in the area store."""
+    def build() -> list:
+        return area_store.areas(location_type) if area_store is not None else []
+    return json_response(json_responses.get(('areas', location_type), data_version(), build))
+
+
+@route("/api/news", methods=['GET'])
+def api_news():
+    """The news articles shown on the dashboard, without the deleted ones."""
+    state = global_vars.store.snapshot()
+
+    def build() -> dict:
+        return {'articles': shown_news(state)}
+    return json_response(json_responses.get('news', data_version(state), build))
+
+
+@route("/api/updates", methods=['GET'])
+def api_updates():
+    """The scheduled updates, as listed on the dashboard."""
+    def build() -> dict:
+        return {'updates': [{'id': update.update_id, 'title': update.title,
+                             'content': update.content, 'fire_time': update.next_fire_time}
+                            for update in update_registry]}
+    return json_response(json_responses.get('updates', data_version(), build))
+
+
+def cache_hits() -> dict:
+    """
+    Returns the hits of each cache. The news client is only counted
+    once covid_news_handling has been loaded, /metrics does not import
+    it (nor requests through it).
+    """
+    news = sys.modules.get('covid_news_handling')
+    news_client = news.news_client_stats() if news is not None else \
+        {'cache_hits': 0, 'revalidated': 0}
+    return {'dashboard_snapshot': dashboard_snapshots.hits, 'json_response': json_responses.hits,
+            'series_pyramid': series_pyramids.hits,
+            'news_client': news_client['cache_hits'],
+            'news_client_revalidated': news_client['revalidated']}
+
+
+# The cache hits, and the upstream fetches saved, counted by the caches.
+metrics.registry.callback(
+    'dashboard_cache_hits_total', 'Requests answered from a cache.', cache_hits,
+    kind='counter', labelnames=['cache'])
+metrics.registry.callback(
+    'dashboard_cache_misses_total', 'Requests for which a cache entry was built.',
+    lambda: {'dashboard_snapshot': dashboard_snapshots.misses,
+             'json_response': json_responses.misses,
+             'series_pyramid': series_pyramids.misses},
+    kind='counter', labelnames=['cache'])
+metrics.registry.callback(
+    'dashboard_upstream_fetches_saved_total',
+    'Upstream fetches saved by sharing or reusing a fetch, or by coalescing refreshes.',
+    lambda: {'single_flight': upstream_requests.stats()['saved'],
+             'coalesced': refresh_coalescer.skipped},
+    kind='counter', labelnames=['reason'])
+
+
+@route("/metrics", methods=['GET'])
+def metrics_endpoint():
+    """The metrics of the hot paths, in the Prometheus text format."""
+    from flask import make_response
+    response = make_response(metrics.registry.exposition())
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
+
+# The seconds spent in each phase of the start up, and the import of this module.
+metrics.registry.callback(
+    'dashboard_startup_seconds', 'Time spent in each phase of the start up.',
+    startup_profile.seconds, labelnames=['phase'])
+startup_profile.record('import main', IMPORT_STARTED, time.perf_counter())
 
 if __name__ == "__main__":
-    # Run the flask backend server application
-    app.run()
+    if '--profile-startup' in sys.argv[1:]:
+        # Report the start up, once the warm-up is over, without serving.
+        os.environ['DASHBOARD_PROFILE_STARTUP'] = '1'
+        create_app()
+        warmed_up.wait()
+    else:
+        # Run the flask backend server application
+        create_app().run()
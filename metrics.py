@@ -0,0 +1,205 @@
+"""
+This python file contains the metrics of the dashboard's hot paths:
+histograms of the time spent parsing the CSV, fetching from the APIs,
+running the scheduler, filtering the news and rendering the template,
+and counters such as the cache hits and fetch failures. The registry
+writes them in the Prometheus text format, served on /metrics.
+"""
+
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Iterator, Sequence
+
+# The upper bounds (in seconds) of the histogram buckets.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    """Returns the labels in the {name="value",...} format, '' without any."""
+    pairs = ['%s="%s"' % (name, str(value).replace('\\', r'\\').replace('"', r'\"'))
+             for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+class Counter:
+    """A counter, per combination of the label values, which only goes up."""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        """Increments the counter of the given label values."""
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        """Returns the counter of the given label values."""
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0)
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = list(self._values.items())
+        for key, value in values:
+            yield '%s%s %s' % (self.name, _format_labels(self.labelnames, key), value)
+
+
+class Histogram:
+    """
+    A histogram of observed durations, per combination of the label
+    values. Observing only bumps one bucket, the buckets are made
+    cumulative when written out.
+    """
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label values: [bucket counts (the last one is +Inf), sum]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        """Records one observation of the given label values."""
+        key = tuple(labels[name] for name in self.labelnames)
+        position = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][position] += 1
+            state[1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """Observes the time spent in the with block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        """Returns the number of observations of the given label values."""
+        state = self._values.get(tuple(labels[name] for name in self.labelnames))
+        return sum(state[0]) if state else 0
+
+    def samples(self) -> Iterator[str]:
+        with self._lock:
+            values = [(key, list(counts), total) for key, (counts, total) in self._values.items()]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                yield '%s_bucket%s %s' % (self.name, _format_labels(
+                    self.labelnames, key, 'le="%s"' % bound), cumulative)
+            labels = _format_labels(self.labelnames, key)
+            yield '%s_sum%s %s' % (self.name, labels, total)
+            yield '%s_count%s %s' % (self.name, labels, cumulative)
+
+
+class CallbackMetric:
+    """
+    A gauge or counter read from a function when the metrics are written,
+    for the values already counted elsewhere (such as a queue's length).
+    The function returns a number, or a dict of label values to numbers.
+    """
+
+    def __init__(self, name: str, documentation: str, function: Callable,
+                 kind: str = 'gauge', labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.function = function
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterator[str]:
+        values = self.function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in values.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield '%s%s %s' % (self.name, _format_labels(self.labelnames, key), value)
+
+
+class MetricsRegistry:
+    """This class holds the metrics, and writes them in the Prometheus text format."""
+
+    def __init__(self) -> None:
+        self._metrics: dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        """Adds the metric, or returns the one already registered under its name."""
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Registers a counter, or returns the one of the same name."""
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        """Registers a histogram, or returns the one of the same name."""
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def callback(self, name: str, documentation: str, function: Callable,
+                 kind: str = 'gauge', labelnames: Sequence[str] = ()) -> CallbackMetric:
+        """Registers (or replaces) a metric read from the function."""
+        metric = CallbackMetric(name, documentation, function, kind, labelnames)
+        with self._lock:
+            self._metrics[name] = metric
+        return metric
+
+    def exposition(self) -> str:
+        """Returns every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append('# HELP %s %s' % (metric.name, metric.documentation))
+            lines.append('# TYPE %s %s' % (metric.name, metric.kind))
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+# The registry served on /metrics, and the metrics of the hot paths
+registry = MetricsRegistry()
+csv_parse_seconds = registry.histogram(
+    'dashboard_csv_parse_seconds', 'Time spent loading a CSV export.', ['function'])
+upstream_fetch_seconds = registry.histogram(
+    'dashboard_upstream_fetch_seconds', 'Time spent on a request to an upstream API.', ['api'])
+upstream_fetch_failures = registry.counter(
+    'dashboard_upstream_fetch_failures_total', 'Failed requests to an upstream API.', ['api'])
+scheduler_tick_seconds = registry.histogram(
+    'dashboard_scheduler_tick_seconds', 'Time spent running the due scheduled events.')
+news_filter_seconds = registry.histogram(
+    'dashboard_news_filter_seconds', 'Time spent removing the unwanted news.')
+template_render_seconds = registry.histogram(
+    'dashboard_template_render_seconds', 'Time spent rendering the dashboard template.')
+
+
+@contextmanager
+def tracked_fetch(api: str) -> Iterator[None]:
+    """Times the request to the upstream API in the with block, and counts its failure."""
+    try:
+        with upstream_fetch_seconds.time(api=api):
+            yield
+    except Exception:
+        upstream_fetch_failures.inc(api=api)
+        raise
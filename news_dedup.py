@@ -0,0 +1,210 @@
+"""
+This python file contains the deduplication of the news articles,
+run after each fetch. The same story is often syndicated under a
+slightly different title, so besides exact (normalised) url matches,
+near duplicates are found with MinHash signatures of the word shingles
+of the title and description. The signatures are banded into a
+locality sensitive hash (LSH) index, so each article is only compared
+with the few candidates sharing a band, and the first article of each
+cluster is kept as its representative. Syndicated copies usually carry
+the description verbatim, so an article whose description is the one of
+a kept article is compared with that article first, without computing
+its signature.
+"""
+
+import string
+from itertools import repeat
+from operator import and_
+from typing import Iterable, Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+# One permutation MinHash: the shingle hashes are spread over this many
+# bins (a power of two) and the minimum of each bin forms the signature.
+SIGNATURE_BINS = 16
+# The signature is cut into bands of this many bins, articles sharing
+# any band are candidates.
+BAND_ROWS = 2
+# The Jaccard similarity of the shingles above which two candidates
+# are the same story.
+SIMILARITY_THRESHOLD = 0.5
+
+# Punctuation separates words, like white space does. The texts are
+# translated as UTF-8 bytes, which is about twice as fast as translating
+# the strings, and leaves the (multi-byte) non-ASCII characters as they are.
+_PUNCTUATION = bytes.maketrans(string.punctuation.encode(), b' ' * len(string.punctuation))
+
+
+def normalise_url(url: Optional[str]) -> str:
+    """
+    Returns the url without its fragment, tracking (utm_) parameters
+    and trailing slash.
+    """
+    if not url:
+        return ''
+    url = url.strip()
+    if '?' not in url and '#' not in url:
+        return url.rstrip('/')
+    parts = urlsplit(url)
+    query = urlencode([(name, value) for name, value in parse_qsl(parts.query)
+                       if not name.startswith('utm_')])
+    return urlunsplit((parts.scheme, parts.netloc, parts.path.rstrip('/'), query, ''))
+
+
+def _word_pairs(text: str) -> frozenset:
+    """Returns the hashes of the pairs of consecutive words of the text."""
+    words = text.lower().encode().translate(_PUNCTUATION).split()
+    if len(words) < 2:
+        return frozenset(map(hash, words))
+    # The pairs are hashed as tuples, which hash their words in C.
+    return frozenset(map(hash, zip(words, words[1:])))
+
+
+def shingles(article: dict) -> frozenset:
+    """
+    This function returns the hashes of the word shingles (pairs of
+    consecutive words) of the article's title and description.
+    """
+    return _word_pairs(article.get('title') or '') | \
+        _word_pairs(article.get('description') or '')
+
+
+def minhash_signature(shingle_set: frozenset, bins: int = SIGNATURE_BINS) -> Optional[tuple]:
+    """
+    This function returns the one permutation MinHash signature of the
+    shingles, or None for an empty set: the shingle hashes are spread
+    over the bins by their lowest bits, and each bin keeps its minimum.
+    The bins no shingle fell into take the value of the next filled bin
+    (densification), so that short texts still have comparable signatures.
+    """
+    if not shingle_set:
+        return None
+    # Sorted in reverse, the last (smallest) hash of each bin is the one
+    # the dict keeps. This keeps the loop over the shingles in C.
+    hashes = sorted(shingle_set, reverse=True)
+    bin_mins = dict(zip(map(and_, hashes, repeat(bins - 1)), hashes))
+    signature = list(map(bin_mins.get, range(bins)))
+    if len(bin_mins) < bins:
+        for position in [position for position in range(bins) if position not in bin_mins]:
+            offset = 1
+            while (position + offset) % bins not in bin_mins:
+                offset += 1
+            # The borrowed value is marked with its offset.
+            signature[position] = (bin_mins[(position + offset) % bins], offset)
+    return tuple(signature)
+
+
+def jaccard(first: frozenset, second: frozenset) -> float:
+    """Returns the Jaccard similarity of two shingle sets."""
+    if not first and not second:
+        return 1.0
+    # The union is counted, not built.
+    shared = len(first & second)
+    return shared / (len(first) + len(second) - shared)
+
+
+class NewsDeduplicator:
+    """
+    This class clusters the articles fed to it, one at a time. An article
+    is kept unless its url was seen already or it is near duplicate of a
+    kept article, in which case it joins that article's cluster.
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_THRESHOLD,
+                 bins: int = SIGNATURE_BINS, band_rows: int = BAND_ROWS) -> None:
+        self.threshold = threshold
+        self.bins = bins
+        self.band_rows = band_rows
+        self.kept: list[dict] = []
+        # The number of articles in the cluster of each kept article
+        self.cluster_sizes: list[int] = []
+        self._urls: dict[str, int] = {}
+        # The kept article of each description, with the description's shingles
+        self._descriptions: dict[str, tuple[int, frozenset]] = {}
+        self._shingles: list[frozenset] = []
+        self._bands: dict[tuple, list[int]] = {}
+
+    def add(self, article: dict) -> bool:
+        """Adds the article, returns whether it was kept as a new story."""
+        url = normalise_url(article.get('url'))
+        if url and url in self._urls:
+            return self._join(self._urls[url], url)
+        description = article.get('description') or ''
+        seen = self._descriptions.get(description) if description else None
+        title_shingles = _word_pairs(article.get('title') or '')
+        if seen is not None:
+            # A copy of a kept article's description, only the title is
+            # shingled and the kept article is the first candidate.
+            position, description_shingles = seen
+            if self._copy_similarity(title_shingles, description_shingles,
+                                     self._shingles[position]) >= self.threshold:
+                return self._join(position, url)
+        else:
+            description_shingles = _word_pairs(description)
+        shingle_set = title_shingles | description_shingles
+        signature = minhash_signature(shingle_set, self.bins)
+        bands = []
+        if signature is not None:
+            rows = self.band_rows
+            bands = [(start,) + signature[start:start + rows]
+                     for start in range(0, self.bins, rows)]
+            match = self._find_duplicate(shingle_set, bands)
+            if match is not None:
+                return self._join(match, url)
+        position = len(self.kept)
+        self.kept.append(article)
+        self.cluster_sizes.append(1)
+        self._shingles.append(shingle_set)
+        if url:
+            self._urls[url] = position
+        if description and seen is None:
+            self._descriptions[description] = (position, description_shingles)
+        for band in bands:
+            self._bands.setdefault(band, []).append(position)
+        return True
+
+    @staticmethod
+    def _copy_similarity(title_shingles: frozenset, description_shingles: frozenset,
+                         kept_shingles: frozenset) -> float:
+        """
+        Returns the Jaccard similarity of an article with a kept article
+        of the same description, as the description's shingles are all
+        in the kept ones, only the few title shingles not in the
+        description are compared.
+        """
+        extra = title_shingles - description_shingles
+        shared = len(description_shingles) + len(extra & kept_shingles)
+        union = len(description_shingles) + len(extra) + len(kept_shingles) - shared
+        return shared / union if union else 1.0
+
+    def _join(self, position: int, url: str) -> bool:
+        """Counts a duplicate in the cluster of the kept article at the position."""
+        self.cluster_sizes[position] += 1
+        if url:
+            self._urls[url] = position
+        return False
+
+    def feed(self, articles: Iterable[dict]) -> list:
+        """Adds the articles and returns the ones kept."""
+        for article in articles:
+            self.add(article)
+        return self.kept
+
+    def _find_duplicate(self, shingle_set: frozenset, bands: list) -> Optional[int]:
+        checked = set()
+        for band in bands:
+            for candidate in self._bands.get(band, ()):
+                if candidate in checked:
+                    continue
+                checked.add(candidate)
+                if jaccard(shingle_set, self._shingles[candidate]) >= self.threshold:
+                    return candidate
+        return None
+
+
+def deduplicate_news(news_articles: Iterable[dict],
+                     threshold: float = SIMILARITY_THRESHOLD) -> list:
+    """
+    This function returns the articles with the duplicates and near
+    duplicates removed, keeping the first article of each story.
+    """
+    return NewsDeduplicator(threshold).feed(news_articles)
@@ -0,0 +1,114 @@
+"""
+This python file contains the index of the news articles removed by
+the user. Articles are identified by a stable hash of their url and
+normalised title, held in a set for constant time lookups and kept
+in a SQLite file, so the removed articles stay removed after a restart.
+"""
+
+import re
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+from typing import Iterable, Optional
+
+# Removed articles older than this are dropped from the file when it
+# is loaded, the news feed no longer returns them by then.
+MAX_AGE_DAYS = 30
+
+_SPACES = re.compile(r'\s+')
+
+
+def normalise_title(title: str) -> str:
+    """Returns the title lower cased, with its white space collapsed."""
+    return _SPACES.sub(' ', title or '').strip().casefold()
+
+
+def article_key(article: dict) -> str:
+    """
+    This function returns the stable key of the article, the hash of
+    its url and normalised title. The same article fetched again (with
+    a different description or image) keeps the same key.
+    """
+    text = (article.get('url') or '') + '\n' + normalise_title(article.get('title'))
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+
+class NewsExclusionIndex:
+    """
+    This class holds the keys of the removed articles. With a path,
+    the keys are loaded from and added to the SQLite file.
+    """
+
+    def __init__(self, path: Optional[str] = None, max_age_days: float = MAX_AGE_DAYS) -> None:
+        self.path = path
+        self._keys: set[str] = set()
+        self._lock = threading.Lock()
+        if path is not None:
+            self._load(max_age_days)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, article: dict) -> bool:
+        return article_key(article) in self._keys
+
+    def exclude(self, key: str) -> bool:
+        """Adds the article key to the index, returns whether it was new."""
+        with self._lock:
+            if key in self._keys:
+                return False
+            self._keys.add(key)
+        if self.path is not None:
+            try:
+                self._save(key)
+            except sqlite3.Error:
+                logging.exception('Could not save the removed news article')
+        return True
+
+    def exclude_title(self, title: str, news_articles: Iterable[dict]) -> bool:
+        """
+        Adds the keys of the articles with the given title, for the
+        pages which identify the removed article by its title only.
+        """
+        title = normalise_title(title)
+        added = [self.exclude(article_key(article)) for article in news_articles
+                 if normalise_title(article.get('title')) == title]
+        return any(added)
+
+    def filter(self, news_articles: Iterable[dict]) -> list:
+        """Returns the articles which have not been removed, in one pass."""
+        keys = self._keys
+        if not keys:
+            return list(news_articles)
+        return [article for article in news_articles if article_key(article) not in keys]
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=5)
+        connection.execute('CREATE TABLE IF NOT EXISTS excluded_news '
+                           '(key TEXT PRIMARY KEY, excluded REAL NOT NULL)')
+        return connection
+
+    def _load(self, max_age_days: float) -> None:
+        try:
+            connection = self._connect()
+            try:
+                with connection:
+                    connection.execute('DELETE FROM excluded_news WHERE excluded < ?',
+                                       (time.time() - max_age_days * 86400,))
+                self._keys.update(key for key, in connection.execute(
+                    'SELECT key FROM excluded_news'))
+            finally:
+                connection.close()
+        except sqlite3.Error:
+            logging.exception('Could not load the removed news articles')
+
+    def _save(self, key: str) -> None:
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('INSERT OR IGNORE INTO excluded_news VALUES (?, ?)',
+                                   (key, time.time()))
+        finally:
+            connection.close()
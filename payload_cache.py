@@ -0,0 +1,86 @@
+"""
+This python file contains the on-disk cache of the last good API
+payloads. The payloads are stored as zlib compressed, compact JSON
+in a SQLite file, so that a restart can show the latest data in a
+few milliseconds while fresh data is fetched in the background.
+"""
+
+import json
+import time
+import zlib
+import sqlite3
+import logging
+from typing import Optional
+
+CACHE_FILE = "dashboard_cache.sqlite3"
+
+# Set by enable(), the handlers only persist their payloads once
+# the application has chosen a cache file.
+cache_file: Optional[str] = None
+
+
+def enable(path: str = CACHE_FILE) -> None:
+    """Makes store() persist the payloads into the given cache file."""
+    global cache_file
+    cache_file = path
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    """Opens the cache file, creating its table on first use."""
+    connection = sqlite3.connect(path, timeout=5)
+    connection.execute('CREATE TABLE IF NOT EXISTS payloads '
+                       '(name TEXT PRIMARY KEY, saved REAL NOT NULL, body BLOB NOT NULL)')
+    return connection
+
+
+def save_payload(name: str, payload: dict, path: str = CACHE_FILE) -> None:
+    """This function saves (or replaces) the named payload in the cache file."""
+    body = zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+    connection = _connect(path)
+    try:
+        with connection:
+            connection.execute('INSERT OR REPLACE INTO payloads VALUES (?, ?, ?)',
+                               (name, time.time(), body))
+    finally:
+        connection.close()
+
+
+def load_payload(name: str, path: str = CACHE_FILE) -> Optional[dict]:
+    """
+    This function returns the named payload from the cache file,
+    or None when it has not been saved (or can not be read).
+    """
+    try:
+        connection = _connect(path)
+        try:
+            row = connection.execute('SELECT body FROM payloads WHERE name = ?',
+                                     (name,)).fetchone()
+        finally:
+            connection.close()
+        return json.loads(zlib.decompress(row[0])) if row else None
+    except (sqlite3.Error, zlib.error, ValueError):
+        logging.warning('Could not read the cached %s payload from %s', name, path)
+        return None
+
+
+def store(name: str, payload: dict) -> None:
+    """
+    This function persists the named payload when the cache has been
+    enabled. A failure to write is logged, it must not fail the update.
+    """
+    if cache_file is None:
+        return
+    try:
+        save_payload(name, payload, cache_file)
+    except sqlite3.Error:
+        logging.warning('Could not cache the %s payload into %s', name, cache_file)
+
+
+def load(name: str) -> Optional[dict]:
+    """
+    This function returns the named payload from the enabled cache
+    file, or None when the cache is not enabled or holds no payload.
+    """
+    if cache_file is None:
+        return None
+    return load_payload(name, cache_file)
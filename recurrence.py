@@ -0,0 +1,180 @@
+"""
+This python file contains the recurring schedules built on top of the
+shared scheduler. A recurring job re-arms itself after every run, at
+the next fire time of its rule, and the refreshes it runs go through a
+coalescer so overlapping schedules never fetch the same data twice.
+"""
+
+import time
+import logging
+import threading
+from typing import Callable, Hashable, Optional
+from scheduler import sched_instance, wake_scheduler
+from time_conversions import next_time_of_day
+
+
+class DailyAt:
+    """A rule firing every day at HH:MM (local time)."""
+
+    def __init__(self, hour: int, minute: int) -> None:
+        self.hour = hour
+        self.minute = minute
+
+    @classmethod
+    def from_hhmm(cls, hhmm: str) -> 'DailyAt':
+        """Builds the rule from an HH:MM string, such as the form's time field."""
+        hours, minutes = hhmm.split(':')
+        return cls(int(hours), int(minutes))
+
+    def next_fire(self, after: float) -> float:
+        """Returns the first fire time strictly after the given time."""
+        return next_time_of_day(self.hour, self.minute, after)
+
+    def __str__(self) -> str:
+        return 'daily at %02d:%02d' % (self.hour, self.minute)
+
+
+class Every:
+    """A rule firing every `interval` seconds, counted from `start`."""
+
+    def __init__(self, interval: float, start: Optional[float] = None) -> None:
+        self.interval = interval
+        self.start = time.time() if start is None else start
+
+    def next_fire(self, after: float) -> float:
+        """Returns the first fire time strictly after the given time."""
+        if after < self.start:
+            return self.start
+        # Skip the fire times missed while the process was busy.
+        return self.start + ((after - self.start) // self.interval + 1) * self.interval
+
+    def __str__(self) -> str:
+        return 'every %g seconds' % self.interval
+
+
+class RefreshCoalescer:
+    """
+    This class runs the refresh registered under a key only if the same
+    refresh (the key and its arguments) has not succeeded in the last
+    `window` seconds, or is not running right now, so schedules firing
+    at (nearly) the same time share one upstream fetch. A failed refresh
+    is not recorded, the next schedule retries it.
+    """
+
+    def __init__(self, window: float = 60) -> None:
+        self.window = window
+        self._last_run: dict[Hashable, float] = {}
+        self._running: set[Hashable] = set()
+        self._lock = threading.Lock()
+        self.skipped = 0
+
+    @staticmethod
+    def refresh_key(key: Hashable, args: tuple, kwargs: dict) -> Hashable:
+        """
+        Returns the key of one refresh: the key of the action with its
+        arguments, so refreshes of other areas or terms are not merged.
+        """
+        return (key, args, tuple(sorted(kwargs.items())))
+
+    def run(self, key: Hashable, action: Callable, *args, **kwargs) -> bool:
+        """Runs the action unless it is coalesced, returns whether it ran."""
+        refresh = self.refresh_key(key, args, kwargs)
+        now = time.monotonic()
+        with self._lock:
+            last_run = self._last_run.get(refresh)
+            if refresh in self._running:
+                self.skipped += 1
+                logging.info('Coalesced the %s refresh with the one running', key)
+                return False
+            if last_run is not None and now - last_run < self.window:
+                self.skipped += 1
+                logging.info('Coalesced the %s refresh with the one run %.1f Seconds ago',
+                             key, now - last_run)
+                return False
+            self._running.add(refresh)
+        try:
+            action(*args, **kwargs)
+        except BaseException:
+            with self._lock:
+                self._running.discard(refresh)
+            raise
+        with self._lock:
+            self._running.discard(refresh)
+            # Only a refresh which succeeded covers the ones in its window.
+            self._last_run[refresh] = now
+        return True
+
+    def wrap(self, key: Hashable, action: Callable) -> Callable:
+        """Returns the action going through the coalescer, for use as a sched action."""
+        def coalesced(*args, **kwargs) -> None:
+            self.run(key, action, *args, **kwargs)
+        return coalesced
+
+
+# The coalescer shared by all the scheduled refreshes
+refresh_coalescer = RefreshCoalescer()
+
+
+class RecurringJob:
+    """
+    This class keeps one event of the scheduler armed for the next fire
+    time of its rule. When the event runs, the next one is armed before
+    the action is run, so a failing action does not end the recurrence.
+    """
+
+    def __init__(self, rule, action: Callable, priority: int = 1,
+                 key: Optional[Hashable] = None, kwargs: Optional[dict] = None,
+                 scheduler=sched_instance,
+                 coalescer: Optional[RefreshCoalescer] = refresh_coalescer) -> None:
+        self.rule = rule
+        self.action = action
+        self.priority = priority
+        self.key = action if key is None else key
+        self.kwargs = kwargs or {}
+        self.scheduler = scheduler
+        self.coalescer = coalescer
+        self.event = None
+        self.runs = 0
+        self.cancelled = False
+        self._lock = threading.Lock()
+
+    @property
+    def next_fire_time(self) -> Optional[float]:
+        """The time of the armed event, None once cancelled."""
+        event = self.event
+        return event.time if event is not None else None
+
+    def start(self, now: Optional[float] = None) -> 'RecurringJob':
+        """Arms the first event of the job."""
+        with self._lock:
+            self._arm(self.scheduler.timefunc() if now is None else now)
+        wake_scheduler()
+        return self
+
+    def cancel(self) -> None:
+        """Cancels the armed event, the job does not fire again."""
+        with self._lock:
+            self.cancelled = True
+            event, self.event = self.event, None
+        if event is not None:
+            try:
+                self.scheduler.cancel(event)
+            except ValueError:
+                # The event is running right now, it will not re-arm.
+                pass
+
+    def _arm(self, after: float) -> None:
+        if not self.cancelled:
+            self.event = self.scheduler.enterabs(
+                self.rule.next_fire(after), self.priority, self._run)
+
+    def _run(self) -> None:
+        with self._lock:
+            now = self.scheduler.timefunc()
+            fired_at = self.event.time if self.event is not None else now
+            self._arm(max(fired_at, now))
+        self.runs += 1
+        if self.coalescer is None:
+            self.action(**self.kwargs)
+        else:
+            self.coalescer.run(self.key, self.action, **self.kwargs)
@@ -0,0 +1,90 @@
+"""
+This python file contains the rolling-window metrics engine. A daily
+series is turned once into prefix sums, after which the sum over any
+window of days (7, 14, 28...), its rate per 100k people and its
+week-over-week change are answered in constant time. The windows are
+calendar days, counted back from the latest day holding a value: a day
+without one (blank, or not reported) counts as zero, so the windows of
+the CSV exports and of the API rows cover the same days.
+"""
+
+from array import array
+from datetime import date
+from itertools import accumulate
+from typing import Iterable, Optional
+
+# The days skipped from the latest one, as `yesterday's` count
+# is still incomplete.
+INCOMPLETE_DAYS = 1
+# The windows (in days) reported for an area.
+WINDOWS = (7, 14, 28)
+
+
+class RollingSeries:
+    """
+    This class holds the prefix sums of a daily series ordered latest
+    first, `prefix[i]` being the sum of the `i` latest values.
+    """
+
+    def __init__(self, values: Iterable[Optional[int]]) -> None:
+        if not isinstance(values, array):
+            # Missing (None) values count as zero, typed arrays have none.
+            values = (value or 0 for value in values)
+        self.prefix = array('q', accumulate(values, initial=0))
+
+    @classmethod
+    def from_days(cls, days: Iterable[tuple[int, Optional[int]]]) -> 'RollingSeries':
+        """
+        Builds the series from (day ordinal, value) pairs, in any order,
+        with one value per calendar day from the latest day holding a value.
+        """
+        values = {day: value for day, value in days if value is not None}
+        if not values:
+            return cls(())
+        latest, earliest = max(values), min(values)
+        return cls(array('q', (values.get(day, 0) for day in range(latest, earliest - 1, -1))))
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[dict], metric: str) -> 'RollingSeries':
+        """Builds the series of one metric from rows in the API format."""
+        return cls.from_days((date.fromisoformat(row['date']).toordinal(), row.get(metric))
+                             for row in rows)
+
+    @classmethod
+    def from_points(cls, points: Iterable[tuple[str, Optional[int]]]) -> 'RollingSeries':
+        """Builds the series from (ISO date, value) points, such as a chart's."""
+        return cls.from_days((date.fromisoformat(day).toordinal(), value)
+                             for day, value in points)
+
+    def __len__(self) -> int:
+        return len(self.prefix) - 1
+
+    def window_sum(self, days: int, offset: int = INCOMPLETE_DAYS) -> int:
+        """
+        Returns the sum of `days` values, starting `offset` days after
+        the latest one. A window running past the series is cut short.
+        """
+        last = len(self.prefix) - 1
+        start = min(offset, last)
+        return self.prefix[min(offset + days, last)] - self.prefix[start]
+
+    def rate_per_100k(self, days: int, population: int,
+                      offset: int = INCOMPLETE_DAYS) -> float:
+        """Returns the window sum per 100,000 people of the given population."""
+        return self.window_sum(days, offset) * 100000 / population
+
+    def week_over_week_delta(self, offset: int = INCOMPLETE_DAYS) -> int:
+        """Returns the change of the 7-day sum against the 7 days before it."""
+        return self.window_sum(7, offset) - self.window_sum(7, offset + 7)
+
+
+def window_metrics(series: RollingSeries, population: Optional[int] = None) -> dict:
+    """
+    This function returns the sums of the series over each of the
+    WINDOWS, its week-over-week change and, when the population is
+    known, the sums per 100,000 people.
+    """
+    return {'sums': {str(days): series.window_sum(days) for days in WINDOWS},
+            'week_over_week_delta': series.week_over_week_delta(),
+            'rates_per_100k': {str(days): round(series.rate_per_100k(days, population), 1)
+                               for days in WINDOWS} if population else None}
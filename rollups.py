@@ -0,0 +1,165 @@
+"""
+This python file contains the rollups of the covid data up the area
+hierarchy (ltla -> utla -> region -> nation). The totals of every
+parent area and date are kept precomputed: when the rows of a child
+area change, only the difference is added to each of its ancestors,
+so a parent-level query is a lookup instead of a sum over its children.
+"""
+
+import csv
+import threading
+from typing import Iterable, Optional
+
+# The levels of the hierarchy, the lowest (leaf) one first. Only the
+# leaf areas' rows are summed, so that no area is counted twice.
+LEVELS = ('ltla', 'utla', 'region', 'nation')
+ROLLUP_METRICS = ('newCasesBySpecimenDate', 'hospitalCases', 'cumDailyNsoDeathsByDeathDate')
+
+
+class AreaHierarchy:
+    """
+    This class maps each area code to its parent's, level by level,
+    for example an ltla code to its utla code.
+    """
+
+    def __init__(self, parents: Optional[dict] = None) -> None:
+        # (level, code) -> (parent level, parent code)
+        self.parents: dict[tuple, tuple] = dict(parents or {})
+
+    @classmethod
+    def from_lookup_csv(cls, path: str) -> 'AreaHierarchy':
+        """
+        Builds the hierarchy from a lookup CSV with one column of codes
+        per level (ltlaCode, utlaCode, regionCode, nationCode), one row
+        per leaf area. Levels missing from the file are skipped.
+        """
+        hierarchy = cls()
+        with open(path, 'r', encoding='utf-8', newline='') as file:
+            for row in csv.DictReader(file):
+                chain = [(level, row[level + 'Code']) for level in LEVELS
+                         if row.get(level + 'Code')]
+                for child, parent in zip(chain, chain[1:]):
+                    hierarchy.parents[child] = parent
+        return hierarchy
+
+    def leaf_counts(self, leaf_level: str) -> dict[tuple, int]:
+        """Returns the number of leaf areas under each (level, code) of the hierarchy."""
+        counts: dict[tuple, int] = {}
+        for level, code in self.parents:
+            if level == leaf_level:
+                for ancestor in self.ancestors(level, code):
+                    counts[ancestor] = counts.get(ancestor, 0) + 1
+        return counts
+
+    def ancestors(self, level: str, code: str) -> list:
+        """Returns the (level, code) of every ancestor of the area, nearest first."""
+        chain = []
+        parent = self.parents.get((level, code))
+        while parent is not None:
+            chain.append(parent)
+            parent = self.parents.get(parent)
+        return chain
+
+
+class RollupEngine:
+    """
+    This class keeps the rows of the leaf areas and the precomputed
+    totals, per metric and date, of every ancestor area. With each total
+    is counted the number of leaf areas it sums, so a parent whose local
+    areas have not all been received can be told apart.
+    """
+
+    def __init__(self, hierarchy: Optional[AreaHierarchy] = None,
+                 metrics: Iterable[str] = ROLLUP_METRICS, leaf_level: str = LEVELS[0]) -> None:
+        self.hierarchy = hierarchy or AreaHierarchy()
+        self.metrics = tuple(metrics)
+        self.leaf_level = leaf_level
+        # leaf code -> date -> metric values, as last summed
+        self._leaves: dict[str, dict[str, tuple]] = {}
+        # (level, code) -> date -> metric totals
+        self._totals: dict[tuple, dict[str, list]] = {}
+        # (level, code) -> date -> the number of leaf areas summed
+        self._areas: dict[tuple, dict[str, int]] = {}
+        # (level, code) -> the number of leaf areas in the hierarchy
+        self._expected = self.hierarchy.leaf_counts(leaf_level)
+        self._lock = threading.Lock()
+
+    def update_area(self, rows: Iterable[dict]) -> int:
+        """
+        This method merges the rows of leaf areas (other levels are
+        ignored), adding the difference with the rows held before to the
+        totals of the areas' ancestors. It returns the rows that changed.
+        """
+        changed = 0
+        with self._lock:
+            for row in rows:
+                code, date = row.get('areaCode'), row.get('date')
+                if row.get('areaType') != self.leaf_level or not code or not date:
+                    continue
+                values = tuple(row.get(metric) or 0 for metric in self.metrics)
+                dates = self._leaves.setdefault(code, {})
+                previous = dates.get(date)
+                if previous == values:
+                    continue
+                dates[date] = values
+                if previous is None:
+                    self._add(code, date, values, new_area=True)
+                else:
+                    self._add(code, date, [new - old for new, old in zip(values, previous)])
+                changed += 1
+        return changed
+
+    def set_hierarchy(self, hierarchy: AreaHierarchy) -> None:
+        """Replaces the hierarchy, and rebuilds the totals from the leaf rows."""
+        with self._lock:
+            self.hierarchy = hierarchy
+            self._expected = hierarchy.leaf_counts(self.leaf_level)
+            self._totals = {}
+            self._areas = {}
+            for code, dates in self._leaves.items():
+                for date, values in dates.items():
+                    self._add(code, date, values, new_area=True)
+
+    def _add(self, code: str, date: str, deltas: Iterable[int], new_area: bool = False) -> None:
+        deltas = list(deltas)
+        for ancestor in self.hierarchy.ancestors(self.leaf_level, code):
+            totals = self._totals.setdefault(ancestor, {}).get(date)
+            if totals is None:
+                self._totals[ancestor][date] = list(deltas)
+            else:
+                for index, delta in enumerate(deltas):
+                    totals[index] += delta
+            if new_area:
+                areas = self._areas.setdefault(ancestor, {})
+                areas[date] = areas.get(date, 0) + 1
+
+    def total(self, level: str, code: str, date: str) -> Optional[dict]:
+        """Returns the metric totals of the area on the date, None if it has none."""
+        with self._lock:
+            totals = self._totals.get((level, code), {}).get(date)
+            return dict(zip(self.metrics, totals)) if totals is not None else None
+
+    def series(self, level: str, code: str, complete: bool = False) -> Optional[dict]:
+        """
+        Returns the daily totals of the area, latest first, in the format
+        of the API payloads, or None when the area has no totals. Each day
+        holds the number of leaf areas summed (contributingAreas), and the
+        series the number of leaf areas of the hierarchy (expectedAreas).
+        With `complete` set, only the days summing every one are returned.
+        """
+        with self._lock:
+            dates = self._totals.get((level, code))
+            if not dates:
+                return None
+            areas = self._areas.get((level, code), {})
+            expected = self._expected.get((level, code))
+            data = [{'areaCode': code, 'areaType': level, 'date': date,
+                     **dict(zip(self.metrics, totals)), 'contributingAreas': areas.get(date, 0)}
+                    for date, totals in sorted(dates.items(), reverse=True)]
+        if complete:
+            data = [row for row in data if row['contributingAreas'] == expected]
+        return {'data': data, 'length': len(data), 'expectedAreas': expected}
+
+
+# The rollups fed by the covid data handler and the area store's ingest
+area_rollups = RollupEngine()
@@ -1,7 +1,103 @@
-"""This python file contains the shared scheduler amongst all other files."""
+"""
+This python file contains the shared scheduler amongst all other files,
+and the background worker thread that runs its due events, so that
+the data updates never run on the path of a web request.
+"""
 
 import time
 import sched
+import logging
+import threading
+from typing import Optional
+from metrics import registry, scheduler_tick_seconds
 
 # Schedule instance initialization
 sched_instance = sched.scheduler(time.time, time.sleep)
+
+
+class SchedulerWorker(threading.Thread):
+    """
+    This class runs the due events of a scheduler in a daemon thread.
+    It sleeps until the next event is due, or until it is woken up
+    because an earlier event has been entered into the queue.
+    """
+
+    def __init__(self, scheduler: sched.scheduler = sched_instance,
+                 idle_interval: float = 60) -> None:
+        super().__init__(name='scheduler-worker', daemon=True)
+        self.scheduler = scheduler
+        # How long to sleep when the queue is empty, a wake up
+        # call interrupts the sleep anyway.
+        self.idle_interval = idle_interval
+        self._wakeup = threading.Event()
+        self._stopping = False
+
+    def run(self) -> None:
+        while not self._stopping:
+            # Cleared before the queue is checked, so a wake up arriving
+            # from here on interrupts the wait below instead of being lost.
+            self._wakeup.clear()
+            try:
+                # Run every due event and get the delay until the next one.
+                with scheduler_tick_seconds.time():
+                    delay = self.scheduler.run(blocking=False)
+            except Exception:
+                # The failed event has already been removed from the queue,
+                # do not halt the worker, carry on with the next events.
+                logging.exception('A scheduled update failed')
+                continue
+            logging.info('Next scheduled update: %s Seconds', str(delay))
+            self._wakeup.wait(self.idle_interval if delay is None else delay)
+
+    def wake(self) -> None:
+        """Makes the worker check the queue again, used after entering events."""
+        self._wakeup.set()
+
+    @property
+    def stopping(self) -> bool:
+        """Whether the worker has been asked to stop."""
+        return self._stopping
+
+    def stop(self) -> None:
+        """Stops the worker after the events currently running."""
+        self._stopping = True
+        self._wakeup.set()
+
+    def queue_depth(self) -> int:
+        """Returns the number of events waiting in the queue."""
+        return len(self.scheduler.queue)
+
+    def next_fire_time(self) -> Optional[float]:
+        """Returns the (epoch) time of the next event, None when the queue is empty."""
+        queue = self.scheduler.queue
+        return queue[0].time if queue else None
+
+
+# The worker running the shared scheduler instance, replaced when
+# it is started again after being stopped.
+scheduler_worker = SchedulerWorker()
+_start_lock = threading.Lock()
+registry.callback('dashboard_scheduler_queue_depth', 'Events waiting in the scheduler queue.',
+                  lambda: scheduler_worker.queue_depth())
+
+
+def start_scheduler_worker() -> SchedulerWorker:
+    """
+    This function starts the shared scheduler worker, if it is not
+    already running. A worker which has been stopped cannot be started
+    again, a new one is started in its place.
+    """
+    global scheduler_worker
+    with _start_lock:
+        if scheduler_worker.is_alive() and not scheduler_worker.stopping:
+            return scheduler_worker
+        if scheduler_worker.ident is not None:
+            scheduler_worker = SchedulerWorker(scheduler_worker.scheduler,
+                                               scheduler_worker.idle_interval)
+        scheduler_worker.start()
+        return scheduler_worker
+
+
+def wake_scheduler() -> None:
+    """Wakes up the shared scheduler worker, after an event has been entered."""
+    scheduler_worker.wake()
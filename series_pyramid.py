@@ -0,0 +1,167 @@
+"""
+This python file contains the series behind the dashboard's trend
+charts. The daily values of an area's metric are aggregated once into
+a pyramid of resolutions (daily, weekly and monthly), and a chart is
+served a view of one level downsampled with LTTB (Largest Triangle
+Three Buckets) to a few hundred points, which keeps the peaks and
+troughs of the curve. The pyramids are cached per area and metric, and
+their views per resolution and number of points.
+"""
+
+import threading
+from datetime import date, timedelta
+from typing import Callable, Hashable, Iterable, Optional
+
+RESOLUTIONS = ('daily', 'weekly', 'monthly')
+# How the daily values of a metric are combined over a week or month:
+# new cases are added up, the hospital cases (a daily level) averaged,
+# and of the cumulative deaths only the last value is kept.
+AGGREGATIONS = {'newCasesBySpecimenDate': 'sum', 'hospitalCases': 'mean',
+                'cumDailyNsoDeathsByDeathDate': 'last'}
+DEFAULT_METRIC = 'newCasesBySpecimenDate'
+# The points of a chart, unless asked otherwise, and the most served.
+DEFAULT_POINTS = 300
+MAX_POINTS = 5000
+
+
+def daily_points(rows: Iterable[dict], metric: str) -> list[tuple[str, float]]:
+    """
+    This function returns the (date, value) points of the metric, oldest
+    first, from rows in the API format. Rows without the metric are skipped.
+    """
+    values = {row['date']: row.get(metric) for row in rows}
+    return [(day, values[day]) for day in sorted(values) if values[day] is not None]
+
+
+def column_points(columns, metric: str) -> list[tuple[str, float]]:
+    """
+    This function returns the (date, value) points of the metric, oldest
+    first, from the typed columns of a CSV export (see csv_columns).
+    """
+    if metric not in columns:
+        return []
+    dates, values = columns['date'], columns[metric]
+    return sorted((dates[index], values[index]) for index in range(len(columns))
+                  if values[index] is not None)
+
+
+def bucket_start(iso_date: str, resolution: str) -> str:
+    """Returns the first day of the week (Monday) or month holding the date."""
+    if resolution == 'monthly':
+        return iso_date[:8] + '01'
+    day = date.fromisoformat(iso_date)
+    return (day - timedelta(days=day.weekday())).isoformat()
+
+
+def aggregate(points: list[tuple[str, float]], resolution: str,
+              aggregation: str) -> list[tuple[str, float]]:
+    """
+    This function combines the daily points into one point per week or
+    month (dated by its first day), as set by the aggregation.
+    """
+    buckets: dict[str, list] = {}
+    for day, value in points:
+        buckets.setdefault(bucket_start(day, resolution), []).append(value)
+    if aggregation == 'sum':
+        combine = sum
+    elif aggregation == 'mean':
+        def combine(values: list) -> float:
+            return round(sum(values) / len(values), 2)
+    else:
+        def combine(values: list) -> float:
+            return values[-1]
+    return [(start, combine(values)) for start, values in buckets.items()]
+
+
+def lttb(points: list[tuple[str, float]], threshold: int) -> list[tuple[str, float]]:
+    """
+    This function downsamples the points to `threshold` of them with the
+    Largest Triangle Three Buckets algorithm: the first and last points
+    are kept, and from each bucket in between the point forming the
+    largest triangle with the point kept before it and the average of
+    the next bucket. The days are the x axis, so gaps are respected.
+    """
+    count = len(points)
+    if threshold >= count or threshold < 3:
+        return list(points)
+    xs = [date.fromisoformat(day).toordinal() for day, _ in points]
+    ys = [value for _, value in points]
+    every = (count - 2) / (threshold - 2)
+    kept = [points[0]]
+    previous = 0
+    for bucket in range(threshold - 2):
+        # The average point of the next bucket (the last point for the last one)
+        start = int((bucket + 1) * every) + 1
+        end = min(int((bucket + 2) * every) + 1, count)
+        average_x = sum(xs[start:end]) / (end - start)
+        average_y = sum(ys[start:end]) / (end - start)
+        x, y = xs[previous], ys[previous]
+        best, best_area = -1, -1.0
+        for index in range(int(bucket * every) + 1, start):
+            # Twice the triangle's area, which ranks the points the same.
+            area = abs((x - average_x) * (ys[index] - y) - (x - xs[index]) * (average_y - y))
+            if area > best_area:
+                best, best_area = index, area
+        kept.append(points[best])
+        previous = best
+    kept.append(points[-1])
+    return kept
+
+
+class SeriesPyramid:
+    """
+    This class holds the daily, weekly and monthly points of one area's
+    metric, and the downsampled views of them served so far.
+    """
+
+    def __init__(self, daily: list[tuple[str, float]], aggregation: str) -> None:
+        self.levels = {'daily': daily}
+        for resolution in RESOLUTIONS[1:]:
+            self.levels[resolution] = aggregate(daily, resolution, aggregation)
+        self._views: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def view(self, resolution: str, points: int = DEFAULT_POINTS) -> list[tuple[str, float]]:
+        """Returns the level of the resolution, downsampled to at most `points` points."""
+        key = (resolution, points)
+        view = self._views.get(key)
+        if view is None:
+            view = lttb(self.levels[resolution], points)
+            with self._lock:
+                self._views[key] = view
+        return view
+
+
+class PyramidCache:
+    """
+    This class caches one pyramid per key (an area and metric), which is
+    built again once it is requested for another version of its data.
+    """
+
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max_entries
+        self._entries: dict[Hashable, tuple[Hashable, Optional[SeriesPyramid]]] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, version: Hashable,
+            build_points: Callable[[], Optional[list]], aggregation: str) -> Optional[SeriesPyramid]:
+        """
+        Returns the pyramid of the key for the given version, building it
+        from the daily points returned by `build_points` if needed. None
+        is returned (and cached) when there are no points for the key.
+        """
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] == version:
+            self.hits += 1
+            return entry[1]
+        self.misses += 1
+        points = build_points()
+        pyramid = SeriesPyramid(points, aggregation) if points else None
+        with self._lock:
+            if len(self._entries) >= self.max_entries and key not in self._entries:
+                # The oldest entry is dropped, dicts keep the insertion order.
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (version, pyramid)
+        return pyramid
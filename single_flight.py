@@ -0,0 +1,110 @@
+"""
+This python file contains the single-flight layer of the upstream
+requests. Concurrent callers asking for the same (endpoint, parameters)
+key share one in-flight call and its result, and for a short freshness
+window after it completes, new callers reuse that result too.
+"""
+
+import time
+import threading
+from typing import Callable, Hashable
+
+
+class _Call:
+    """An in-flight call, the waiting callers block on its event."""
+
+    def __init__(self) -> None:
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    This class deduplicates the calls made under the same key. It also
+    counts the calls, the actual fetches and the fetches saved, either
+    by sharing an in-flight call or by reusing a fresh result.
+    """
+
+    def __init__(self, freshness: float = 5) -> None:
+        self.freshness = freshness
+        self._in_flight: dict[Hashable, _Call] = {}
+        self._fresh: dict[Hashable, tuple[float, object]] = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.fetches = 0
+        self.shared = 0
+        self.reused = 0
+
+    def do(self, key: Hashable, function: Callable, *args, **kwargs):
+        """
+        Returns the result of `function(*args, **kwargs)` for the key,
+        calling it only if no call for the key is in flight or fresh.
+        The exception of a failed call is raised to all of its callers.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self.calls += 1
+            self._prune(now)
+            fresh = self._fresh.get(key)
+            if fresh is not None:
+                self.reused += 1
+                return fresh[1]
+            call = self._in_flight.get(key)
+            leader = call is None
+            if leader:
+                call = self._in_flight[key] = _Call()
+                self.fetches += 1
+            else:
+                self.shared += 1
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = function(*args, **kwargs)
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._in_flight[key]
+                if call.error is None and self.freshness:
+                    completed = time.monotonic()
+                    # Re-inserted, so the results stay in completion order.
+                    self._fresh.pop(key, None)
+                    self._fresh[key] = (completed, call.result)
+                    self._prune(completed)
+            call.done.set()
+        return call.result
+
+    def _prune(self, now: float) -> None:
+        """
+        Drops the results older than the freshness window. They are held
+        in completion order, so only the expired ones at the front are
+        visited. Must be called with the lock held.
+        """
+        expired = []
+        for key, (completed, _) in self._fresh.items():
+            if now - completed < self.freshness:
+                break
+            expired.append(key)
+        for key in expired:
+            del self._fresh[key]
+
+    def forget(self, key: Hashable) -> None:
+        """Drops the fresh result of the key, the next call fetches again."""
+        with self._lock:
+            self._fresh.pop(key, None)
+
+    def stats(self) -> dict:
+        """Returns the counters, `saved` being the fetches avoided."""
+        return {'calls': self.calls, 'fetches': self.fetches, 'shared': self.shared,
+                'reused': self.reused, 'saved': self.shared + self.reused}
+
+
+# The single-flight layer shared by the covid and news requests
+upstream_requests = SingleFlight()
@@ -0,0 +1,86 @@
+"""
+This python file contains the profile of the dashboard's start up. The
+import of the application module, each phase of the application factory
+and each background warm-up task are timed, and reported as a table
+(when profiling is turned on) and on /metrics.
+
+    DASHBOARD_PROFILE_STARTUP=1 python main.py
+    python main.py --profile-startup
+"""
+
+import time
+
+# The start of the application module's import, which imports this module first.
+IMPORT_STARTED = time.perf_counter()
+
+import os
+import sys
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Iterator
+
+
+@dataclass(frozen=True)
+class Phase:
+    """A timed phase of the start up, and the thread which ran it."""
+    name: str
+    # Seconds since the start of the import, and spent in the phase
+    started: float
+    seconds: float
+    thread: str
+
+
+class StartupProfile:
+    """
+    This class records the phases of the start up, timed from the
+    start of the application module's import.
+    """
+
+    def __init__(self, started: float) -> None:
+        self.started = started
+        self.phases: list[Phase] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Times the code of the `with` block as the named phase."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter())
+
+    def record(self, name: str, start: float, end: float) -> None:
+        """Records a phase which ran from `start` to `end` (perf_counter)."""
+        with self._lock:
+            self.phases.append(Phase(name, start - self.started, end - start,
+                                     threading.current_thread().name))
+
+    def seconds(self) -> dict[str, float]:
+        """Returns the seconds spent in each phase, by name."""
+        with self._lock:
+            return {phase.name: phase.seconds for phase in self.phases}
+
+    def report(self) -> str:
+        """Returns the phases as a table, in the order they started."""
+        with self._lock:
+            phases = sorted(self.phases, key=lambda phase: phase.started)
+        lines = ['%-24s %10s %10s  %s' % ('phase', 'start ms', 'ms', 'thread')]
+        for phase in phases:
+            lines.append('%-24s %10.1f %10.1f  %s' % (phase.name, phase.started * 1000,
+                                                      phase.seconds * 1000, phase.thread))
+        return '\n'.join(lines)
+
+
+def profiling_enabled() -> bool:
+    """Returns whether the start up report is asked for (DASHBOARD_PROFILE_STARTUP)."""
+    return os.environ.get('DASHBOARD_PROFILE_STARTUP', '') not in ('', '0')
+
+
+def print_report(profile: StartupProfile) -> None:
+    """Writes the start up report to the standard error and the log."""
+    report = profile.report()
+    print('Start up profile:\n' + report, file=sys.stderr)
+    logging.info('Start up profile:\n%s', report)
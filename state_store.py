@@ -0,0 +1,212 @@
+"""
+This python file contains the versioned state store shared by the
+scheduled updates and the web requests. The state is published as
+immutable, versioned snapshots: readers take the current snapshot
+without locking, and writers build a new snapshot (copy-on-write)
+which replaces the current one in a single assignment.
+Optionally, the published values are also written to a SQLite file,
+so that several worker processes serve the same data.
+"""
+
+import json
+import time
+import sqlite3
+import logging
+import threading
+from types import MappingProxyType
+from typing import Callable, Iterable, Mapping, Optional
+
+
+class StateSnapshot:
+    """
+    An immutable, versioned view of the state. The values are read
+    as attributes (snapshot.news_articles) or items.
+    """
+
+    __slots__ = ('version', 'values')
+
+    def __init__(self, version: int, values: Mapping) -> None:
+        object.__setattr__(self, 'version', version)
+        object.__setattr__(self, 'values', MappingProxyType(dict(values)))
+
+    def __getattr__(self, name: str):
+        try:
+            return self.values[name]
+        except KeyError:
+            raise AttributeError(name) from None
+
+    def __getitem__(self, name: str):
+        return self.values[name]
+
+    def __setattr__(self, name: str, value) -> None:
+        raise AttributeError('A state snapshot can not be changed, publish a new one')
+
+
+class SqliteStateBackend:
+    """
+    This class shares the published values of the given keys through
+    a SQLite file. Every publish is stamped with the next version of
+    the file, so a process only loads the keys published since the
+    version it last saw.
+    """
+
+    def __init__(self, path: str, shared_keys: Iterable[str]) -> None:
+        self.path = path
+        self.shared_keys = frozenset(shared_keys)
+        self.seen_version = 0
+        connection = self._connect()
+        try:
+            with connection:
+                connection.execute('CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, '
+                                   'value TEXT NOT NULL, version INTEGER NOT NULL, '
+                                   'published REAL NOT NULL)')
+                connection.execute('CREATE TABLE IF NOT EXISTS claims (name TEXT PRIMARY KEY, '
+                                   'claimed REAL NOT NULL)')
+        finally:
+            connection.close()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        return connection
+
+    def write(self, changes: Mapping) -> None:
+        """Writes the shared keys amongst the changes, as one new version."""
+        shared = {key: value for key, value in changes.items() if key in self.shared_keys}
+        if not shared:
+            return
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            version = connection.execute(
+                'SELECT COALESCE(MAX(version), 0) + 1 FROM state').fetchone()[0]
+            connection.executemany(
+                'INSERT OR REPLACE INTO state VALUES (?, ?, ?, ?)',
+                [(key, json.dumps(value, separators=(',', ':')), version, time.time())
+                 for key, value in shared.items()])
+            connection.execute('COMMIT')
+            # The own writes need not be read back.
+            if version == self.seen_version + 1:
+                self.seen_version = version
+        finally:
+            connection.close()
+
+    def read_newer(self) -> dict:
+        """Returns the shared values published since the last read."""
+        connection = self._connect()
+        try:
+            rows = connection.execute('SELECT key, value, version FROM state WHERE version > ?',
+                                      (self.seen_version,)).fetchall()
+        finally:
+            connection.close()
+        if rows:
+            self.seen_version = max(row[2] for row in rows)
+        return {key: json.loads(value) for key, value, _ in rows}
+
+    def claim(self, name: str, seconds: float) -> bool:
+        """
+        Claims the named task for the given seconds, returns False when
+        another process holds the claim. This lets a single process
+        fetch the data which all of them then share.
+        """
+        connection = self._connect()
+        try:
+            connection.execute('BEGIN IMMEDIATE')
+            row = connection.execute('SELECT claimed FROM claims WHERE name = ?',
+                                     (name,)).fetchone()
+            now = time.time()
+            if row is not None and now - row[0] < seconds:
+                connection.execute('ROLLBACK')
+                return False
+            connection.execute('INSERT OR REPLACE INTO claims VALUES (?, ?)', (name, now))
+            connection.execute('COMMIT')
+            return True
+        finally:
+            connection.close()
+
+
+class StateStore:
+    """
+    This class holds the current snapshot. snapshot() is lock-free,
+    publish() and transact() serialise the writers with a lock and
+    swap in the new snapshot atomically.
+    """
+
+    def __init__(self, backend: Optional[SqliteStateBackend] = None,
+                 poll_interval: float = 1, **initial) -> None:
+        self._snapshot = StateSnapshot(0, initial)
+        self._write_lock = threading.Lock()
+        self._backend = backend
+        self._poll_interval = poll_interval
+        self._next_poll = 0.0
+
+    @property
+    def version(self) -> int:
+        """The version of the current snapshot."""
+        return self.snapshot().version
+
+    def snapshot(self) -> StateSnapshot:
+        """Returns the current snapshot, with the other processes' values once polled."""
+        if self._backend is not None and time.monotonic() >= self._next_poll:
+            self._poll_backend()
+        return self._snapshot
+
+    def publish(self, **changes) -> StateSnapshot:
+        """Publishes a new snapshot with the given values changed."""
+        return self.transact(lambda snapshot: changes)
+
+    def transact(self, build_changes: Callable[[StateSnapshot], Mapping]) -> StateSnapshot:
+        """
+        Calls build_changes with the current snapshot, while holding the
+        write lock, and publishes the changes it returns. This is used for
+        read-modify-write updates such as merging into a dict.
+        """
+        with self._write_lock:
+            current = self._snapshot
+            changes = build_changes(current)
+            if not changes:
+                return current
+            self._snapshot = StateSnapshot(current.version + 1, {**current.values, **changes})
+            if self._backend is not None:
+                try:
+                    self._backend.write(changes)
+                except (sqlite3.Error, TypeError, ValueError):
+                    logging.exception('Could not share the published state')
+            return self._snapshot
+
+    def claim(self, name: str, seconds: float) -> bool:
+        """
+        Returns whether this process should run the named task, which is
+        always the case without a backend. With one, only the first process
+        to claim the task in the given seconds runs it.
+        """
+        if self._backend is None:
+            return True
+        try:
+            return self._backend.claim(name, seconds)
+        except sqlite3.Error:
+            logging.exception('Could not claim the %s task, running it anyway', name)
+            return True
+
+    def attach_backend(self, backend: SqliteStateBackend) -> None:
+        """Starts sharing the published values through the backend."""
+        with self._write_lock:
+            self._backend = backend
+            self._next_poll = 0.0
+
+    def _poll_backend(self) -> None:
+        # Only one reader polls, the others keep serving the current snapshot.
+        if not self._write_lock.acquire(blocking=False):
+            return
+        try:
+            self._next_poll = time.monotonic() + self._poll_interval
+            try:
+                changes = self._backend.read_newer()
+            except sqlite3.Error:
+                logging.exception('Could not read the shared state')
+                return
+            if changes:
+                current = self._snapshot
+                self._snapshot = StateSnapshot(current.version + 1, {**current.values, **changes})
+        finally:
+            self._write_lock.release()
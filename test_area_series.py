@@ -0,0 +1,77 @@
+from datetime import date, timedelta
+from area_series import AreaSeries
+from covid_data_handler import covid_API_request
+
+def make_rows(days, first_cases=100, latest=None):
+    # Rows for consecutive days ending at `latest`, latest first
+    latest = latest or date(2021, 10, 28)
+    return [{'date': (latest - timedelta(days=day)).isoformat(),
+             'newCasesBySpecimenDate': first_cases + day} for day in range(days)]
+
+def test_area_series_seven_day_sum_matches_slice():
+    # To ensure the 7-day sum matches the rows 1 to 8, latest first
+    series = AreaSeries()
+    rows = make_rows(30)
+    series.merge(rows)
+    assert series.seven_day_sum == sum(row['newCasesBySpecimenDate'] for row in rows[1:8])
+    assert series.payload()['data'] == rows
+
+def test_area_series_incremental_merge():
+    # To ensure only new or revised rows are kept, and the 7-day sum
+    # follows them without being recomputed from scratch
+    series = AreaSeries()
+    series.merge(make_rows(30))
+    newer = make_rows(2, first_cases=500, latest=date(2021, 10, 30))
+    revised = [dict(make_rows(1)[0], newCasesBySpecimenDate=1)]
+    changed = series.merge(newer + revised + make_rows(30)[1:3])
+    assert changed == ['2021-10-28', '2021-10-29', '2021-10-30']
+    expected = sorted(series.payload()['data'], key=lambda row: row['date'], reverse=True)
+    assert series.seven_day_sum == sum(row['newCasesBySpecimenDate'] for row in expected[1:8])
+    assert series.latest_date == '2021-10-30'
+
+def test_area_series_unchanged_rows_are_ignored():
+    # To ensure merging the same rows again changes nothing
+    series = AreaSeries()
+    series.merge(make_rows(10))
+    assert series.merge(make_rows(10)) == []
+
+def test_area_series_merged_leaves_the_series_unchanged():
+    # To ensure merging into a series returns a new one, so a published
+    # series (and the snapshots holding it) never changes
+    series = AreaSeries()
+    series.merge(make_rows(30))
+    before = series.payload()
+    merged, changed = series.merged(make_rows(2, first_cases=500, latest=date(2021, 10, 30)))
+    assert changed == ['2021-10-29', '2021-10-30'] and merged is not series
+    assert series.payload() == before and series.latest_date == '2021-10-28'
+    assert merged.latest_date == '2021-10-30'
+    assert series.merged(make_rows(10)) == (series, [])
+
+def test_covid_API_request_publishes_a_new_series(isolated_store):
+    # To ensure an update publishes a new series instead of changing the
+    # one held by the earlier snapshots
+    rows = make_rows(10, latest=date.today() - timedelta(days=1))
+    covid_API_request(location='Copyshire', client=lambda filters, structure: {'data': rows})
+    held = isolated_store.snapshot().area_series[('Copyshire', 'ltla')]
+    revised = [dict(rows[0], newCasesBySpecimenDate=1)] + rows[1:]
+    covid_API_request(location='Copyshire', client=lambda filters, structure: {'data': revised})
+    after = isolated_store.snapshot().area_series[('Copyshire', 'ltla')]
+    assert after is not held
+    assert held.payload()['data'][0]['newCasesBySpecimenDate'] == 100
+    assert after.payload()['data'][0]['newCasesBySpecimenDate'] == 1
+
+def test_covid_API_request_incremental_requests_recent_days(isolated_store):
+    # To ensure an incremental update only asks for the recent days
+    requested = []
+    latest = date.today() - timedelta(days=2)
+    def client(filters, structure):
+        requested.append(filters)
+        dates = [f.split('=')[1] for f in filters if f.startswith('date=')]
+        rows = make_rows(60, latest=latest)
+        return {'data': [row for row in rows if not dates or row['date'] in dates]}
+    covid_API_request(location='Testshire', client=client)
+    requested.clear()
+    data = covid_API_request(location='Testshire', client=client, incremental=True)
+    assert all(len(filters) == 3 for filters in requested)
+    assert len(requested) == 8
+    assert len(data['data']) == 60
@@ -0,0 +1,74 @@
+import gzip
+from area_store import AreaStore
+
+HEADER = ('areaCode,areaName,areaType,date,cumDailyNsoDeathsByDeathDate,'
+          'hospitalCases,newCasesBySpecimenDate\n')
+
+def write_dump(path, rows, compress=False):
+    text = HEADER + ''.join(row + '\n' for row in rows)
+    if compress:
+        with gzip.open(path, 'wt', encoding='utf-8') as file:
+            file.write(text)
+    else:
+        path.write_text(text, encoding='utf-8')
+
+def test_area_store_ingest_directory(tmp_path):
+    # To ensure plain and gzipped dumps of several area types are
+    # ingested, and each area is served latest first
+    dumps = tmp_path / 'dumps'
+    dumps.mkdir()
+    write_dump(dumps / 'nation.csv', ['E92000001,England,nation,2021-10-28,,7019,',
+                                      'E92000001,England,nation,2021-10-27,,6951,8786'])
+    write_dump(dumps / 'ltla.csv.gz', ['E07000041,Exeter,ltla,2021-10-28,,,120'], True)
+    (dumps / 'notes.txt').write_text('not a dump')
+    store = AreaStore(str(tmp_path / 'areas.sqlite3'))
+    assert store.ingest_directory(str(dumps)) == {'ingested': 2, 'skipped': 0,
+                                                  'failed': 0, 'rows': 3}
+    england = store.series('England', 'nation')
+    assert [row['date'] for row in england['data']] == ['2021-10-28', '2021-10-27']
+    assert england['data'][1]['newCasesBySpecimenDate'] == 8786
+    assert england['data'][0]['newCasesBySpecimenDate'] is None
+    assert store.areas('ltla') == ['Exeter']
+    assert store.series('Nowhere', 'ltla') is None
+
+def test_area_store_skips_unchanged_files(tmp_path):
+    # To ensure an unchanged dump is skipped, and a changed one
+    # upserts its rows instead of duplicating them
+    dump = tmp_path / 'nation.csv'
+    write_dump(dump, ['E92000001,England,nation,2021-10-28,,7019,'])
+    store = AreaStore(str(tmp_path / 'areas.sqlite3'))
+    assert store.ingest_file(str(dump)) == 1
+    assert store.ingest_file(str(dump)) is None
+    write_dump(dump, ['E92000001,England,nation,2021-10-28,,7019,8000',
+                      'E92000001,England,nation,2021-10-29,,7100,'])
+    assert store.ingest_file(str(dump)) == 2
+    rows = store.series('England', 'nation')['data']
+    assert len(rows) == 2
+    assert rows[1]['newCasesBySpecimenDate'] == 8000
+
+def test_area_store_bad_dump(tmp_path):
+    # To ensure a dump without the key columns fails alone
+    dumps = tmp_path / 'dumps'
+    dumps.mkdir()
+    (dumps / 'bad.csv').write_text('name,value\nx,1\n')
+    write_dump(dumps / 'nation.csv', ['E92000001,England,nation,2021-10-28,,7019,'])
+    store = AreaStore(str(tmp_path / 'areas.sqlite3'))
+    summary = store.ingest_directory(str(dumps))
+    assert summary['failed'] == 1 and summary['ingested'] == 1
+
+def test_area_store_truncated_dump(tmp_path):
+    # To ensure the short rows of a truncated dump are read with their
+    # missing cells empty (or skipped without a date), and the dumps
+    # after it are still ingested
+    dumps = tmp_path / 'dumps'
+    dumps.mkdir()
+    write_dump(dumps / 'a_ltla.csv', ['E07000041,Exeter,ltla,2021-10-28,,,120',
+                                      'E07000041,Exeter,ltla,2021-10-27,,3',
+                                      'E07000041,Exet'])
+    write_dump(dumps / 'nation.csv', ['E92000001,England,nation,2021-10-28,,7019,'])
+    store = AreaStore(str(tmp_path / 'areas.sqlite3'))
+    assert store.ingest_directory(str(dumps)) == {'ingested': 2, 'skipped': 0,
+                                                  'failed': 0, 'rows': 3}
+    exeter = store.series('Exeter', 'ltla')['data']
+    assert [row['hospitalCases'] for row in exeter] == [None, 3]
+    assert exeter[1]['newCasesBySpecimenDate'] is None
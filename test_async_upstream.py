@@ -0,0 +1,106 @@
+import json
+import asyncio
+import threading
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+import pytest
+httpx = pytest.importorskip('httpx')
+from fetch_pool import is_transient
+from async_upstream import AsyncCovidClient, AsyncSingleFlight, async_request_recent_days
+
+class FakeUpstream(BaseHTTPRequestHandler):
+    # A local stand-in for the data endpoint of the Covid API, which
+    # fails the first request of each date filter with a 503
+    protocol_version = 'HTTP/1.1'
+    pages = []
+    failed = set()
+
+    def do_GET(self):
+        FakeUpstream.pages.append(self.path)
+        query = parse_qs(urlsplit(self.path).query)
+        filters, page = query['filters'][0], int(query['page'][0])
+        if 'date=' in filters and filters not in FakeUpstream.failed:
+            FakeUpstream.failed.add(filters)
+            self.answer(503, b'{}')
+        elif page > 2 or ('date=' in filters and page > 1):
+            self.send_response(204)
+            self.end_headers()
+        else:
+            day = filters.rsplit('date=', 1)[1] if 'date=' in filters else '2021-10-%02d' % page
+            self.answer(200, json.dumps({'data': [{'date': day}]}).encode())
+
+    def answer(self, status, body):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def upstream():
+    FakeUpstream.pages = []
+    FakeUpstream.failed = set()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeUpstream)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield 'http://127.0.0.1:%d' % server.server_port
+    server.shutdown()
+    server.server_close()
+
+def test_async_covid_client_pages(upstream):
+    # To ensure every page is requested until the API answers 204,
+    # with the filters and structure of the Cov19API library
+    async def scenario():
+        async with httpx.AsyncClient() as http:
+            covid = AsyncCovidClient(http, upstream + '/v1/data')
+            return await covid.get(['areaType=ltla', 'areaName=Exeter'], {'date': 'date'})
+    data = asyncio.run(scenario())
+    assert [row['date'] for row in data['data']] == ['2021-10-01', '2021-10-02']
+    assert data['length'] == 2 and data['totalPages'] == 2
+    assert 'filters=areaType%3Dltla%3BareaName%3DExeter' in FakeUpstream.pages[0]
+
+def test_async_request_recent_days_retries_failed_requests(upstream):
+    # To ensure the asyncio refresh retries a failed (5xx) request with
+    # backoff, like the blocking one, instead of dropping its day
+    today = date.today()
+
+    async def scenario():
+        async with httpx.AsyncClient() as http:
+            covid = AsyncCovidClient(http, upstream + '/v1/data')
+            return await async_request_recent_days(['areaType=ltla'], today.isoformat(),
+                                                   covid, revision_days=1)
+    rows = asyncio.run(scenario())
+    assert sorted(row['date'] for row in rows) == \
+        [(today - timedelta(days=1)).isoformat(), today.isoformat()]
+    assert len(FakeUpstream.failed) == 2
+
+def test_is_transient_httpx_errors():
+    # To ensure the errors of the asyncio client are told apart like
+    # the blocking ones: connection failures and 5xx are transient
+    request = httpx.Request('GET', 'http://127.0.0.1/v1/data')
+
+    def status_error(status):
+        response = httpx.Response(status, request=request)
+        return httpx.HTTPStatusError('status', request=request, response=response)
+    assert is_transient(httpx.ConnectError('refused', request=request))
+    assert is_transient(httpx.ReadTimeout('slow', request=request))
+    assert is_transient(status_error(503)) and is_transient(status_error(429))
+    assert not is_transient(status_error(404))
+
+def test_async_single_flight():
+    # To ensure concurrent callers of a key share one call
+    calls = []
+
+    async def fetch():
+        calls.append(1)
+        await asyncio.sleep(0.05)
+        return 'result'
+
+    async def scenario():
+        flight = AsyncSingleFlight()
+        results = await asyncio.gather(*(flight.do('key', fetch) for _ in range(5)))
+        return results, flight.shared
+    results, shared = asyncio.run(scenario())
+    assert results == ['result'] * 5 and len(calls) == 1 and shared == 4
@@ -0,0 +1,64 @@
+from csv_columns import load_csv_columns
+from csv_columns import columns_from_lines
+from csv_columns import headline_metrics
+from covid_data_handler import parse_csv_data
+from covid_data_handler import process_covid_csv_data
+
+def test_load_csv_columns_types():
+    # To ensure every column is parsed once into its typed array
+    columns = load_csv_columns('nation_2021-10-28.csv')
+    assert len(columns) == 638
+    assert columns['areaName'][0] == 'England'
+    assert columns['date'][0] == '2021-10-28'
+    assert columns['hospitalCases'][0] == 7019
+    # Blank cells are flagged as missing instead of parsed
+    assert columns['newCasesBySpecimenDate'][0] is None
+
+def test_headline_metrics_from_columns():
+    # To ensure the columnar metrics match the row based values
+    columns = load_csv_columns('nation_2021-10-28.csv')
+    assert headline_metrics(columns) == (240299, 7019, 141544)
+    assert process_covid_csv_data(columns) == (240299, 7019, 141544)
+
+def test_columns_from_lines_matches_file():
+    # To ensure the rows read by parse_csv_data give the same columns
+    columns = columns_from_lines(parse_csv_data('nation_2021-10-28.csv'))
+    assert headline_metrics(columns) == (240299, 7019, 141544)
+
+def test_load_csv_columns_empty_file(tmp_path):
+    # To ensure an empty file does not fail the memory mapping
+    empty = tmp_path / 'empty.csv'
+    empty.write_text('')
+    assert headline_metrics(load_csv_columns(str(empty))) == (0, 0, 0)
+
+def test_load_csv_columns_ragged_rows(tmp_path):
+    # To ensure short rows are padded with missing values
+    ragged = tmp_path / 'ragged.csv'
+    ragged.write_text('areaName,date,hospitalCases,newCasesBySpecimenDate\r\n'
+                      'England,2021-10-28,7019\r\n'
+                      'England,2021-10-27,6951,8786\r\n')
+    columns = load_csv_columns(str(ragged))
+    assert len(columns) == 2
+    assert columns['newCasesBySpecimenDate'][0] is None
+    assert columns['newCasesBySpecimenDate'][1] == 8786
+    assert columns['date'][1] == '2021-10-27'
+
+def test_load_csv_columns_quoted_and_misaligned_rows(tmp_path):
+    # To ensure quoted cells keep their commas, rows whose lengths
+    # cancel out are not misaligned, and rows without a date are skipped
+    quoted = tmp_path / 'quoted.csv'
+    quoted.write_text('areaName,date,hospitalCases\r\n'
+                      '"Bristol, City of",2021-10-28,12\r\n')
+    columns = load_csv_columns(str(quoted))
+    assert columns['areaName'][0] == 'Bristol, City of'
+    assert columns['hospitalCases'][0] == 12
+    ragged = tmp_path / 'ragged.csv'
+    ragged.write_text('areaName,date,hospitalCases\r\n'
+                      'Exeter,2021-10-27\r\n'
+                      'Exeter,2021-10-26,5,99\r\n'
+                      'Exeter\r\n')
+    columns = load_csv_columns(str(ragged))
+    assert len(columns) == 2
+    assert [columns['hospitalCases'][index] for index in range(2)] == [None, 5]
+    assert columns['date'][1] == '2021-10-26'
+    assert columns['hospitalCases'][-1] == 5
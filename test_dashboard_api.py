@@ -0,0 +1,166 @@
+import os
+import json
+import gzip
+import time
+from datetime import date, timedelta
+import pytest
+from area_series import AreaSeries
+from config_loader import load_config
+
+def local_rows(days=30, latest=date(2021, 10, 28)):
+    # Exeter's rows for consecutive days ending at `latest`, latest first
+    return [{'areaName': 'Exeter', 'areaType': 'ltla',
+             'date': (latest - timedelta(days=day)).isoformat(),
+             'newCasesBySpecimenDate': 100 + day} for day in range(days)]
+
+@pytest.fixture(scope='module')
+def client(tmp_path_factory):
+    # The dashboard started once from a scratch directory, with its
+    # config, CSV and cache there and without the start up refresh
+    work_dir = tmp_path_factory.mktemp('dashboard')
+    with open('config.json', encoding='utf-8') as file:
+        config = json.load(file)
+    config.update({'cache_file': str(work_dir / 'cache.sqlite3'), 'refresh_on_start': False})
+    (work_dir / 'config.json').write_text(json.dumps(config))
+    (work_dir / config['file_name']).write_bytes(open(config['file_name'], 'rb').read())
+    cwd = os.getcwd()
+    os.chdir(work_dir)
+    load_config.cache_clear()
+    import main
+    app = main.create_app()
+    main.warmed_up.wait()
+    yield app.test_client()
+    os.chdir(cwd)
+    load_config.cache_clear()
+
+def test_api_headline(client, isolated_store):
+    # To ensure the headline holds the national figures of the CSV and
+    # the local 7-day sum kept by the area's series, without rendering
+    # the dashboard
+    import main
+    rows = local_rows()
+    series = AreaSeries()
+    series.merge(rows)
+    isolated_store.publish(local_data_from_api={'data': rows},
+                           area_series={('Exeter', 'ltla'): series})
+    renders = main.dashboard_snapshots.misses
+    response = client.get('/api/headline')
+    assert response.status_code == 200
+    assert response.json == {
+        'national': {'location': 'England', 'last7days_cases': 240299,
+                     'current_hospital_cases': 7019, 'total_deaths': 141544},
+        'local': {'location': 'Exeter', 'last7days_cases': sum(range(101, 108))}}
+    assert main.dashboard_snapshots.misses == renders
+
+def test_api_etag_and_gzip(client, isolated_store):
+    # To ensure a client holding the current ETag gets a 304, and a
+    # client accepting gzip a gzipped body
+    first = client.get('/api/headline')
+    assert first.headers['Cache-Control'] == 'no-cache'
+    again = client.get('/api/headline', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304 and again.data == b''
+    zipped = client.get('/api/headline', headers={'Accept-Encoding': 'gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert json.loads(gzip.decompress(zipped.data)) == first.json
+    # New local data changes the ETag
+    isolated_store.publish(local_data_from_api={'data': local_rows()})
+    changed = client.get('/api/headline', headers={'If-None-Match': first.headers['ETag']})
+    assert changed.status_code == 200
+
+def test_api_area_series_and_metrics(client, isolated_store):
+    # To ensure the series of a tracked area is served latest first,
+    # its windows summed, and unknown areas answered with a 404
+    rows = local_rows()
+    isolated_store.publish(area_data={('Exeter', 'ltla'): {'data': rows, 'length': 30}})
+    series = client.get('/api/areas/ltla/Exeter/series')
+    assert series.status_code == 200 and series.json['data'][0]['date'] == '2021-10-28'
+    assert client.get('/api/areas/ltla/Nowhere/series').status_code == 404
+    metrics = client.get('/api/areas/ltla/Exeter/metrics').json
+    assert metrics['latest_date'] == '2021-10-28'
+    assert metrics['sums']['7'] == sum(range(101, 108))
+    assert client.get('/api/areas/ltla/Exeter/metrics?metric=hospitalCases').status_code == 400
+
+def test_api_news_and_updates(client, isolated_store):
+    # To ensure the news and the scheduled updates are listed
+    isolated_store.publish(news_articles=[{'title': 'Booster rollout', 'url': 'https://a/1'}])
+    assert client.get('/api/news').json == {
+        'articles': [{'title': 'Booster rollout', 'url': 'https://a/1'}]}
+    updates = client.get('/api/updates').json['updates']
+    assert isinstance(updates, list)
+    assert all(set(update) == {'id', 'title', 'content', 'fire_time'} for update in updates)
+
+def test_metrics_endpoint(client):
+    # To ensure /metrics is registered with the other routes (before the
+    # server is started) and serves the cache and start up metrics
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.headers['Content-Type'].startswith('text/plain; version=0.0.4')
+    text = response.data.decode()
+    assert 'dashboard_cache_hits_total{cache="dashboard_snapshot"}' in text
+    assert 'dashboard_startup_seconds{phase="import main"}' in text
+    assert 'dashboard_startup_seconds{phase="flask app"}' in text
+
+def test_api_chart_keeps_pyramid_across_news(client, isolated_store):
+    # To ensure an area's chart pyramid is kept when the news (or any
+    # other area) is refreshed, and built again when the area's data changes
+    import main
+    series = AreaSeries()
+    series.merge(local_rows())
+    isolated_store.publish(area_series={('Exeter', 'ltla'): series})
+    url = '/api/areas/ltla/Exeter/chart?points=10'
+    first = client.get(url)
+    assert first.status_code == 200 and first.json['length'] == 30
+    nation = client.get('/api/areas/nation/England/chart?points=10')
+    assert nation.status_code == 200
+    misses = main.series_pyramids.misses
+    isolated_store.publish(news_articles=[{'title': 'Booster rollout', 'url': 'https://a/1'}])
+    assert client.get(url).json == first.json
+    assert client.get('/api/areas/nation/England/chart?points=10').json == nation.json
+    assert main.series_pyramids.misses == misses
+    newer, _ = series.merged(local_rows(days=1, latest=date(2021, 10, 29)))
+    isolated_store.publish(area_series={('Exeter', 'ltla'): newer})
+    assert client.get(url).json['length'] == 31
+    assert main.series_pyramids.misses == misses + 1
+
+def test_index_etag_and_user_changes(client, isolated_store):
+    # To ensure /index is served with an ETag (and a 304 when the browser
+    # holds it), rebuilt when an update is added or deleted, and that a
+    # malformed update time is rejected without invalidating it
+    import main
+    first = client.get('/index')
+    assert first.status_code == 200 and first.headers['ETag']
+    again = client.get('/index', headers={'If-None-Match': first.headers['ETag']})
+    assert again.status_code == 304
+    version = main.user_changes_version
+    assert client.get('/index?two=Nightly&update=25:99&covid-data=on').status_code == 400
+    assert main.user_changes_version == version
+    unchanged = client.get('/index', headers={'If-None-Match': first.headers['ETag']})
+    assert unchanged.status_code == 304
+    # An update due in about a day, so it never fires during the tests
+    update_time = time.strftime('%H:%M', time.localtime(time.time() - 120))
+    added = client.get('/index?two=Nightly&update=%s&covid-data=on' % update_time)
+    assert added.headers['ETag'] != first.headers['ETag'] and b'Nightly' in added.data
+    update_id = next(update.update_id for update in main.update_registry
+                     if update.title == 'Nightly')
+    deleted = client.get('/index?update_item=%d' % update_id)
+    assert deleted.headers['ETag'] != added.headers['ETag']
+    assert b'Nightly' not in deleted.data
+
+def test_api_area_series_keyed_on_its_snapshot(client, isolated_store, monkeypatch):
+    # To ensure a series read from a snapshot is cached under that
+    # snapshot's version, so a publish racing the request is not hidden
+    older, newer = AreaSeries(), AreaSeries()
+    older.merge(local_rows(days=3))
+    newer.merge(local_rows(days=4))
+    isolated_store.publish(area_series={('Exeter', 'ltla'): older})
+    snapshot = isolated_store.snapshot
+
+    def racing_snapshot():
+        # A publish landing right after the request reads its snapshot
+        state = snapshot()
+        monkeypatch.setattr(isolated_store, 'snapshot', snapshot)
+        isolated_store.publish(area_series={('Exeter', 'ltla'): newer})
+        return state
+    monkeypatch.setattr(isolated_store, 'snapshot', racing_snapshot)
+    assert client.get('/api/areas/ltla/Exeter/series').json['length'] == 3
+    assert client.get('/api/areas/ltla/Exeter/series').json['length'] == 4
@@ -0,0 +1,27 @@
+from dashboard_snapshot import SnapshotCache
+
+def test_snapshot_rebuilt_only_when_stale():
+    # To ensure the dashboard is only rendered again once the
+    # version of the data changes
+    renders = []
+    def render(context):
+        renders.append(context)
+        return '<h1>' + str(context['cases']) + '</h1>'
+    cache = SnapshotCache(lambda: {'cases': len(renders)}, render)
+    first = cache.get((1, 0))
+    assert cache.get((1, 0)) is first
+    assert len(renders) == 1
+    second = cache.get((2, 0))
+    assert second.html == '<h1>1</h1>'
+    assert second.etag != first.etag
+    assert len(renders) == 2
+
+def test_snapshot_context_is_read_only():
+    # To ensure a served snapshot can not be changed in place
+    cache = SnapshotCache(lambda: {'cases': 1}, lambda context: '')
+    snapshot = cache.get(0)
+    try:
+        snapshot.context['cases'] = 2
+        assert False
+    except TypeError:
+        assert snapshot.context['cases'] == 1
@@ -0,0 +1,159 @@
+import time
+import asyncio
+import threading
+import pytest
+import requests
+from uk_covid19.exceptions import FailedRequestError
+import global_vars
+from fetch_pool import RateLimiter
+from fetch_pool import retry_with_backoff, async_retry_with_backoff
+from fetch_pool import fetch_concurrently
+import covid_data_handler
+from covid_data_handler import covid_API_request_batch
+
+def fake_client(latency=0.05):
+    # A stand-in for the Cov19API client, answering after a fixed
+    # latency with a single row for the requested area
+    calls = []
+    def client(filters, structure):
+        calls.append(filters)
+        time.sleep(latency)
+        location_type = filters[0].split('=')[1]
+        location = filters[1].split('=')[1]
+        return {'data': [{'areaName': location, 'areaType': location_type}]}
+    client.calls = calls
+    return client
+
+def http_error(status):
+    # An HTTPError as raised by raise_for_status for the status
+    response = requests.Response()
+    response.status_code = status
+    return requests.HTTPError(response=response)
+
+def failed_request_error(status):
+    # A FailedRequestError as raised by the Cov19API client for the status
+    response = requests.Response()
+    response.status_code, response.reason = status, 'Reason'
+    response._content, response.url = b'', 'https://api.coronavirus.data.gov.uk/v1/data'
+    return FailedRequestError(response=response, params={})
+
+def test_covid_API_request_batch_concurrent_speedup(isolated_store):
+    # To ensure a batch of areas is fetched concurrently, measured
+    # against the same batch fetched one area at a time
+    areas = [('Area' + str(i), 'ltla') for i in range(20)]
+    start = time.perf_counter()
+    covid_API_request_batch(areas, max_workers=1, rate_limiter=RateLimiter(0),
+                            client=fake_client())
+    sequential = time.perf_counter() - start
+    start = time.perf_counter()
+    results = covid_API_request_batch(areas, max_workers=10, rate_limiter=RateLimiter(0),
+                                      client=fake_client())
+    concurrent = time.perf_counter() - start
+    assert len(results) == 20
+    assert concurrent < sequential / 3
+
+def test_covid_API_request_batch_merges_into_store(isolated_store):
+    # To ensure the per-area store keeps earlier areas when merging
+    covid_API_request_batch([('Exeter', 'ltla')], client=fake_client(0))
+    covid_API_request_batch([('England', 'nation')], client=fake_client(0))
+    assert global_vars.store.snapshot().area_data[('Exeter', 'ltla')]['data'][0]['areaName'] == 'Exeter'
+    assert global_vars.store.snapshot().area_data[('England', 'nation')]['data'][0]['areaType'] == 'nation'
+
+def test_covid_API_request_batch_shares_rate_limiter(isolated_store, monkeypatch):
+    # To ensure concurrent batches share the budget of the host,
+    # instead of each getting their own
+    monkeypatch.setattr(covid_data_handler, 'covid_rate_limiter', RateLimiter(50))
+    areas = [[('Area' + str(i), kind) for i in range(3)] for kind in ('ltla', 'utla')]
+    start = time.perf_counter()
+    threads = [threading.Thread(target=covid_API_request_batch, args=(batch,),
+                                kwargs={'client': fake_client(0)}) for batch in areas]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    # Six calls at 50 per second take at least 0.1 seconds
+    assert time.perf_counter() - start >= 0.09
+
+def test_covid_API_request_batch_skips_failed_areas(isolated_store):
+    # To ensure an area failing every retry does not fail the batch
+    def client(filters, structure):
+        if filters[1] == 'areaName=Broken':
+            raise ConnectionError('upstream failure')
+        return {'data': []}
+    results = covid_API_request_batch([('Broken', 'ltla'), ('Exeter', 'ltla')],
+                                      retries=0, client=client)
+    assert list(results) == [('Exeter', 'ltla')]
+
+def test_retry_with_backoff():
+    # To ensure failed calls are retried until they succeed
+    attempts = []
+    def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise ConnectionError('upstream failure')
+        return 'ok'
+    assert retry_with_backoff(flaky, retries=3, base_delay=0.001) == 'ok'
+    assert len(attempts) == 3
+
+def test_retry_with_backoff_only_transient_errors():
+    # To ensure throttled and failed (5xx) responses are retried, also
+    # when raised by the Cov19API client, but not client errors nor bugs
+    for error, calls in ((http_error(503), 3), (http_error(429), 3),
+                         (http_error(404), 1), (KeyError('data'), 1),
+                         (failed_request_error(429), 3), (failed_request_error(500), 3),
+                         (failed_request_error(404), 1)):
+        attempts = []
+        def failing():
+            attempts.append(1)
+            raise error
+        with pytest.raises(type(error)):
+            retry_with_backoff(failing, retries=2, base_delay=0.001)
+        assert len(attempts) == calls
+
+def test_async_retry_with_backoff():
+    # To ensure the asyncio requests follow the same retry policy:
+    # transient errors are retried, the others raised straight away
+    attempts = []
+    async def flaky():
+        attempts.append(1)
+        if len(attempts) < 3:
+            raise http_error(503)
+        return 'ok'
+    assert asyncio.run(async_retry_with_backoff(flaky, retries=3, base_delay=0.001)) == 'ok'
+    assert len(attempts) == 3
+    attempts.clear()
+    async def missing():
+        attempts.append(1)
+        raise http_error(404)
+    with pytest.raises(requests.HTTPError):
+        asyncio.run(async_retry_with_backoff(missing, retries=3, base_delay=0.001))
+    assert len(attempts) == 1
+
+def test_rate_limiter_spaces_calls_per_host():
+    # To ensure calls to one host are spaced out, but not across hosts
+    limiter = RateLimiter(requests_per_second=50)
+    start = time.perf_counter()
+    for _ in range(5):
+        limiter.acquire('api.example')
+    assert time.perf_counter() - start >= 0.07
+    start = time.perf_counter()
+    limiter.acquire('other.example')
+    assert time.perf_counter() - start < 0.02
+
+def test_fetch_concurrently_bounded_workers():
+    # To ensure no more than max_workers fetches run at the same time
+    running = []
+    peak = []
+    lock = threading.Lock()
+    def fetch(key):
+        with lock:
+            running.append(key)
+            peak.append(len(running))
+        time.sleep(0.01)
+        with lock:
+            running.remove(key)
+        return key
+    results, failures = fetch_concurrently(range(12), fetch, max_workers=3)
+    assert sorted(results) == list(range(12))
+    assert not failures
+    assert max(peak) <= 3
@@ -0,0 +1,30 @@
+import gzip
+import json
+from json_cache import JsonResponseCache
+
+def test_json_cache_built_once_per_version():
+    # To ensure a response is only serialised again for a new version
+    builds = []
+    def build():
+        builds.append(1)
+        return {'cases': len(builds)}
+    cache = JsonResponseCache()
+    first = cache.get('headline', 1, build)
+    assert cache.get('headline', 1, build) is first
+    second = cache.get('headline', 2, build)
+    assert len(builds) == 2
+    assert json.loads(second.body) == {'cases': 2}
+    assert second.etag != first.etag
+
+def test_json_cache_gzipped_body():
+    # To ensure the gzipped body holds the same JSON
+    cached = JsonResponseCache().get('news', 1, lambda: {'articles': ['a'] * 100})
+    assert gzip.decompress(cached.gzipped) == cached.body
+    assert len(cached.gzipped) < len(cached.body)
+
+def test_json_cache_bounded():
+    # To ensure the cache never holds more than max_entries
+    cache = JsonResponseCache(max_entries=3)
+    for area in range(10):
+        cache.get(('series', area), 1, lambda: {})
+    assert len(cache._entries) <= 3
@@ -0,0 +1,43 @@
+import pytest
+from metrics import MetricsRegistry
+
+def test_metrics_histogram_exposition():
+    # To ensure the buckets are written cumulatively, with the
+    # sum and count of the observations
+    registry = MetricsRegistry()
+    histogram = registry.histogram('render_seconds', 'Render time.', buckets=(0.1, 1))
+    histogram.observe(0.05)
+    histogram.observe(0.5)
+    histogram.observe(5)
+    text = registry.exposition()
+    assert '# TYPE render_seconds histogram' in text
+    assert 'render_seconds_bucket{le="0.1"} 1' in text
+    assert 'render_seconds_bucket{le="1"} 2' in text
+    assert 'render_seconds_bucket{le="+Inf"} 3' in text
+    assert 'render_seconds_sum 5.55' in text
+    assert 'render_seconds_count 3' in text
+
+def test_metrics_counter_labels():
+    # To ensure counters are kept per label values, and registering
+    # the same name twice returns the same counter
+    registry = MetricsRegistry()
+    failures = registry.counter('failures_total', 'Failures.', ['api'])
+    failures.inc(api='news')
+    registry.counter('failures_total', 'Failures.', ['api']).inc(2, api='news')
+    failures.inc(api='covid')
+    assert failures.value(api='news') == 3
+    assert 'failures_total{api="covid"} 1' in registry.exposition()
+
+def test_metrics_callback_and_timer():
+    # To ensure callback metrics are read when written out, and the
+    # timer observes the with block even when it raises
+    registry = MetricsRegistry()
+    queue = [1, 2]
+    registry.callback('queue_depth', 'Queue depth.', lambda: len(queue))
+    histogram = registry.histogram('fetch_seconds', 'Fetch time.', ['api'])
+    with pytest.raises(ValueError):
+        with histogram.time(api='news'):
+            raise ValueError
+    queue.append(3)
+    assert 'queue_depth 3' in registry.exposition()
+    assert histogram.count(api='news') == 1
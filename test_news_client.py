@@ -0,0 +1,104 @@
+import json
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+import pytest
+from covid_news_handling import NewsClient
+
+ARTICLES = {'status': 'ok', 'articles': [{'title': 'Booster rollout', 'content': 'text'}]}
+
+class FakeNewsAPI(BaseHTTPRequestHandler):
+    # A local stand-in for the NewsAPI everything endpoint, it
+    # answers 304 when the client already holds the current ETag
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get('If-None-Match')))
+        if self.headers.get('If-None-Match') == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+        body = json.dumps(ARTICLES).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', '"v1"')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+def start_fake_news_api():
+    FakeNewsAPI.requests_seen = []
+    server = HTTPServer(('127.0.0.1', 0), FakeNewsAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, 'http://127.0.0.1:%d/v2/everything' % server.server_port
+
+def test_news_client_ttl_cache():
+    # To ensure identical queries are answered from the cache
+    server, url = start_fake_news_api()
+    client = NewsClient('key', base_url=url, cache_ttl=60)
+    first = client.get('Covid COVID-19')
+    assert client.get('Covid COVID-19') is first
+    assert len(FakeNewsAPI.requests_seen) == 1
+    assert 'q=Covid+OR+COVID-19' in FakeNewsAPI.requests_seen[0][0]
+    server.shutdown()
+
+def test_news_client_conditional_request():
+    # To ensure an expired entry is revalidated with its ETag and
+    # an unchanged result is reused without being parsed again
+    server, url = start_fake_news_api()
+    client = NewsClient('key', base_url=url, cache_ttl=0)
+    first = client.get('Covid')
+    second = client.get('Covid')
+    assert second is first
+    assert [etag for _, etag in FakeNewsAPI.requests_seen] == [None, '"v1"']
+    server.shutdown()
+
+def test_news_client_keeps_validators_after_304():
+    # To ensure a 304 sent without the validators does not wipe the
+    # cached ones, so every later refresh is revalidated too
+    server, url = start_fake_news_api()
+    client = NewsClient('key', base_url=url, cache_ttl=0)
+    first = client.get('Covid')
+    assert client.get('Covid') is first
+    assert client.get('Covid') is first
+    assert [etag for _, etag in FakeNewsAPI.requests_seen] == [None, '"v1"', '"v1"']
+    assert client.revalidated == 2
+    server.shutdown()
+
+def test_async_news_client_conditional_request():
+    # To ensure the asyncio client revalidates an expired entry like
+    # the blocking one, reusing the payload it holds
+    httpx = pytest.importorskip('httpx')
+    from async_upstream import AsyncNewsClient
+    server, url = start_fake_news_api()
+
+    async def scenario():
+        async with httpx.AsyncClient() as http:
+            client = AsyncNewsClient('key', http, base_url=url, cache_ttl=0)
+            first = await client.get('Covid')
+            return first, await client.get('Covid'), client.revalidated
+    first, second, revalidated = asyncio.run(scenario())
+    assert second is first and revalidated == 1
+    assert [etag for _, etag in FakeNewsAPI.requests_seen] == [None, '"v1"']
+    server.shutdown()
+
+def test_async_news_client_keeps_validators_after_304():
+    # To ensure the asyncio client, like the blocking one, keeps the
+    # cached validators when a 304 does not send them again
+    httpx = pytest.importorskip('httpx')
+    from async_upstream import AsyncNewsClient
+    server, url = start_fake_news_api()
+
+    async def scenario():
+        async with httpx.AsyncClient() as http:
+            client = AsyncNewsClient('key', http, base_url=url, cache_ttl=0)
+            first = await client.get('Covid')
+            assert await client.get('Covid') is first
+            assert await client.get('Covid') is first
+            return client.revalidated
+    assert asyncio.run(scenario()) == 2
+    assert [etag for _, etag in FakeNewsAPI.requests_seen] == [None, '"v1"', '"v1"']
+    server.shutdown()
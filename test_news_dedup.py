@@ -0,0 +1,69 @@
+from news_dedup import NewsDeduplicator
+from news_dedup import deduplicate_news
+from news_dedup import jaccard
+from news_dedup import normalise_url
+from news_dedup import minhash_signature
+from news_dedup import shingles
+from covid_news_handling import publish_news
+
+DESCRIPTION = ('Apple has closed one of its stores in Texas after an outbreak '
+               'of COVID-19 among the staff, NBC News reports.')
+ORIGINAL = {'title': 'Texas Apple store closes due to COVID-19 outbreak',
+            'description': DESCRIPTION, 'url': 'https://news.example/apple'}
+SYNDICATED = {'title': 'Apple store in Texas closes due to COVID-19 outbreak',
+              'description': DESCRIPTION, 'url': 'https://other.example/story/1'}
+UNRELATED = {'title': 'Mounting evidence highlights the importance of boosters',
+             'description': 'Health officials urged adults to book their booster shots.',
+             'url': 'https://news.example/boosters'}
+
+def test_normalise_url():
+    # To ensure tracking parameters, fragments and trailing slashes are ignored
+    assert normalise_url('https://news.example/a/?utm_source=x&id=2#top') == \
+        'https://news.example/a?id=2'
+    assert normalise_url('https://news.example/a/') == 'https://news.example/a'
+    assert normalise_url(None) == ''
+
+def test_minhash_signature_similarity():
+    # To ensure identical texts have identical signatures, and short
+    # texts still fill every bin of the signature
+    assert minhash_signature(shingles(ORIGINAL)) == minhash_signature(shingles(dict(ORIGINAL)))
+    assert None not in minhash_signature(shingles({'title': 'Covid'}))
+    assert minhash_signature(shingles({})) is None
+
+def test_deduplicate_news():
+    # To ensure exact url copies and syndicated near duplicates are
+    # dropped, keeping the first article of each story in order
+    copy = dict(ORIGINAL, url='https://news.example/apple/?utm_medium=rss')
+    assert deduplicate_news([ORIGINAL, UNRELATED, copy, SYNDICATED]) == [ORIGINAL, UNRELATED]
+
+def test_deduplicator_clusters():
+    # To ensure the cluster sizes count every article of the story
+    deduplicator = NewsDeduplicator()
+    assert deduplicator.add(ORIGINAL)
+    assert not deduplicator.add(SYNDICATED)
+    assert deduplicator.add(UNRELATED)
+    assert deduplicator.cluster_sizes == [2, 1]
+
+def test_copy_similarity_matches_jaccard():
+    # To ensure an article sharing a kept article's description is
+    # compared as the shingles of the whole texts would be
+    unrelated_title = dict(SYNDICATED, title=UNRELATED['title'])
+    for article in (SYNDICATED, unrelated_title):
+        similarity = NewsDeduplicator._copy_similarity(
+            shingles({'title': article['title']}), shingles({'description': DESCRIPTION}),
+            shingles(ORIGINAL))
+        assert similarity == jaccard(shingles(article), shingles(ORIGINAL))
+
+def test_publish_news_against_published_articles(isolated_store):
+    # To ensure the fetched articles are deduplicated against the ones
+    # published, the new stories published first, and the fetched
+    # payload returned with its own stories only, left unchanged
+    publish_news({'articles': [ORIGINAL]})
+    version = isolated_store.version
+    # The same articles (as new objects, as read back from a shared store)
+    assert publish_news({'articles': [dict(ORIGINAL), SYNDICATED]})['articles'] == [ORIGINAL]
+    assert isolated_store.version == version
+    fetched = {'articles': [SYNDICATED, UNRELATED]}
+    assert publish_news(fetched)['articles'] == [SYNDICATED, UNRELATED]
+    assert isolated_store.snapshot().news_articles == [UNRELATED, ORIGINAL]
+    assert fetched == {'articles': [SYNDICATED, UNRELATED]}
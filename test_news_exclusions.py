@@ -0,0 +1,39 @@
+from news_exclusions import NewsExclusionIndex
+from news_exclusions import article_key
+from covid_news_handling import remove_unwanted_news
+
+ARTICLES = [
+    {'title': 'Texas Apple store closes', 'url': 'https://example.com/a', 'content': 'x'},
+    {'title': 'Boosters  approved', 'url': 'https://example.com/b', 'content': 'y'},
+]
+
+def test_article_key_stable():
+    # To ensure the key only depends on the url and the normalised title
+    refetched = {'title': ' texas apple STORE closes', 'url': 'https://example.com/a',
+                 'content': 'changed'}
+    assert article_key(ARTICLES[0]) == article_key(refetched)
+    assert article_key(ARTICLES[0]) != article_key(ARTICLES[1])
+
+def test_exclusion_index_filter():
+    # To ensure removed articles are filtered out, and the
+    # articles passed in are left unchanged
+    index = NewsExclusionIndex()
+    assert index.exclude(article_key(ARTICLES[0]))
+    assert not index.exclude(article_key(ARTICLES[0]))
+    assert remove_unwanted_news(ARTICLES, index) == [ARTICLES[1]]
+    assert len(ARTICLES) == 2
+
+def test_exclusion_index_by_title():
+    # To ensure the older pages, sending the title, still remove the article
+    index = NewsExclusionIndex()
+    assert index.exclude_title('Boosters approved', ARTICLES)
+    assert ARTICLES[1] in index
+    assert not index.exclude_title('Unknown', ARTICLES)
+
+def test_exclusion_index_persisted(tmp_path):
+    # To ensure the removed articles survive a restart
+    path = str(tmp_path / 'cache.sqlite3')
+    NewsExclusionIndex(path).exclude(article_key(ARTICLES[0]))
+    assert NewsExclusionIndex(path).filter(ARTICLES) == [ARTICLES[1]]
+    # Expired removals are dropped on load
+    assert len(NewsExclusionIndex(path, max_age_days=-1)) == 0
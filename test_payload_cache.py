@@ -0,0 +1,35 @@
+import payload_cache
+from payload_cache import save_payload
+from payload_cache import load_payload
+
+def test_payload_cache_round_trip(tmp_path):
+    # To ensure a saved payload is loaded back unchanged
+    path = str(tmp_path / 'cache.sqlite3')
+    payload = {'data': [{'areaName': 'Exeter', 'newCasesBySpecimenDate': None}]}
+    save_payload('covid:ltla:Exeter', payload, path)
+    assert load_payload('covid:ltla:Exeter', path) == payload
+    assert load_payload('news', path) is None
+
+def test_payload_cache_replaces_payload(tmp_path):
+    # To ensure only the last good payload is kept
+    path = str(tmp_path / 'cache.sqlite3')
+    save_payload('news', {'articles': [1]}, path)
+    save_payload('news', {'articles': [2]}, path)
+    assert load_payload('news', path) == {'articles': [2]}
+
+def test_payload_cache_store_only_when_enabled(tmp_path):
+    # To ensure the handlers do not write a cache file unless
+    # the application has enabled it
+    payload_cache.cache_file = None
+    payload_cache.store('news', {'articles': []})
+    assert payload_cache.load('news') is None
+    payload_cache.enable(str(tmp_path / 'cache.sqlite3'))
+    payload_cache.store('news', {'articles': []})
+    assert payload_cache.load('news') == {'articles': []}
+    payload_cache.cache_file = None
+
+def test_payload_cache_unreadable_file(tmp_path):
+    # To ensure a corrupt cache file does not stop the start up
+    path = tmp_path / 'cache.sqlite3'
+    path.write_bytes(b'not a database')
+    assert load_payload('news', str(path)) is None
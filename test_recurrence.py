@@ -0,0 +1,71 @@
+import sched
+import pytest
+from datetime import datetime
+from recurrence import DailyAt
+from recurrence import Every
+from recurrence import RecurringJob
+from recurrence import RefreshCoalescer
+from time_conversions import seconds_until
+
+def local(*args):
+    return datetime(*args).timestamp()
+
+def test_daily_at_crosses_midnight():
+    # To ensure a time earlier than now fires tomorrow, not early
+    rule = DailyAt.from_hhmm('08:30')
+    assert rule.next_fire(local(2021, 12, 12, 23, 0)) == local(2021, 12, 13, 8, 30)
+    assert rule.next_fire(local(2021, 12, 12, 7, 0)) == local(2021, 12, 12, 8, 30)
+    assert rule.next_fire(local(2021, 12, 12, 8, 30)) == local(2021, 12, 13, 8, 30)
+
+def test_seconds_until_is_never_negative():
+    # To ensure a time that has passed today is counted until tomorrow
+    assert seconds_until('08:00', now=local(2021, 12, 12, 9, 0)) == 23 * 3600
+    assert seconds_until('10:00', now=local(2021, 12, 12, 9, 0)) == 3600
+
+def test_every_skips_missed_runs():
+    # To ensure an interval rule stays aligned to its start
+    rule = Every(60, start=1000)
+    assert rule.next_fire(900) == 1000
+    assert rule.next_fire(1000) == 1060
+    assert rule.next_fire(1250) == 1300
+
+def test_recurring_job_rearms_after_every_run():
+    # To ensure a daily job keeps firing, past the second run
+    clock = [local(2021, 12, 12, 12, 0)]
+    scheduler = sched.scheduler(lambda: clock[0], lambda delay: clock.__setitem__(0, clock[0] + delay))
+    runs = []
+    job = RecurringJob(DailyAt(6, 0), lambda: runs.append(clock[0]), scheduler=scheduler,
+                       coalescer=None).start(now=clock[0])
+    for _ in range(5):
+        delay = scheduler.run(blocking=False)
+        clock[0] += delay
+        scheduler.run(blocking=False)
+    assert runs == [local(2021, 12, day, 6, 0) for day in range(13, 18)]
+    job.cancel()
+    assert scheduler.empty()
+
+def test_coalescer_shares_overlapping_refreshes():
+    # To ensure schedules firing together only fetch once, while the
+    # refreshes of other arguments are not merged into them
+    fetches = []
+    coalescer = RefreshCoalescer(window=60)
+    assert coalescer.run('covid', fetches.append, 1)
+    assert not coalescer.run('covid', fetches.append, 1)
+    assert coalescer.run('covid', fetches.append, 2)
+    assert coalescer.run('news', fetches.append, 1)
+    assert fetches == [1, 2, 1]
+    assert coalescer.skipped == 1
+
+def test_coalescer_retries_a_failed_refresh():
+    # To ensure a failed refresh does not suppress the next one
+    fetches = []
+    def fetch(location):
+        fetches.append(location)
+        if len(fetches) == 1:
+            raise ConnectionError('upstream down')
+    coalescer = RefreshCoalescer(window=60)
+    with pytest.raises(ConnectionError):
+        coalescer.run('covid', fetch, location='Exeter')
+    assert coalescer.run('covid', fetch, location='Exeter')
+    assert not coalescer.run('covid', fetch, location='Exeter')
+    assert fetches == ['Exeter', 'Exeter']
@@ -0,0 +1,65 @@
+from rolling_metrics import RollingSeries
+from rolling_metrics import window_metrics
+from area_series import AreaSeries
+from csv_columns import load_csv_columns
+from csv_columns import calendar_series
+from csv_columns import columns_from_lines
+from covid_data_handler import parse_csv_data
+from covid_data_handler import process_covid_csv_data
+
+def national_cases():
+    # The national new cases by calendar day, latest reported first
+    return calendar_series(load_csv_columns('nation_2021-10-28.csv'), 'newCasesBySpecimenDate')
+
+def test_process_covid_csv_data_pinned():
+    # To ensure the metrics engine keeps today's national figures
+    assert process_covid_csv_data(parse_csv_data('nation_2021-10-28.csv')) == \
+        (240299, 7019, 141544)
+    assert national_cases().window_sum(7) == 240299
+
+def test_window_sums_match_slices():
+    # To ensure every window matches the sum over the same rows
+    cases = national_cases()
+    values = list(load_csv_columns('nation_2021-10-28.csv')['newCasesBySpecimenDate'].values)
+    for days in (7, 14, 28):
+        assert cases.window_sum(days) == sum(values[1:1 + days])
+    assert cases.week_over_week_delta() == sum(values[1:8]) - sum(values[8:15])
+    # A window running past the series is cut short
+    assert cases.window_sum(10000) == sum(values[1:])
+
+def test_rate_per_100k():
+    # To ensure the rate scales the window sum by the population
+    series = RollingSeries([None, 10, 20, 30, 40, 50, 60, 70])
+    assert series.window_sum(7) == 280
+    assert series.rate_per_100k(7, population=200000) == 140.0
+
+def test_window_metrics():
+    # To ensure every window is reported, with the rates only
+    # for a known population
+    series = RollingSeries([None] + [10] * 30)
+    metrics = window_metrics(series, population=200000)
+    assert metrics['sums'] == {'7': 70, '14': 140, '28': 280}
+    assert metrics['week_over_week_delta'] == 0
+    assert metrics['rates_per_100k']['7'] == 35.0
+    assert window_metrics(series)['rates_per_100k'] is None
+
+def test_windows_are_calendar_days_on_every_path():
+    # To ensure the CSV columns, the API rows and the area series count
+    # the same calendar days when days are blank or not reported
+    lines = ['areaName,date,newCasesBySpecimenDate',
+             'X,2021-10-12,',            # latest day, not reported yet
+             'X,2021-10-11,1',           # incomplete, skipped
+             'X,2021-10-10,2',
+             'X,2021-10-09,',            # blank
+             'X,2021-10-06,8',           # 7 and 8 not reported
+             'X,2021-10-04,16',          # the 7th day
+             'X,2021-10-03,32']          # outside the 7 days
+    rows = [{'date': line.split(',')[1],
+             'newCasesBySpecimenDate': int(line.split(',')[2]) if line.split(',')[2] else None}
+            for line in lines[1:]]
+    csv_sum = calendar_series(columns_from_lines(lines), 'newCasesBySpecimenDate').window_sum(7)
+    series = AreaSeries()
+    series.merge(rows)
+    assert csv_sum == RollingSeries.from_rows(rows, 'newCasesBySpecimenDate').window_sum(7) == 26
+    assert series.seven_day_sum == 26
+    assert RollingSeries.from_rows(rows, 'newCasesBySpecimenDate').window_sum(14) == 58
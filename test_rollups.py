@@ -0,0 +1,87 @@
+from rollups import AreaHierarchy
+from rollups import RollupEngine
+from area_store import AreaStore
+
+HIERARCHY = AreaHierarchy({('ltla', 'L1'): ('utla', 'U1'), ('ltla', 'L2'): ('utla', 'U1'),
+                           ('ltla', 'L3'): ('utla', 'U2'), ('utla', 'U1'): ('region', 'R1'),
+                           ('utla', 'U2'): ('region', 'R1'), ('region', 'R1'): ('nation', 'N1')})
+
+def rows(code, cases, date='2021-10-28', area_type='ltla'):
+    return [{'areaCode': code, 'areaType': area_type, 'date': date,
+             'newCasesBySpecimenDate': cases}]
+
+def test_rollups_sum_up_the_hierarchy():
+    # To ensure every ancestor holds the sum of its leaf areas,
+    # and the rows of other levels are not counted again
+    engine = RollupEngine(HIERARCHY, metrics=['newCasesBySpecimenDate'])
+    engine.update_area(rows('L1', 10) + rows('L2', 5) + rows('L3', 1))
+    engine.update_area(rows('U1', 1000, area_type='utla'))
+    assert engine.total('utla', 'U1', '2021-10-28') == {'newCasesBySpecimenDate': 15}
+    assert engine.total('region', 'R1', '2021-10-28') == {'newCasesBySpecimenDate': 16}
+    assert engine.total('nation', 'N1', '2021-10-28') == {'newCasesBySpecimenDate': 16}
+    assert engine.total('nation', 'N1', '2021-10-27') is None
+
+def test_rollups_incremental_revision():
+    # To ensure a revised row only adds its difference, and an
+    # unchanged row is not counted again
+    engine = RollupEngine(HIERARCHY, metrics=['newCasesBySpecimenDate'])
+    engine.update_area(rows('L1', 10) + rows('L2', 5))
+    assert engine.update_area(rows('L1', 12) + rows('L2', 5)) == 1
+    assert engine.total('utla', 'U1', '2021-10-28') == {'newCasesBySpecimenDate': 17}
+    engine.update_area(rows('L1', 3, date='2021-10-27'))
+    series = engine.series('region', 'R1')
+    assert [row['date'] for row in series['data']] == ['2021-10-28', '2021-10-27']
+    assert engine.series('region', 'R9') is None
+
+def test_rollups_hierarchy_set_later(tmp_path):
+    # To ensure the totals are rebuilt when the hierarchy is loaded
+    # after the data, from a lookup file
+    lookup = tmp_path / 'lookup.csv'
+    lookup.write_text('ltlaCode,utlaCode,regionCode,nationCode\nL1,U1,R1,N1\nL2,L2,R1,N1\n')
+    engine = RollupEngine(metrics=['newCasesBySpecimenDate'])
+    engine.update_area(rows('L1', 10) + rows('L2', 5))
+    assert engine.total('nation', 'N1', '2021-10-28') is None
+    engine.set_hierarchy(AreaHierarchy.from_lookup_csv(str(lookup)))
+    assert engine.total('nation', 'N1', '2021-10-28') == {'newCasesBySpecimenDate': 15}
+    assert engine.total('utla', 'L2', '2021-10-28') == {'newCasesBySpecimenDate': 5}
+
+def test_rollups_count_contributing_areas():
+    # To ensure each day counts the local areas summed, so a parent
+    # missing some of them can be told apart, or left out
+    engine = RollupEngine(HIERARCHY, metrics=['newCasesBySpecimenDate'])
+    engine.update_area(rows('L1', 10) + rows('L2', 5) + rows('L1', 4, date='2021-10-27'))
+    engine.update_area(rows('L1', 11))
+    series = engine.series('utla', 'U1')
+    assert series['expectedAreas'] == 2
+    assert [row['contributingAreas'] for row in series['data']] == [2, 1]
+    assert engine.series('nation', 'N1')['expectedAreas'] == 3
+    complete = engine.series('utla', 'U1', complete=True)
+    assert [row['date'] for row in complete['data']] == ['2021-10-28']
+
+def test_rollups_fed_from_the_area_store(tmp_path):
+    # To ensure the local areas ingested from the CSV dumps are summed,
+    # their other levels' rows left out, and only the areas of a later
+    # dump read back from the store
+    dumps = tmp_path / 'dumps'
+    dumps.mkdir()
+    header = 'areaCode,areaName,areaType,date,newCasesBySpecimenDate\n'
+    (dumps / 'ltla.csv').write_text(header + 'L1,One,ltla,2021-10-28,10\n'
+                                    'L2,Two,ltla,2021-10-28,5\nL3,Three,ltla,2021-10-28,1\n')
+    (dumps / 'utla.csv').write_text(header + 'U1,Upper,utla,2021-10-28,1000\n')
+    store = AreaStore(str(tmp_path / 'areas.sqlite3'))
+    store.ingest_directory(str(dumps))
+    engine = RollupEngine(HIERARCHY, metrics=['newCasesBySpecimenDate'])
+    for batch in store.row_batches('ltla'):
+        engine.update_area(batch)
+    assert engine.total('utla', 'U1', '2021-10-28') == {'newCasesBySpecimenDate': 15}
+    assert engine.series('nation', 'N1')['data'][0]['contributingAreas'] == 3
+    # A later dump only hands the rows of its own areas to the rollups
+    (dumps / 'ltla_update.csv').write_text(header + 'L2,Two,ltla,2021-10-28,7\n')
+    changed = set()
+    store.ingest_directory(str(dumps), changed)
+    assert changed == {('ltla', 'L2')}
+    batches = list(store.row_batches('ltla', [code for _, code in changed]))
+    assert [[row['areaCode'] for row in batch] for batch in batches] == [['L2']]
+    for batch in batches:
+        engine.update_area(batch)
+    assert engine.total('utla', 'U1', '2021-10-28') == {'newCasesBySpecimenDate': 17}
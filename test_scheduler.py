@@ -0,0 +1,59 @@
+import time
+import sched
+import threading
+from scheduler import SchedulerWorker
+
+def test_scheduler_worker_runs_due_events():
+    # To ensure scheduled events run in the worker thread rather
+    # than in the thread that scheduled them
+    scheduler = sched.scheduler(time.time, time.sleep)
+    worker = SchedulerWorker(scheduler, idle_interval=5)
+    worker.start()
+    done = threading.Event()
+    ran_in = []
+    def action():
+        ran_in.append(threading.current_thread())
+        done.set()
+    scheduler.enter(0.05, 1, action)
+    worker.wake()
+    assert done.wait(2)
+    assert ran_in == [worker]
+    worker.stop()
+
+def test_scheduler_worker_queue_stats():
+    # To ensure the queue depth and the next fire time are exposed
+    scheduler = sched.scheduler(time.time, time.sleep)
+    worker = SchedulerWorker(scheduler)
+    assert worker.queue_depth() == 0
+    assert worker.next_fire_time() is None
+    event = scheduler.enter(100, 1, print)
+    scheduler.enter(200, 1, print)
+    assert worker.queue_depth() == 2
+    assert worker.next_fire_time() == event.time
+
+def test_scheduler_worker_survives_failed_event():
+    # To ensure a failing update does not stop the later ones
+    scheduler = sched.scheduler(time.time, time.sleep)
+    worker = SchedulerWorker(scheduler, idle_interval=5)
+    done = threading.Event()
+    def failing():
+        raise ValueError('upstream failure')
+    scheduler.enter(0, 1, failing)
+    scheduler.enter(0.01, 2, done.set)
+    worker.start()
+    assert done.wait(2)
+    worker.stop()
+
+def test_start_scheduler_worker_replaces_stopped_worker(monkeypatch):
+    # To ensure a stopped worker is replaced by a running one
+    import scheduler as scheduler_module
+    monkeypatch.setattr(scheduler_module, 'scheduler_worker',
+                        SchedulerWorker(sched.scheduler(time.time, time.sleep)))
+    first = scheduler_module.start_scheduler_worker()
+    assert scheduler_module.start_scheduler_worker() is first
+    first.stop()
+    first.join(2)
+    second = scheduler_module.start_scheduler_worker()
+    assert second is not first and second.is_alive()
+    assert second.scheduler is first.scheduler
+    second.stop()
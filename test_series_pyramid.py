@@ -0,0 +1,69 @@
+import math
+from datetime import date, timedelta
+from series_pyramid import PyramidCache, SeriesPyramid, aggregate, daily_points, lttb
+from series_pyramid import column_points
+from csv_columns import load_csv_columns
+
+def days(count, start=date(2021, 1, 1)):
+    # The ISO dates of `count` consecutive days
+    return [(start + timedelta(days=day)).isoformat() for day in range(count)]
+
+def test_daily_points_from_rows():
+    # To ensure the rows of the API (latest first) give the points
+    # oldest first, without the days missing the metric
+    rows = [{'date': '2021-01-03', 'hospitalCases': 5},
+            {'date': '2021-01-02', 'hospitalCases': None},
+            {'date': '2021-01-01', 'hospitalCases': 3}]
+    assert daily_points(rows, 'hospitalCases') == [('2021-01-01', 3), ('2021-01-03', 5)]
+
+def test_aggregate_weeks_and_months():
+    # To ensure weeks start on Monday, months on the 1st, and each
+    # metric is combined by its own aggregation
+    points = list(zip(days(14, date(2021, 1, 25)), range(1, 15)))
+    weekly = aggregate(points, 'weekly', 'sum')
+    assert weekly == [('2021-01-25', 28), ('2021-02-01', 77)]
+    monthly = aggregate(points, 'monthly', 'mean')
+    assert monthly == [('2021-01-01', 4.0), ('2021-02-01', 11.0)]
+    assert aggregate(points, 'monthly', 'last') == [('2021-01-01', 7), ('2021-02-01', 14)]
+
+def test_lttb_keeps_ends_and_peaks():
+    # To ensure the downsampled view has the requested size, keeps
+    # the first and last points and the spike of the series
+    values = [math.sin(day / 20) * 100 for day in range(1000)]
+    values[500] = 1000
+    points = list(zip(days(1000), values))
+    view = lttb(points, 100)
+    assert len(view) == 100
+    assert view[0] == points[0] and view[-1] == points[-1]
+    assert points[500] in view
+    assert [day for day, _ in view] == sorted(day for day, _ in view)
+    # Shorter series are returned whole
+    assert lttb(points[:50], 100) == points[:50]
+
+def test_pyramid_cache_per_version():
+    # To ensure the pyramid is built once per version, and the
+    # views of its levels are cached
+    builds = []
+
+    def build():
+        builds.append(1)
+        return list(zip(days(800), range(800)))
+    cache = PyramidCache()
+    pyramid = cache.get('Exeter', 1, build, 'sum')
+    assert cache.get('Exeter', 1, build, 'sum') is pyramid and len(builds) == 1
+    assert len(pyramid.levels['daily']) == 800 and len(pyramid.levels['weekly']) == 115
+    assert pyramid.view('daily', 300) is pyramid.view('daily', 300)
+    assert len(pyramid.view('monthly', 300)) == len(pyramid.levels['monthly'])
+    cache.get('Exeter', 2, build, 'sum')
+    assert len(builds) == 2
+    assert cache.get('Nowhere', 1, list, 'sum') is None
+
+def test_column_points_national_csv():
+    # To ensure the national CSV gives one point per day holding the
+    # metric, whose weekly sums match the daily total
+    columns = load_csv_columns('nation_2021-10-28.csv')
+    points = column_points(columns, 'newCasesBySpecimenDate')
+    assert points[-1][0] == '2021-10-27' and points[0][0] < points[-1][0]
+    pyramid = SeriesPyramid(points, 'sum')
+    assert sum(value for _, value in pyramid.levels['weekly']) == sum(v for _, v in points)
+    assert column_points(columns, 'unknownMetric') == []
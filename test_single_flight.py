@@ -0,0 +1,79 @@
+import time
+import threading
+from single_flight import SingleFlight
+from covid_data_handler import covid_API_request
+
+def test_concurrent_callers_share_one_fetch():
+    # To ensure callers arriving while a fetch is in flight wait
+    # for it instead of fetching again
+    flights = SingleFlight(freshness=0)
+    fetches = []
+    def fetch():
+        fetches.append(1)
+        time.sleep(0.1)
+        return {'data': []}
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(flights.do('covid', fetch)))
+               for _ in range(10)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(fetches) == 1
+    assert all(result is results[0] for result in results)
+    assert flights.stats()['saved'] == 9
+
+def test_fresh_result_is_reused():
+    # To ensure a trigger within the freshness window reuses the result
+    flights = SingleFlight(freshness=60)
+    assert flights.do('news', lambda: 1) == 1
+    assert flights.do('news', lambda: 2) == 1
+    assert flights.do('other', lambda: 3) == 3
+    flights.forget('news')
+    assert flights.do('news', lambda: 4) == 4
+    assert flights.stats() == {'calls': 4, 'fetches': 3, 'shared': 0, 'reused': 1, 'saved': 1}
+
+def test_expired_results_are_pruned(monkeypatch):
+    # To ensure the results older than the freshness window are dropped,
+    # so distinct keys do not pile up between triggers
+    clock = [100.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: clock[0])
+    flights = SingleFlight(freshness=5)
+    for key in range(10):
+        flights.do(key, lambda: key)
+    clock[0] += 6
+    assert flights.do('news', lambda: 'fresh') == 'fresh'
+    assert list(flights._fresh) == ['news']
+    clock[0] += 6
+    assert flights.do(0, lambda: 'again') == 'again'
+    assert list(flights._fresh) == [0]
+
+def test_failure_is_shared_and_not_cached():
+    # To ensure a failed fetch is raised to every waiting caller,
+    # and the next trigger fetches again
+    flights = SingleFlight(freshness=60)
+    def failing():
+        raise ConnectionError('upstream failure')
+    for _ in range(2):
+        try:
+            flights.do('covid', failing)
+            assert False
+        except ConnectionError:
+            pass
+    assert flights.stats()['fetches'] == 2
+
+def test_covid_API_request_single_flight(isolated_store):
+    # To ensure simultaneous covid requests only reach the API once
+    calls = []
+    def client(filters, structure):
+        calls.append(filters)
+        time.sleep(0.1)
+        return {'data': [{'areaName': 'Flightshire', 'date': '2021-10-28'}]}
+    threads = [threading.Thread(target=covid_API_request,
+                                kwargs={'location': 'Flightshire', 'client': client})
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
@@ -0,0 +1,42 @@
+import os
+import sys
+import json
+import subprocess
+from startup import StartupProfile
+
+def test_startup_profile_phases():
+    # To ensure the phases are timed from the start of the import,
+    # and reported in the order they started
+    profile = StartupProfile(started=10.0)
+    profile.record('config', 10.5, 10.75)
+    with profile.phase('flask app'):
+        pass
+    profile.record('import main', 10.0, 10.5)
+    seconds = profile.seconds()
+    assert seconds['config'] == 0.25 and seconds['import main'] == 0.5
+    assert profile.phases[0].started == 0.5 and profile.phases[0].thread == 'MainThread'
+    lines = profile.report().splitlines()
+    assert lines[1].startswith('import main') and lines[2].startswith('config')
+    assert len(lines) == 4
+
+def test_import_main_is_lazy(tmp_path):
+    # To ensure importing main loads neither Flask nor the upstream
+    # clients, and reads no file, until the application is used
+    probe = ('import sys, json, main; print(json.dumps([name for name in '
+             '("flask", "requests", "uk_covid19") if name in sys.modules]))')
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', probe], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, check=True, timeout=60)
+    assert json.loads(output.stdout) == []
+    assert os.listdir(tmp_path) == []
+
+def test_metrics_do_not_load_the_news_client(tmp_path):
+    # To ensure rendering the metrics counts the news client as zero
+    # while it is not loaded, rather than importing it (and requests)
+    probe = ('import sys, json, main, metrics; text = metrics.registry.exposition(); '
+             'print(json.dumps([[name for name in ("covid_news_handling", "requests") '
+             'if name in sys.modules], \'cache="news_client"} 0\' in text]))')
+    env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run([sys.executable, '-c', probe], cwd=tmp_path, env=env,
+                            capture_output=True, text=True, check=True, timeout=60)
+    assert json.loads(output.stdout) == [[], True]
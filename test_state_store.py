@@ -0,0 +1,61 @@
+import threading
+import pytest
+from state_store import StateStore
+from state_store import SqliteStateBackend
+
+def test_state_store_snapshot_immutable():
+    # To ensure a snapshot can not be changed, and keeps its values
+    # once a newer one is published
+    store = StateStore(news_articles=[])
+    snapshot = store.snapshot()
+    with pytest.raises(AttributeError):
+        snapshot.news_articles = [1]
+    store.publish(news_articles=[{'title': 'a'}])
+    assert snapshot.news_articles == []
+    assert store.snapshot().news_articles == [{'title': 'a'}]
+
+def test_state_store_versions():
+    # To ensure every publish bumps the version, and empty
+    # changes do not
+    store = StateStore(area_data={})
+    assert store.version == 0
+    store.publish(area_data={'a': 1})
+    store.transact(lambda snapshot: {})
+    assert store.version == 1
+
+def test_state_store_transact_concurrent():
+    # To ensure read-modify-write updates are not lost
+    # when published from several threads
+    store = StateStore(area_data={})
+
+    def add(key):
+        store.transact(lambda snapshot: {'area_data': {**snapshot.area_data, key: key}})
+    threads = [threading.Thread(target=add, args=(key,)) for key in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(store.snapshot().area_data) == 20
+    assert store.version == 20
+
+def test_state_store_shared_backend(tmp_path):
+    # To ensure the values published by one process are seen by another
+    # using the same state file, and only the shared keys are written
+    path = str(tmp_path / 'state.sqlite3')
+    first = StateStore(SqliteStateBackend(path, ['news_articles']), poll_interval=0,
+                       news_articles=[], area_series={})
+    second = StateStore(SqliteStateBackend(path, ['news_articles']), poll_interval=0,
+                        news_articles=[], area_series={})
+    first.publish(news_articles=[{'title': 'a'}], area_series={'local': object()})
+    assert second.snapshot().news_articles == [{'title': 'a'}]
+    assert second.snapshot().area_series == {}
+
+def test_state_store_claim(tmp_path):
+    # To ensure a task is run by only one of the processes sharing the file
+    path = str(tmp_path / 'state.sqlite3')
+    first = StateStore(SqliteStateBackend(path, []))
+    second = StateStore(SqliteStateBackend(path, []))
+    assert first.claim('news', 60)
+    assert not second.claim('news', 60)
+    assert second.claim('covid', 60)
+    assert StateStore().claim('news', 60)
@@ -0,0 +1,55 @@
+import time
+import sched
+from update_registry import UpdateRegistry
+from recurrence import Every, RecurringJob
+
+def make_registry():
+    scheduler = sched.scheduler(time.time, time.sleep)
+    return scheduler, UpdateRegistry(scheduler)
+
+def test_cancel_cancels_all_linked_events():
+    # To ensure the repeat of an update is cancelled with it
+    scheduler, registry = make_registry()
+    events = [scheduler.enter(10, 1, print), scheduler.enter(86410, 1, print)]
+    update = registry.add('daily', 'Covid data', time.time() + 10, events)
+    assert registry.cancel(update.update_id) == update
+    assert scheduler.empty()
+    assert len(registry) == 0
+    assert registry.cancel(update.update_id) is None
+
+def test_duplicate_titles_have_unique_ids():
+    # To ensure updates sharing a title can be told apart
+    scheduler, registry = make_registry()
+    first, second = registry.add_many([
+        ('same', 'Covid data', 10, [scheduler.enter(10, 1, print)]),
+        ('same', 'News', 20, [scheduler.enter(20, 1, print)])])
+    assert first.update_id != second.update_id
+    assert registry.by_title('same') == [first, second]
+    registry.cancel(first.update_id)
+    assert registry.by_title('same') == [second]
+    assert registry.cancel_title('same') == [second]
+    assert scheduler.empty()
+
+def test_next_fire_time_follows_recurring_jobs():
+    # To ensure a recurring update shows the fire time of its armed
+    # event, which moves on after every run, and a one-off its own
+    scheduler, registry = make_registry()
+    start = time.time() + 1000
+    job = RecurringJob(Every(60, start=start), print, scheduler=scheduler,
+                       coalescer=None).start()
+    recurring = registry.add('daily', '', start, [job])
+    once = registry.add('once', '', start, [scheduler.enterabs(start, 1, print)])
+    assert recurring.next_fire_time == start and once.next_fire_time == start
+    # The armed event runs, and arms the next one
+    job._run()
+    assert recurring.next_fire_time == start + 60
+    registry.cancel(recurring.update_id)
+    assert recurring.next_fire_time == start
+
+def test_already_executed_event_is_removed():
+    # To ensure an update whose event already ran is still removed
+    scheduler, registry = make_registry()
+    event = scheduler.enter(0, 1, lambda: None)
+    scheduler.run()
+    update = registry.add('done', '', 0, [event])
+    assert registry.cancel(update.update_id) == update
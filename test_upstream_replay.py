@@ -0,0 +1,106 @@
+import json
+import pytest
+import requests
+from upstream_replay import ReplayServer, load_recordings, recording_name
+from covid_data_handler import CovidClient, CovidPages, covid_API_request
+from covid_data_handler import COVID_API_STRUCTURE
+from covid_news_handling import NewsClient
+
+RECORDINGS = {
+    'news': {'status': 'ok', 'articles': [{'title': 'Booster rollout', 'url': 'https://a/1'}]},
+    'covid': {'data': [{'areaCode': 'E07000041', 'areaName': 'Exeter', 'areaType': 'ltla',
+                        'date': '2021-10-%02d' % day, 'newCasesBySpecimenDate': day}
+                       for day in range(28, 20, -1)]}}
+
+def test_replay_news_with_revalidation():
+    # To ensure the recorded news are replayed, and revalidated
+    # with their ETag once the client's cache expires
+    with ReplayServer(RECORDINGS) as replay:
+        client = NewsClient('key', base_url=replay.news_url, cache_ttl=0)
+        first = client.get('Covid')
+        assert first == RECORDINGS['news']
+        assert client.get('Covid') is first
+        assert replay.requests('news', 200) == 1 and replay.requests('news', 304) == 1
+
+def test_covid_pages():
+    # To ensure the pages are requested in turn, and run out with a 204
+    class Page:
+        headers = {'last-modified': 'Thu, 28 Oct 2021 15:00:00 GMT'}
+
+        def raise_for_status(self):
+            pass
+
+        def json(self):
+            return {'data': [{'date': '2021-10-28'}]}
+    pages = CovidPages(['areaType=ltla', 'areaName=Exeter'], {'date': 'date'})
+    assert pages.params() == {'filters': 'areaType=ltla;areaName=Exeter', 'format': 'json',
+                              'structure': '{"date":"date"}', 'page': 1}
+    assert pages.add(200, Page()) and pages.params()['page'] == 2
+    assert not pages.add(204, None)
+    assert pages.result() == {'data': [{'date': '2021-10-28'}], 'length': 1, 'totalPages': 1,
+                              'lastUpdate': 'Thu, 28 Oct 2021 15:00:00 GMT'}
+
+def test_replay_covid_request(isolated_store):
+    # To ensure covid_API_request runs offline through a CovidClient,
+    # and areas without a recording get the default one renamed
+    with ReplayServer(RECORDINGS) as replay:
+        client = CovidClient(replay.covid_url)
+        data = covid_API_request('Exeter', 'ltla', client=client)
+        assert data['length'] == 8 and data['totalPages'] == 1
+        assert isolated_store.snapshot().local_data_from_api is data
+        other = client(['areaType=ltla', 'areaName=Leeds'], COVID_API_STRUCTURE)
+        assert {row['areaName'] for row in other['data']} == {'Leeds'}
+        # One date at a time, as requested by the incremental updates
+        day = client(['areaType=ltla', 'areaName=Exeter', 'date=2021-10-27'], COVID_API_STRUCTURE)
+        assert [row['date'] for row in day['data']] == ['2021-10-27']
+        assert client(['areaType=ltla', 'areaName=Exeter', 'date=2021-11-01'], {})['length'] == 0
+
+def test_replay_faults():
+    # To ensure the replay server throttles (429) and fails (500)
+    # requests as configured, and counts them
+    with ReplayServer(RECORDINGS, throttle_rate=1) as replay:
+        with pytest.raises(requests.HTTPError) as error:
+            CovidClient(replay.covid_url)(['areaType=ltla', 'areaName=Exeter'], {})
+        assert error.value.response.status_code == 429
+        assert error.value.response.headers['Retry-After'] == '1'
+    with ReplayServer(RECORDINGS, failure_rate=1) as replay:
+        with pytest.raises(requests.HTTPError):
+            NewsClient('key', base_url=replay.news_url).get('Covid')
+        assert replay.requests('news', 500) == 1
+    with ReplayServer(RECORDINGS, requests_per_second=2) as replay:
+        session = requests.Session()
+        statuses = [session.get(replay.news_url).status_code for _ in range(3)]
+        assert statuses == [200, 200, 429]
+
+def test_replay_seeded_faults():
+    # To ensure the same seed draws the same faults
+    def statuses(seed):
+        with ReplayServer(RECORDINGS, throttle_rate=0.3, failure_rate=0.3, seed=seed) as replay:
+            session = requests.Session()
+            return [session.get(replay.news_url).status_code for _ in range(20)]
+    first = statuses(7)
+    assert first == statuses(7)
+    assert {200, 429, 500} <= set(first)
+
+def test_replay_faults_drawn_per_request():
+    # To ensure the faults of a path do not depend on the requests of
+    # the other paths, so concurrent clients draw them in any order
+    def statuses(paths):
+        with ReplayServer(RECORDINGS, throttle_rate=0.3, failure_rate=0.3, seed=7) as replay:
+            return [replay.draw_fault(path) for path in paths]
+    news, covid = ['/v2/everything?q=Covid'] * 10, ['/v1/data?page=1'] * 10
+    drawn = statuses(news + covid)
+    assert statuses(covid + news) == drawn[10:] + drawn[:10]
+    assert drawn[:10] != drawn[10:]
+
+def test_load_recordings(tmp_path):
+    # To ensure the recordings of a directory are keyed by file name
+    (tmp_path / 'news.json').write_text(json.dumps(RECORDINGS['news']))
+    (tmp_path / recording_name('Exeter', 'ltla')).write_text(json.dumps(RECORDINGS['covid']))
+    recordings = load_recordings(str(tmp_path))
+    assert sorted(recordings) == ['covid-ltla-Exeter', 'news']
+    with ReplayServer(recordings) as replay:
+        client = CovidClient(replay.covid_url)
+        assert client(['areaType=ltla', 'areaName=Exeter'], {})['length'] == 8
+        with pytest.raises(requests.HTTPError):
+            client(['areaType=ltla', 'areaName=Leeds'], {})
@@ -2,6 +2,10 @@
 This python file contains helper functions to convert the time to seconds.
 """
 
+import time
+from datetime import datetime, timedelta
+from datetime import time as dt_time
+
 
 def minutes_to_seconds(minutes: str) -> int:
     """Converts minutes to seconds"""
@@ -20,3 +24,25 @@ def hhmm_to_seconds(hhmm: str) -> int:
         return None
     return minutes_to_seconds(hours_to_minutes(hhmm.split(':')[0])) + \
         minutes_to_seconds(hhmm.split(':')[1])
+
+
+def next_time_of_day(hour: int, minute: int, after: float) -> float:
+    """
+    Returns the (epoch) time of the next HH:MM strictly after the given
+    time, which is tomorrow when HH:MM has already passed today.
+    """
+    moment = datetime.fromtimestamp(after)
+    candidate = datetime.combine(moment.date(), dt_time(hour, minute))
+    if candidate.timestamp() <= after:
+        candidate = datetime.combine(moment.date() + timedelta(days=1), dt_time(hour, minute))
+    return candidate.timestamp()
+
+
+def seconds_until(hhmm: str, now: float = None) -> int:
+    """Converts HH:MM to the seconds until its next occurrence"""
+    if len(hhmm.split(':')) != 2:
+        print('Incorrect format. Argument must be formatted as HH:MM')
+        return None
+    now = time.time() if now is None else now
+    hours, minutes = hhmm.split(':')
+    return round(next_time_of_day(int(hours), int(minutes), now) - now)
@@ -0,0 +1,124 @@
+"""
+This python file contains the registry of the scheduled updates
+shown on the dashboard. Every update has a unique id and may hold
+several linked scheduler events (such as a repeat), which are all
+cancelled together. The updates are indexed by id and by title, so
+that none of the operations scans the whole registry.
+"""
+
+import logging
+import itertools
+import threading
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+from scheduler import sched_instance
+from recurrence import RecurringJob
+
+
+@dataclass(frozen=True)
+class Update:
+    """
+    A scheduled update and the scheduler events (or recurring jobs)
+    it is made of.
+    """
+    update_id: int
+    title: str
+    content: str
+    fire_time: float
+    handles: tuple
+
+    @property
+    def next_fire_time(self) -> float:
+        """
+        The time the update fires next: the armed event of its recurring
+        jobs, which moves on after every run, or else its fire time.
+        """
+        times = [handle.next_fire_time for handle in self.handles
+                 if isinstance(handle, RecurringJob) and handle.next_fire_time is not None]
+        return min(times) if times else self.fire_time
+
+
+class UpdateRegistry:
+    """
+    This class holds the scheduled updates in insertion order, with a
+    dict index by id and a dict of ids by title.
+    """
+
+    def __init__(self, scheduler=sched_instance) -> None:
+        self.scheduler = scheduler
+        self._by_id: dict[int, Update] = {}
+        self._by_title: dict[str, dict[int, None]] = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._by_id)
+
+    def __iter__(self) -> Iterator[Update]:
+        return iter(list(self._by_id.values()))
+
+    def add(self, title: str, content: str, fire_time: float,
+            handles: Iterable = ()) -> Update:
+        """Registers an update made of the given scheduler events."""
+        with self._lock:
+            return self._add(title, content, fire_time, handles)
+
+    def add_many(self, updates: Iterable[tuple]) -> list[Update]:
+        """Registers many (title, content, fire_time, handles) updates at once."""
+        with self._lock:
+            return [self._add(*update) for update in updates]
+
+    def get(self, update_id: int) -> Optional[Update]:
+        """Returns the update with the given id, None if there is none."""
+        return self._by_id.get(update_id)
+
+    def by_title(self, title: str) -> list[Update]:
+        """Returns the updates with the given title, in insertion order."""
+        return [self._by_id[update_id] for update_id in self._by_title.get(title, ())]
+
+    def cancel(self, update_id: int) -> Optional[Update]:
+        """
+        Cancels every scheduler event of the update and removes it,
+        returns the removed update (None if the id is unknown).
+        """
+        with self._lock:
+            return self._cancel(update_id)
+
+    def cancel_many(self, update_ids: Iterable[int]) -> list[Update]:
+        """Cancels the given updates, returns the ones that were removed."""
+        with self._lock:
+            cancelled = [self._cancel(update_id) for update_id in update_ids]
+        return [update for update in cancelled if update is not None]
+
+    def cancel_title(self, title: str) -> list[Update]:
+        """Cancels every update with the given title."""
+        return self.cancel_many(list(self._by_title.get(title, ())))
+
+    def _add(self, title: str, content: str, fire_time: float, handles: Iterable) -> Update:
+        update = Update(next(self._ids), title, content, fire_time, tuple(handles))
+        self._by_id[update.update_id] = update
+        self._by_title.setdefault(title, {})[update.update_id] = None
+        return update
+
+    def _cancel(self, update_id: int) -> Optional[Update]:
+        update = self._by_id.pop(update_id, None)
+        if update is None:
+            return None
+        titled = self._by_title[update.title]
+        del titled[update_id]
+        if not titled:
+            del self._by_title[update.title]
+        for handle in update.handles:
+            # Recurring jobs cancel their own armed event.
+            if isinstance(handle, RecurringJob):
+                handle.cancel()
+                continue
+            # Cancel the scheduled element and remove it from the queue.
+            try:
+                self.scheduler.cancel(handle)
+            # If the element is not in the queue anymore, (if it is already
+            # executed), proceed with removing the remaining ones.
+            except ValueError:
+                logging.warning('The event_handler could not be found, '
+                                'might already be executed')
+        return update
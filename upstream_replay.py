@@ -0,0 +1,290 @@
+"""
+This python file contains the record/replay harness of the upstream
+APIs. The responses of the Covid and News APIs are recorded into a
+directory of JSON files, which a local fake server then replays in
+place of the APIs, with a configurable latency, share of throttled
+(HTTP 429) and failed (HTTP 500) requests. Pointing the dashboard at
+it (the "covid_api_url" and "news_api_url" keys of the config.json,
+or a CovidClient/NewsClient passed to the request functions) lets the
+refresh and scheduling paths be tested and load tested offline.
+
+    python upstream_replay.py record [--directory recordings] [--area ltla:Exeter ...]
+    python upstream_replay.py serve [--directory recordings] [--port 8001]
+        [--latency 0.2] [--jitter 0.1] [--throttle-rate 0.05] [--failure-rate 0.02]
+        [--requests-per-second 20] [--seed 1]
+"""
+
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional
+from urllib.parse import parse_qs, urlsplit
+
+RECORDINGS_DIRECTORY = 'recordings'
+NEWS_PATH = '/v2/everything'
+COVID_PATH = '/v1/data'
+
+
+def recording_name(location: str, location_type: str) -> str:
+    """Returns the file name the area's covid data is recorded under."""
+    return 'covid-%s-%s.json' % (location_type, location.replace('/', '_'))
+
+
+def load_recordings(directory: str) -> dict:
+    """
+    This function loads the recorded payloads of the directory: news.json,
+    covid.json (the default area) and the covid-<type>-<name>.json files
+    of other areas, keyed by their file name without the extension.
+    """
+    recordings = {}
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.json'):
+            with open(os.path.join(directory, name), encoding='utf-8') as file:
+                recordings[name[:-len('.json')]] = json.load(file)
+    return recordings
+
+
+def record(directory: str, areas: list[tuple[str, str]],
+           covid_terms: str = 'Covid COVID-19 coronavirus') -> list[str]:
+    """
+    This function records the responses of the actual APIs for the areas
+    (the first one also as covid.json) and the news search terms, and
+    returns the files written.
+    """
+    # The clients of the actual APIs are only needed to record.
+    from config_loader import load_config
+    from covid_data_handler import COVID_API_STRUCTURE, cov19_client
+    from covid_news_handling import NewsClient
+    os.makedirs(directory, exist_ok=True)
+    payloads = {'news.json': NewsClient(load_config()['news_api_key']).get(covid_terms)}
+    for position, (location, location_type) in enumerate(areas):
+        data = cov19_client(['areaType='+location_type, 'areaName='+location],
+                            COVID_API_STRUCTURE)
+        payloads[recording_name(location, location_type)] = data
+        if position == 0:
+            payloads['covid.json'] = data
+    for name, payload in payloads.items():
+        with open(os.path.join(directory, name), 'w', encoding='utf-8') as file:
+            json.dump(payload, file)
+    return sorted(payloads)
+
+
+class ReplayServer:
+    """
+    This class replays the recorded payloads on a local port, shaped like
+    the NewsAPI everything endpoint (with ETag revalidation) and the
+    Covid API data endpoint (with its filters and pages). An area without
+    its own recording is answered with the default one (covid.json),
+    renamed. Before answering, every request waits `latency` seconds
+    (plus up to `jitter`), and is then throttled with a 429 (beyond
+    `requests_per_second`, or at random with `throttle_rate`) or failed
+    with a 500 (at random with `failure_rate`). The random draws are
+    seeded, and drawn per request (from the seed, the path and how many
+    times the path was requested), so a run can be reproduced whatever
+    order the concurrent requests arrive in.
+    """
+
+    def __init__(self, recordings: dict, host: str = '127.0.0.1', port: int = 0,
+                 latency: float = 0, jitter: float = 0, throttle_rate: float = 0,
+                 failure_rate: float = 0, requests_per_second: Optional[float] = None,
+                 seed: Optional[int] = None) -> None:
+        self.recordings = recordings
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.failure_rate = failure_rate
+        self.requests_per_second = requests_per_second
+        self.seed = seed if seed is not None else random.getrandbits(64)
+        # The requests drawn for, per path (with its query)
+        self._draws: Counter = Counter()
+        self._lock = threading.Lock()
+        # The start of the current second, and the requests let through in it
+        self._window = (0.0, 0)
+        # Requests answered, per (endpoint, status)
+        self.stats: Counter = Counter()
+        news = recordings.get('news')
+        self._news_body = json.dumps(news).encode('utf-8') if news is not None else None
+        self._news_etag = '"%s"' % hashlib.sha1(self._news_body or b'').hexdigest()
+        self._last_modified = formatdate(usegmt=True)
+        replay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                parts = urlsplit(self.path)
+                if parts.path == NEWS_PATH:
+                    endpoint = 'news'
+                elif parts.path == COVID_PATH:
+                    endpoint = 'covid'
+                else:
+                    self.answer('other', 404)
+                    return
+                status = replay.draw_fault(self.path)
+                if status:
+                    self.answer(endpoint, status, headers={'Retry-After': '1'}
+                                if status == 429 else {})
+                elif endpoint == 'news':
+                    replay.answer_news(self)
+                else:
+                    replay.answer_covid(self, parse_qs(parts.query))
+
+            def answer(self, endpoint: str, status: int, body: bytes = b'',
+                       headers: Optional[dict] = None) -> None:
+                with replay._lock:
+                    replay.stats[(endpoint, status)] += 1
+                self.send_response(status)
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                if status not in (204, 304):
+                    self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if body:
+                    self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.url = 'http://%s:%d' % (host, self.server.server_port)
+        self.news_url = self.url + NEWS_PATH
+        self.covid_url = self.url + COVID_PATH
+
+    @classmethod
+    def from_directory(cls, directory: str = RECORDINGS_DIRECTORY, **options) -> 'ReplayServer':
+        """Creates the server replaying the recordings of the directory."""
+        return cls(load_recordings(directory), **options)
+
+    def __enter__(self) -> 'ReplayServer':
+        threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.1},
+                         daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    def requests(self, endpoint: Optional[str] = None, status: Optional[int] = None) -> int:
+        """Returns the requests answered, optionally of one endpoint and/or status."""
+        with self._lock:
+            return sum(count for (name, code), count in self.stats.items()
+                       if endpoint in (None, name) and status in (None, code))
+
+    def draw_fault(self, path: str) -> Optional[int]:
+        """
+        This method waits the latency, and returns the status of a fault
+        to answer the request of the path, if any.
+        """
+        with self._lock:
+            self._draws[path] += 1
+            requested = self._draws[path]
+        # The request's own generator, not one shared in arrival order
+        digest = hashlib.sha256(('%d:%s:%d' % (self.seed, path, requested)).encode('utf-8')).digest()
+        draws = random.Random(int.from_bytes(digest[:8], 'big'))
+        delay = self.latency + draws.uniform(0, self.jitter)
+        throttled = draws.random() < self.throttle_rate
+        failed = draws.random() < self.failure_rate
+        if delay:
+            time.sleep(delay)
+        if self.requests_per_second:
+            with self._lock:
+                now = time.monotonic()
+                start, count = self._window
+                if now - start >= 1:
+                    start, count = now, 0
+                self._window = (start, count + 1)
+                throttled = throttled or count >= self.requests_per_second
+        if throttled:
+            return 429
+        if failed:
+            return 500
+        return None
+
+    def answer_news(self, handler) -> None:
+        """Answers a news request, a 304 when the client holds the recording's ETag."""
+        if self._news_body is None:
+            handler.answer('news', 404)
+        elif handler.headers.get('If-None-Match') == self._news_etag:
+            handler.answer('news', 304, headers={'ETag': self._news_etag})
+        else:
+            handler.answer('news', 200, self._news_body,
+                           {'Content-Type': 'application/json', 'ETag': self._news_etag})
+
+    def answer_covid(self, handler, query: dict) -> None:
+        """
+        Answers a covid data request: the first page holds every row of
+        the area (of the day, with a date filter), the next one is empty.
+        """
+        filters = dict(part.split('=', 1) for part in query.get('filters', [''])[0].split(';')
+                       if '=' in part)
+        rows = self.area_rows(filters.get('areaName', ''), filters.get('areaType', ''))
+        if rows is None:
+            handler.answer('covid', 404, b'{"response": "Not Found"}')
+            return
+        if 'date' in filters:
+            rows = [row for row in rows if row.get('date') == filters['date']]
+        if not rows or int(query.get('page', ['1'])[0]) > 1:
+            handler.answer('covid', 204)
+            return
+        body = json.dumps({'length': len(rows), 'maxPageLimit': 2500, 'totalRecords': len(rows),
+                           'data': rows}).encode('utf-8')
+        handler.answer('covid', 200, body, {'Content-Type': 'application/json',
+                                            'Last-Modified': self._last_modified})
+
+    def area_rows(self, location: str, location_type: str) -> Optional[list]:
+        """Returns the recorded rows of the area, or the default ones renamed."""
+        recording = self.recordings.get(recording_name(location, location_type)[:-len('.json')])
+        if recording is not None:
+            return recording['data']
+        default = self.recordings.get('covid')
+        if default is None:
+            return None
+        return [{**row, 'areaName': location, 'areaType': location_type}
+                for row in default['data']]
+
+
+def main() -> None:
+    """Parses the arguments, and records the APIs or serves the recordings."""
+    parser = argparse.ArgumentParser(description='Records or replays the upstream APIs.')
+    parser.add_argument('command', choices=('record', 'serve'))
+    parser.add_argument('--directory', default=RECORDINGS_DIRECTORY)
+    parser.add_argument('--area', action='append', default=[],
+                        help='an area recorded, as type:name (ltla:Exeter by default)')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8001)
+    parser.add_argument('--latency', type=float, default=0)
+    parser.add_argument('--jitter', type=float, default=0)
+    parser.add_argument('--throttle-rate', type=float, default=0)
+    parser.add_argument('--failure-rate', type=float, default=0)
+    parser.add_argument('--requests-per-second', type=float)
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    if args.command == 'record':
+        areas = [tuple(reversed(area.split(':', 1))) for area in args.area or ['ltla:Exeter']]
+        for name in record(args.directory, areas):
+            print('Recorded', os.path.join(args.directory, name))
+        return
+    with ReplayServer.from_directory(
+            args.directory, host=args.host, port=args.port, latency=args.latency,
+            jitter=args.jitter, throttle_rate=args.throttle_rate,
+            failure_rate=args.failure_rate, requests_per_second=args.requests_per_second,
+            seed=args.seed) as replay:
+        print('Replaying %s: "news_api_url": "%s", "covid_api_url": "%s"' % (
+            args.directory, replay.news_url, replay.covid_url))
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()